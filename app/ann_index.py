@@ -0,0 +1,149 @@
+import logging
+import math
+import os
+import time
+
+import numpy as np
+
+# "auto" = exact flat index for small corpora, trained IVF-SQ8 above ANN_THRESHOLD vectors
+INDEX_TYPE = os.getenv("DOCQA_INDEX_TYPE", "auto")
+INDEX_TYPES = ["flat", "hnsw", "ivf_flat", "ivf_sq8", "ivf_pq", "opq_ivf_pq"]
+AUTO_LARGE_INDEX_TYPE = "ivf_sq8"
+ANN_THRESHOLD = int(os.getenv("DOCQA_ANN_THRESHOLD", "50000"))
+
+DEFAULT_NPROBE = int(os.getenv("DOCQA_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("DOCQA_EF_SEARCH", "64"))
+HNSW_M = 32
+# FAISS wants at least ~39 training points per centroid
+MIN_POINTS_PER_LIST = 39
+MAX_TRAINING_POINTS_PER_LIST = 256
+# 8-bit PQ codebooks have 256 centroids each, so PQ (and OPQ) training needs at least that many points
+PQ_BITS = 8
+MIN_PQ_TRAINING_POINTS = 1 << PQ_BITS
+
+logger = logging.getLogger(__name__)
+
+
+# Fewest vectors an index type can be trained on (IVF lists shrink with the corpus, see _nlist)
+def min_training_points(index_type):
+    return MIN_PQ_TRAINING_POINTS if index_type in ("ivf_pq", "opq_ivf_pq") else 1
+
+
+# A configured type the corpus is too small to train (e.g. ivf_pq for one PDF) falls back to flat
+def choose_index_type(num_vectors, index_type=INDEX_TYPE):
+    if index_type == "auto":
+        return "flat" if num_vectors < ANN_THRESHOLD else AUTO_LARGE_INDEX_TYPE
+    if num_vectors < min_training_points(index_type):
+        logger.warning(
+            "%s needs at least %d vectors to train, got %d; using a flat index",
+            index_type, min_training_points(index_type), num_vectors,
+        )
+        return "flat"
+    return index_type
+
+
+def _nlist(num_vectors):
+    nlist = int(4 * math.sqrt(num_vectors))
+    return max(1, min(nlist, num_vectors // MIN_POINTS_PER_LIST))
+
+
+# Number of PQ sub-quantizers: as many as possible (<= 64) that divide the dimension
+def _pq_m(dimension):
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def factory_string(index_type, num_vectors, dimension):
+    nlist = _nlist(num_vectors)
+    pq_m = _pq_m(dimension)
+    return {
+        "flat": "Flat",
+        "hnsw": f"HNSW{HNSW_M}",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "ivf_sq8": f"IVF{nlist},SQ8",
+        "ivf_pq": f"IVF{nlist},PQ{pq_m}x{PQ_BITS}",
+        "opq_ivf_pq": f"OPQ{pq_m},IVF{nlist},PQ{pq_m}x{PQ_BITS}",
+    }[index_type]
+
+
+# faiss is imported inside the functions that use it, so importing this module (for INDEX_TYPE) is cheap.
+# nprobe / efSearch are applied wherever they exist (including inside OPQ / IDMap wrappers)
+def set_search_params(index, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    import faiss
+
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+    return index
+
+
+def build_index(vectors, index_type=INDEX_TYPE, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH, seed=0):
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dimension = vectors.shape
+    if index_type not in INDEX_TYPES + ["auto"]:
+        raise ValueError(f"Unknown index type: {index_type}")
+    index_type = choose_index_type(num_vectors, index_type)
+
+    index = faiss.index_factory(dimension, factory_string(index_type, num_vectors, dimension))
+    if not index.is_trained:
+        max_training = _nlist(num_vectors) * MAX_TRAINING_POINTS_PER_LIST
+        training = vectors
+        if num_vectors > max_training:
+            rows = np.random.default_rng(seed).choice(num_vectors, max_training, replace=False)
+            training = vectors[np.sort(rows)]
+        index.train(training)
+    index.add(vectors)
+    return set_search_params(index, nprobe, ef_search)
+
+
+def index_memory_bytes(index):
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
+
+
+# Recall@k and latency of each index type against the exact flat baseline
+def recall_report(vectors, queries, k=10, index_types=INDEX_TYPES, nprobes=(4, 16, 64), ef_searches=(32, 64, 128)):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    baseline = build_index(vectors, "flat")
+    start = time.perf_counter()
+    _, truth = baseline.search(queries, k)
+    flat_latency = (time.perf_counter() - start) / len(queries)
+
+    rows = [{
+        "index_type": "flat", "params": {}, "recall_at_k": 1.0,
+        "latency_ms": flat_latency * 1000, "memory_bytes": index_memory_bytes(baseline), "build_s": 0.0,
+    }]
+    for index_type in index_types:
+        if index_type == "flat":
+            continue
+        start = time.perf_counter()
+        index = build_index(vectors, index_type)
+        build_s = time.perf_counter() - start
+        memory = index_memory_bytes(index)
+
+        if index_type == "hnsw":
+            settings = [{"efSearch": ef} for ef in ef_searches]
+        else:
+            settings = [{"nprobe": nprobe} for nprobe in nprobes]
+
+        for setting in settings:
+            set_search_params(index, setting.get("nprobe", DEFAULT_NPROBE), setting.get("efSearch", DEFAULT_EF_SEARCH))
+            start = time.perf_counter()
+            _, found = index.search(queries, k)
+            latency = (time.perf_counter() - start) / len(queries)
+            hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+            rows.append({
+                "index_type": index_type, "params": setting, "recall_at_k": hits / truth.size,
+                "latency_ms": latency * 1000, "memory_bytes": memory, "build_s": build_s,
+            })
+    return rows
@@ -0,0 +1,327 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Literal
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from ann_index import INDEX_TYPE
+from chunking import iter_pdf_chunks
+from config import CHUNKER, CHUNK_TOKENS
+from index_cache import LoadedIndexCache, get_index_cache, make_index_key
+from llm_client import get_completion_model, get_embedding_model
+from main import (
+    DocumentIndex, EmptyDocumentError, ask_question, create_faiss_index, get_openai_api_key
+)
+from mcq_generator_tab import generate_mcqs_from_text
+from predict_from_past_tab import generate_mcqs_from_past_only
+from predict_neet_tab import generate_mcqs_from_combined_text, plan_combined_generation
+from metrics import METRICS_ENABLED, count, log_event, registry, render_prometheus, summarize_trace, trace
+from ocr import summarize_pages
+from question_bank import get_question_bank
+from question_dedup import QuestionDeduper
+
+# Uvicorn worker processes (each one has its own caches)
+API_WORKERS = int(os.getenv("DOCQA_API_WORKERS", "1"))
+# Background PDF ingestion jobs running at once per process
+API_INGEST_WORKERS = int(os.getenv("DOCQA_API_INGEST_WORKERS", "2"))
+# LLM-backed requests in flight at once per process; the rest wait their turn
+API_MAX_CONCURRENCY = int(os.getenv("DOCQA_API_MAX_CONCURRENCY", "16"))
+# DocumentIndex objects kept warm in memory per process
+API_INDEX_CACHE_SIZE = int(os.getenv("DOCQA_API_INDEX_CACHE_SIZE", "32"))
+API_MAX_JOBS = 1000
+
+# The service is useless without a key, so fail at startup rather than on the first request
+OPENAI_API_KEY = get_openai_api_key()
+
+app = FastAPI(title="Document QnA GPT")
+
+ingest_pool = ThreadPoolExecutor(max_workers=API_INGEST_WORKERS)
+llm_slots = asyncio.Semaphore(API_MAX_CONCURRENCY)
+disk_cache = get_index_cache()
+
+
+# Loaded DocumentIndexes, in front of the on-disk IndexCache
+indexes = LoadedIndexCache(disk_cache, API_INDEX_CACHE_SIZE)
+jobs = OrderedDict()
+jobs_lock = threading.Lock()
+
+
+def make_document_index(index, chunks):
+    return DocumentIndex(index, chunks, get_embedding_model(OPENAI_API_KEY), llm=get_completion_model(OPENAI_API_KEY))
+
+
+# Every request is traced: latency per route, and its stages, tokens and estimated cost
+# go to the JSON log and the X-DocQA-Cost-USD header
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    if request.url.path == "/metrics":
+        return await call_next(request)
+    start = time.perf_counter()
+    with trace() as spans:
+        response = await call_next(request)
+    seconds = time.perf_counter() - start
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    summary = summarize_trace(spans)
+    if METRICS_ENABLED:
+        registry.observe("docqa_request_seconds", seconds, method=request.method, route=route)
+        count("docqa_requests_total", method=request.method, route=route, status=str(response.status_code))
+    log_event("request", method=request.method, route=route, status=response.status_code, seconds=seconds, **summary)
+    response.headers["X-DocQA-Cost-USD"] = f"{summary['cost_usd']:.6f}"
+    return response
+
+
+def update_job(job_id, **fields):
+    with jobs_lock:
+        jobs[job_id].update(fields)
+
+
+# Adds a job, dropping the oldest finished ones past API_MAX_JOBS (queued / running jobs stay)
+def add_job(job):
+    with jobs_lock:
+        jobs[job["job_id"]] = job
+        excess = len(jobs) - API_MAX_JOBS
+        if excess > 0:
+            finished = [job_id for job_id, item in jobs.items() if item["status"] in ("done", "failed")]
+            for job_id in finished[:excess]:
+                del jobs[job_id]
+
+
+def ingest_document(job_id, document_id, pdf_bytes):
+    update_job(job_id, status="running", started_at=time.time())
+    try:
+        page_stats = []
+
+        def build():
+            # Chunks are embedded while later pages are still being extracted
+            built = create_faiss_index(iter_pdf_chunks(pdf_bytes, stats=page_stats), get_embedding_model(OPENAI_API_KEY))
+            # Per-page timing and OCR coverage (only when the index is built, not on a cache hit)
+            update_job(job_id, pages=summarize_pages(page_stats))
+            return built
+
+        document_index = indexes.get_or_build(document_id, build, make_document_index)
+        update_job(job_id, status="done", chunks=len(document_index.chunks), finished_at=time.time())
+    except Exception as e:
+        update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+
+
+async def run_llm(fn, *args, **kwargs):
+    async with llm_slots:
+        return await run_in_threadpool(fn, *args, **kwargs)
+
+
+def get_document_index(document_id):
+    try:
+        document_index = indexes.get(document_id, make_document_index)
+    except EmptyDocumentError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from None
+    if document_index is None:
+        # A document whose ingest failed (e.g. no extractable text) says why
+        with jobs_lock:
+            failed = [job for job in jobs.values() if job["document_id"] == document_id and job["status"] == "failed"]
+        if failed:
+            raise HTTPException(status_code=422, detail=failed[-1]["error"])
+        raise HTTPException(status_code=404, detail="Unknown document_id (not ingested yet?)")
+    return document_index
+
+
+class QuestionRequest(BaseModel):
+    question: str
+
+
+class QuestionsRequest(BaseModel):
+    questions: list[str] = Field(min_length=1)
+
+
+class TextMCQRequest(BaseModel):
+    text: str | None = None
+    document_id: str | None = None
+    num_questions: int = Field(5, ge=1, le=50)
+    use_cache: bool = True
+
+
+class PastMCQRequest(BaseModel):
+    # Pasted past-paper text, or papers already uploaded to /past-papers
+    past_questions_text: str = ""
+    paper_ids: list[str] | None = None
+    num_questions: int = Field(25, ge=1, le=100)
+    difficulty_filter: str = "All"
+    use_cache: bool = True
+    # Questions already returned to this session are not returned again
+    session_id: str | None = None
+
+
+class Chapter(BaseModel):
+    name: str
+    text: str
+
+
+class PredictMCQRequest(BaseModel):
+    chapters: list[Chapter] = Field(min_length=1)
+    past_questions_text: str = ""
+    num_questions: int = Field(25, ge=1, le=100)
+    exclude_logic: bool = False
+    question_type: str = "Mixed"
+    difficulty_filter: str = "All"
+    session_id: str | None = None
+    paper_ids: list[str] | None = None
+    subject: str | None = None
+    # Share of the questions per chapter: by chapter length or by past-paper topic frequency
+    weighting: Literal["size", "past_papers"] = "size"
+    # Only return the planned quotas, calls, tokens and estimated cost
+    dry_run: bool = False
+
+
+# Hashing and the index cache lookup (a disk read + DocumentIndex build) run off the event loop
+def submit_document(pdf_bytes):
+    embedding_model = get_embedding_model(OPENAI_API_KEY)
+    document_id = make_index_key(pdf_bytes, CHUNKER, CHUNK_TOKENS, embedding_model.model, INDEX_TYPE)
+    job_id = uuid.uuid4().hex
+    add_job({"job_id": job_id, "document_id": document_id, "status": "queued", "created_at": time.time()})
+
+    try:
+        loaded = indexes.get(document_id, make_document_index)
+    except EmptyDocumentError as e:
+        update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+        return {"job_id": job_id, "document_id": document_id}
+    if loaded is not None:
+        update_job(job_id, status="done", finished_at=time.time())
+    else:
+        ingest_pool.submit(ingest_document, job_id, document_id, pdf_bytes)
+    return {"job_id": job_id, "document_id": document_id}
+
+
+# Upload the raw PDF as the request body (Content-Type: application/pdf).
+# Indexing runs in the background; poll /jobs/{job_id} for progress.
+@app.post("/documents", status_code=202)
+async def upload_document(request: Request):
+    pdf_bytes = await request.body()
+    if not pdf_bytes.startswith(b"%PDF"):
+        raise HTTPException(status_code=415, detail="Request body must be a PDF file")
+    return await run_in_threadpool(submit_document, pdf_bytes)
+
+
+def add_past_paper(pdf_bytes, name):
+    bank = get_question_bank()
+    paper_id = bank.add_pdf(pdf_bytes, name)
+    return {"paper_id": paper_id, **bank.stats([paper_id])}
+
+
+# Add a past paper (raw PDF body) to the shared question bank; pass its paper_id to the MCQ endpoints
+@app.post("/past-papers")
+async def upload_past_paper(request: Request):
+    pdf_bytes = await request.body()
+    if not pdf_bytes.startswith(b"%PDF"):
+        raise HTTPException(status_code=415, detail="Request body must be a PDF file")
+    return await run_in_threadpool(add_past_paper, pdf_bytes, request.headers.get("X-Filename", "upload.pdf"))
+
+
+# Plain def: FastAPI runs it in the threadpool, so the SQLite reads don't block the event loop
+@app.get("/past-papers")
+def list_past_papers(subject: str | None = None):
+    bank = get_question_bank()
+    return {"papers": bank.papers(), "topics": bank.topic_counts(subject)}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job_id")
+        return dict(job)
+
+
+@app.post("/documents/{document_id}/ask")
+async def ask(document_id: str, body: QuestionRequest):
+    document_index = await run_in_threadpool(get_document_index, document_id)
+    return await run_llm(ask_question, body.question, document_index)
+
+
+@app.post("/documents/{document_id}/ask-many")
+async def ask_many(document_id: str, body: QuestionsRequest):
+    document_index = await run_in_threadpool(get_document_index, document_id)
+    return {"answers": await run_llm(document_index.query_many, body.questions)}
+
+
+@app.post("/mcqs/from-text")
+async def mcqs_from_text(body: TextMCQRequest):
+    text = body.text
+    if text is None and body.document_id:
+        text = "\n".join((await run_in_threadpool(get_document_index, body.document_id)).chunks)
+    if not text:
+        raise HTTPException(status_code=422, detail="Provide either text or document_id")
+    batch = await run_llm(
+        generate_mcqs_from_text, text, OPENAI_API_KEY, body.num_questions, use_cache=body.use_cache
+    )
+    return {"mcqs": batch.to_text(), "items": batch.to_dicts()}
+
+
+@app.post("/mcqs/from-past")
+async def mcqs_from_past(body: PastMCQRequest):
+    batch = await run_llm(
+        generate_mcqs_from_past_only,
+        body.past_questions_text,
+        OPENAI_API_KEY,
+        num_questions=body.num_questions,
+        difficulty_filter=body.difficulty_filter,
+        use_cache=body.use_cache,
+        dedup=await run_in_threadpool(QuestionDeduper, body.session_id),
+        paper_ids=body.paper_ids,
+    )
+    return {"mcqs": batch.to_text(), "items": batch.to_dicts()}
+
+
+@app.post("/mcqs/predict")
+async def mcqs_predict(body: PredictMCQRequest):
+    chapters = [(chapter.name, chapter.text) for chapter in body.chapters]
+    if body.dry_run:
+        return {"plan": await run_in_threadpool(
+            plan_combined_generation, chapters, body.past_questions_text, body.num_questions, body.weighting,
+            body.paper_ids, body.subject
+        )}
+    batch = await run_llm(
+        generate_mcqs_from_combined_text,
+        chapters,
+        body.past_questions_text,
+        OPENAI_API_KEY,
+        num_questions=body.num_questions,
+        exclude_logic=body.exclude_logic,
+        question_type=body.question_type,
+        difficulty_filter=body.difficulty_filter,
+        dedup=await run_in_threadpool(QuestionDeduper, body.session_id),
+        weighting=body.weighting,
+        paper_ids=body.paper_ids,
+        subject=body.subject,
+    )
+    return {"mcqs": batch.to_text(), "items": batch.to_dicts()}
+
+
+# Prometheus text exposition of the stage latencies, token / cost counters and cache hit counts
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "api:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=os.getenv("DOCQA_API_HOST", "0.0.0.0"),
+        port=int(os.getenv("DOCQA_API_PORT", "8000")),
+        workers=API_WORKERS,
+    )
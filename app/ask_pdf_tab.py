@@ -0,0 +1,97 @@
+import hashlib
+
+import streamlit as st
+from ann_index import INDEX_TYPE
+from bulk_qa import AnswerSheet, BulkAnswerer, read_questions
+from chunking import iter_pdf_chunks
+from config import CHUNKER, CHUNK_TOKENS
+from index_cache import get_loaded_indexes, make_index_key
+from llm_client import get_completion_model, get_embedding_model
+from main import DocumentIndex, EmptyDocumentError, create_faiss_index
+from ocr import ocr_warning
+from ui_stream import LiveText
+
+# stats collects per-page extraction stats when the index is actually built (not on a cache hit)
+def build_document_index(file, openai_key, stats=None):
+    # Same PDF + same chunking + same embedding model => reuse the loaded (or saved) index.
+    # The DocumentIndex (BM25 included) is built once per document and API key and shared by
+    # every session; sessions only remember the key.
+    embeddings = get_embedding_model(openai_key)
+    key = make_index_key(file.getvalue(), CHUNKER, CHUNK_TOKENS, embeddings.model, INDEX_TYPE)
+    if st.session_state.get("ask_pdf_index_key") != key:
+        st.session_state.ask_pdf_index_key = key
+        st.session_state.pop("ask_pdf_ocr_warning", None)
+    return get_loaded_indexes().get_or_build(
+        key,
+        lambda: create_faiss_index(iter_pdf_chunks(file, stats=stats), embeddings),
+        lambda index, chunks: DocumentIndex(index, chunks, embeddings, llm=get_completion_model(openai_key)),
+        variant=hashlib.sha256(openai_key.encode()).hexdigest(),
+    )
+
+def answer_question(query, document_index, on_token=None):
+    # Repeated questions on the same document are answered from the response cache
+    result = document_index.query(query, on_token=on_token)
+    return result['result'] if isinstance(result, dict) and 'result' in result else result
+
+def show_ask_pdf_tab(openai_key):
+    st.header("📘 Ask Your PDF")
+    uploaded_file = st.file_uploader("📤 Upload a PDF file", type="pdf")
+
+    if uploaded_file:
+        page_stats = []
+        with st.spinner("Reading and indexing your PDF..."):
+            try:
+                document_index = build_document_index(uploaded_file, openai_key, page_stats)
+            except EmptyDocumentError as e:
+                st.error(f"⚠️ {e}")
+                if ocr_warning(page_stats):
+                    st.warning(f"⚠️ {ocr_warning(page_stats)}")
+                return
+            st.success("PDF processed successfully!")
+        if page_stats:
+            st.session_state.ask_pdf_ocr_warning = ocr_warning(page_stats)
+        if st.session_state.get("ask_pdf_ocr_warning"):
+            st.warning(f"⚠️ {st.session_state.ask_pdf_ocr_warning}")
+
+        question = st.text_input("❓ Ask a question from your document")
+
+        if question:
+            st.markdown("### 🧠 Answer:")
+            live = LiveText(st.empty(), code_block=False)
+            with st.spinner("Thinking..."):
+                answer = answer_question(question, document_index, on_token=live.append)
+            live.placeholder.write({"query": question, "result": answer})
+
+        show_bulk_questions(document_index)
+
+def show_bulk_questions(document_index):
+    # A whole worksheet at once: answers stream into the table and the CSV as prompts finish
+    st.markdown("### 📋 Answer a question list")
+    questions_file = st.file_uploader(
+        "Upload questions (CSV with a 'question' column, or a text file with one per line)",
+        type=["csv", "txt"], key="ask_pdf_questions_file"
+    )
+    if not questions_file:
+        return
+    questions = read_questions(questions_file.getvalue(), questions_file.name)
+    if not questions:
+        st.warning("No questions found in that file.")
+        return
+    use_cache = st.checkbox("♻️ Reuse earlier answers", value=True, key="ask_pdf_bulk_use_cache")
+    if not st.button(f"🚀 Answer {len(questions)} questions"):
+        return
+
+    answerer = BulkAnswerer(document_index)
+    sheet = AnswerSheet()
+    progress = st.progress(0.0, text="Retrieving context for every question...")
+    table = st.empty()
+    for row in answerer.answer(questions, use_cache=use_cache):
+        sheet.add(row)
+        progress.progress(len(sheet) / len(questions), text=f"{len(sheet)} / {len(questions)} answered")
+        table.dataframe(sheet.ordered(), hide_index=True)
+    progress.empty()
+    st.success(
+        f"Answered {len(questions)} questions with {answerer.llm_calls} LLM calls "
+        f"(retrieval for all of them took {answerer.retrieval_seconds:.2f}s)."
+    )
+    st.download_button("⬇️ Download answers as CSV", sheet.to_csv(), file_name="answers.csv")
@@ -0,0 +1,244 @@
+import csv
+import io
+import os
+import re
+import time
+
+from llm_client import LLM_MAX_CONCURRENCY, invoke_with_retry, map_concurrently
+from metrics import timed
+from response_cache import answer_key, get_response_cache, llm_signature, lookup_many
+from token_utils import count_tokens
+
+# Prompt + reserved answer tokens per LLM call (gpt-3.5-turbo-instruct has a ~4k window)
+BULK_TOKEN_BUDGET = int(os.getenv("DOCQA_BULK_TOKEN_BUDGET", "3000"))
+# Completion tokens reserved for each question in a multi-question prompt
+BULK_ANSWER_TOKENS = int(os.getenv("DOCQA_BULK_ANSWER_TOKENS", "120"))
+BULK_MAX_QUESTIONS = int(os.getenv("DOCQA_BULK_MAX_QUESTIONS", "8"))
+SOURCE_PREVIEW_CHARS = 80
+
+COLUMNS = ["number", "question", "answer", "sources", "cached", "prompt_questions", "seconds"]
+
+BULK_PROMPT = """Use the following pieces of context to answer each question at the end. If you don't know an answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Questions:
+{questions}
+
+Answer every question on its own line as "<number>. <answer>", in the same order.
+Answers:
+"""
+NUMBERED_LINE = re.compile(r"^\s*(?:Q(?:uestion)?\s*)?(\d+)\s*[.):\-]\s*(.*)$", re.IGNORECASE)
+QUESTION_COLUMN = re.compile(r"^\s*(?:question|questions|q)\s*$", re.IGNORECASE)
+
+
+# Cache namespace of answers taken from a multi-question prompt (see response_cache.answer_key)
+BULK_NAMESPACE = "bulk"
+
+
+# Questions from an uploaded worksheet: a CSV (the "question" column, else the first one)
+# or a text file with one question per line (leading "1." / "Q1)" numbering is dropped)
+def read_questions(data, filename=""):
+    text = data.decode("utf-8-sig", errors="replace") if isinstance(data, bytes) else data
+    if filename.lower().endswith(".csv"):
+        rows = [row for row in csv.reader(io.StringIO(text)) if any(cell.strip() for cell in row)]
+        if not rows:
+            return []
+        column = next((i for i, cell in enumerate(rows[0]) if QUESTION_COLUMN.match(cell)), None)
+        if column is None:
+            column = 0
+        else:
+            rows = rows[1:]
+        lines = [row[column] if column < len(row) else "" for row in rows]
+    else:
+        lines = text.splitlines()
+
+    questions = []
+    for line in lines:
+        match = NUMBERED_LINE.match(line)
+        question = (match.group(2) if match else line).strip()
+        if question:
+            questions.append(question)
+    return questions
+
+
+# Greedy grouping of questions that share retrieved chunks into one prompt, while the
+# union of their chunks + the questions + the reserved answers fits the token budget.
+# Questions are visited in order of their chunk ids, so ones about the same passage are adjacent.
+def plan_prompts(questions, contexts, chunk_tokens, model=None, budget=BULK_TOKEN_BUDGET,
+                 max_questions=BULK_MAX_QUESTIONS):
+    overhead = count_tokens(BULK_PROMPT.format(context="", questions=""), model)
+    groups, current = [], None
+    for i in sorted(range(len(questions)), key=lambda i: contexts[i]):
+        question_tokens = count_tokens(questions[i], model) + BULK_ANSWER_TOKENS + 2
+        if current is not None:
+            new_chunks = [c for c in contexts[i] if c not in current["chunks"]]
+            tokens = current["tokens"] + question_tokens + sum(chunk_tokens[c] for c in new_chunks)
+            shares = len(new_chunks) < len(contexts[i])
+            if shares and len(current["questions"]) < max_questions and tokens <= budget:
+                current["questions"].append(i)
+                current["chunks"].extend(new_chunks)
+                current["tokens"] = tokens
+                continue
+        current = {
+            "questions": [i],
+            "chunks": list(contexts[i]),
+            "tokens": overhead + question_tokens + sum(chunk_tokens[c] for c in contexts[i]),
+        }
+        groups.append(current)
+    return groups
+
+
+def parse_numbered_answers(text, count):
+    answers, number = {}, None
+    for line in text.splitlines():
+        match = NUMBERED_LINE.match(line)
+        if match and 1 <= int(match.group(1)) <= count and int(match.group(1)) not in answers:
+            number = int(match.group(1))
+            answers[number] = match.group(2).strip()
+        elif number is not None and line.strip():
+            answers[number] += "\n" + line.strip()
+    return [answers.get(n) or None for n in range(1, count + 1)]
+
+
+def format_sources(chunks, chunk_ids):
+    return " | ".join(
+        f"#{i}: " + " ".join(chunks[i].split())[:SOURCE_PREVIEW_CHARS] for i in chunk_ids
+    )
+
+
+class BulkAnswerer:
+    # Answers a whole worksheet against one DocumentIndex: one embeddings request and one
+    # FAISS search for every question, shared-context questions packed into one prompt,
+    # prompts sent concurrently. Answers asked on their own share query()'s cache entries;
+    # answers out of a packed prompt are cached apart, under BULK_NAMESPACE.
+
+    def __init__(self, document_index, budget=BULK_TOKEN_BUDGET, max_questions=BULK_MAX_QUESTIONS,
+                 max_concurrency=LLM_MAX_CONCURRENCY):
+        self.document_index = document_index
+        self.budget = budget
+        self.max_questions = max_questions
+        self.max_concurrency = max_concurrency
+        self.model = llm_signature(document_index.llm)[0]
+        self.retrieval_seconds = 0.0
+        self.llm_calls = 0
+
+    # Runs in a worker thread: returns (answers, alone, seconds, calls) for one planned prompt,
+    # alone[n] telling whether answer n came from its own single-question prompt
+    def _answer_group(self, group):
+        start = time.perf_counter()
+        questions, contexts = group["items"], group["contexts"]
+        document_index = self.document_index
+        chunks = document_index.chunks
+        if len(questions) == 1:
+            answer = document_index.answer(questions[0], [chunks[i] for i in contexts[0]])
+            return [answer], [True], time.perf_counter() - start, 1
+
+        prompt = BULK_PROMPT.format(
+            context="\n\n".join(chunks[i] for i in group["chunks"]),
+            questions="\n".join(f"{n}. {q}" for n, q in enumerate(questions, start=1)),
+        )
+        llm = document_index.llm.bind(max_tokens=BULK_ANSWER_TOKENS * len(questions))
+        answers = parse_numbered_answers(invoke_with_retry(llm, prompt), len(questions))
+        # Anything the model skipped or mis-numbered is asked again on its own, in one batch
+        retried = [n for n, answer in enumerate(answers) if answer is None]
+        redone = document_index.answer_many(
+            [questions[n] for n in retried], [[chunks[i] for i in contexts[n]] for n in retried]
+        )
+        for n, answer in zip(retried, redone):
+            answers[n] = answer
+        alone = [n in retried for n in range(len(questions))]
+        return answers, alone, time.perf_counter() - start, 1 + len(retried)
+
+    # Yields one row per question (see COLUMNS) as soon as its answer is known: cache hits
+    # first, then each prompt's questions as that call finishes
+    def answer(self, questions, use_cache=True):
+        document_index = self.document_index
+        chunks = document_index.chunks
+        start = time.perf_counter()
+        with timed("bulk_retrieve") as span:
+            hits = document_index.hybrid.search_many(questions, document_index.k)
+            span.set(queries=len(questions))
+        self.retrieval_seconds = time.perf_counter() - start
+        contexts = [[i for i, _ in row] for row in hits]
+
+        def row(number, answer, cached, prompt_questions, seconds):
+            return {
+                "number": number + 1,
+                "question": questions[number],
+                "answer": answer.strip(),
+                "sources": format_sources(chunks, contexts[number]),
+                "cached": cached,
+                "prompt_questions": prompt_questions,
+                "seconds": round(seconds, 3),
+            }
+
+        cache = get_response_cache()
+        llm = document_index.llm
+        keys = [answer_key(llm, q, [chunks[i] for i in context]) for q, context in zip(questions, contexts)]
+        bulk_keys = [
+            answer_key(llm, q, [chunks[i] for i in context], BULK_NAMESPACE) for q, context in zip(questions, contexts)
+        ]
+        # An answer to the question asked on its own is preferred, then one from an earlier worksheet
+        cached = [None] * len(questions)
+        if use_cache:
+            unique_keys = list(dict.fromkeys(keys))
+            found = dict(zip(unique_keys, lookup_many(unique_keys, cache)))
+            missing = list(dict.fromkeys(bulk_keys[n] for n, key in enumerate(keys) if found[key] is None))
+            found.update(zip(missing, lookup_many(missing, cache)))
+            cached = [found[key] if found[key] is not None else found.get(bulk_key) for key, bulk_key in zip(keys, bulk_keys)]
+
+        # Repeated questions (same text, same chunks) are only asked once
+        pending = {}
+        for number, key in enumerate(keys):
+            if cached[number] is not None:
+                yield row(number, cached[number], True, 0, 0.0)
+            else:
+                pending.setdefault(key, []).append(number)
+
+        distinct = [numbers[0] for numbers in pending.values()]
+        chunk_tokens = {i: count_tokens(chunks[i], self.model) for i in {c for n in distinct for c in contexts[n]}}
+        plan = plan_prompts(
+            [questions[n] for n in distinct], [contexts[n] for n in distinct], chunk_tokens,
+            self.model, self.budget, self.max_questions
+        )
+        groups = [
+            {
+                "numbers": [distinct[i] for i in group["questions"]],
+                "items": [questions[distinct[i]] for i in group["questions"]],
+                "contexts": [contexts[distinct[i]] for i in group["questions"]],
+                "chunks": group["chunks"],
+            }
+            for group in plan
+        ]
+        for position, (answers, alone, seconds, calls) in map_concurrently(self._answer_group, groups, self.max_concurrency):
+            self.llm_calls += calls
+            group = groups[position]
+            for number, answer, single in zip(group["numbers"], answers, alone):
+                if use_cache:
+                    cache.put(keys[number] if single else bulk_keys[number], answer)
+                for same in pending[keys[number]]:
+                    yield row(same, answer, False, len(group["numbers"]), seconds)
+
+
+class AnswerSheet:
+    # Rows collected as they stream in; exported in worksheet order
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, row):
+        self.rows.append(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def ordered(self):
+        return sorted(self.rows, key=lambda row: row["number"])
+
+    def to_csv(self):
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(self.ordered())
+        return io.BytesIO(text.getvalue().encode("utf-8"))
@@ -0,0 +1,207 @@
+import re
+from collections import Counter
+from itertools import chain, islice
+
+from config import CHUNK_TOKENS
+from metrics import count, timed
+from pdf_extraction import iter_layout_pages
+from token_utils import count_tokens
+
+QUESTION_START = re.compile(r"^\s*(?:Q\.?\s*)?\d{1,3}\s*[.)]\s+\S")
+OPTION_LINE = re.compile(r"^\s*\(?[A-Da-d][.)]\s+\S")
+MCQ_META_LINE = re.compile(r"^\s*(?:answer|correct answer|difficulty|explanation|solution)\s*[:\-]", re.IGNORECASE)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+# A line is a heading when its font is this much larger than the body text,
+# or when it is short and bold without ending like a sentence
+HEADING_SIZE_RATIO = 1.15
+HEADING_MAX_WORDS = 12
+# Pages read before the body font size is fixed and chunks start streaming out
+BODY_SIZE_SAMPLE_PAGES = 8
+SMALL_WORDS = frozenset("a an and as at by for from in of on or the to vs with".split())
+
+
+def _is_question_line(text):
+    return bool(QUESTION_START.match(text) or OPTION_LINE.match(text) or MCQ_META_LINE.match(text))
+
+
+# Plain text has no font information: a short, capitalised line that doesn't end like a sentence
+def _looks_like_heading(text):
+    words = text.split()
+    if not words or len(words) > HEADING_MAX_WORDS or text[-1] in ".,;:?!" or _is_question_line(text):
+        return False
+    significant = [w for w in words if w.lower() not in SMALL_WORDS]
+    return bool(significant) and all(w[0].isupper() or w[0].isdigit() for w in significant)
+
+
+# Group lines into units: ("heading", text), ("mcq", question + options + answer) or
+# ("text", paragraph). An MCQ ends at the first line that is no longer part of it.
+# Units are yielded as soon as they end, so lines can stream in page by page.
+def _units(lines):
+    block = []
+    state = {"kind": None, "options": 0, "meta": False}
+
+    def flush():
+        unit = None
+        if block:
+            kind = state["kind"]
+            unit = (kind, "\n".join(block) if kind == "mcq" else " ".join(block))
+            block.clear()
+        state.update(kind=None, options=0, meta=False)
+        return unit
+
+    for text, is_heading in lines:
+        text = text.strip()
+        unit = None
+        if not text:
+            unit = flush()
+        elif QUESTION_START.match(text):
+            unit = flush()
+            state["kind"] = "mcq"
+            block.append(text)
+        elif state["kind"] == "mcq" and OPTION_LINE.match(text) and not state["meta"]:
+            state["options"] += 1
+            block.append(text)
+        elif state["kind"] == "mcq" and MCQ_META_LINE.match(text):
+            state["meta"] = True
+            block.append(text)
+        elif state["kind"] == "mcq" and not state["meta"] and state["options"] < 4:
+            block.append(text)  # stem or option wrapped onto the next line
+        elif is_heading:
+            unit = flush()
+            if unit:
+                yield unit
+            unit = ("heading", text)
+        else:
+            if state["kind"] != "text":
+                unit = flush()
+                state["kind"] = "text"
+            # Re-join words hyphenated across a line break
+            if block and block[-1].endswith("-") and text[:1].islower():
+                block[-1] = block[-1][:-1] + text
+            else:
+                block.append(text)
+        if unit:
+            yield unit
+    unit = flush()
+    if unit:
+        yield unit
+
+
+def _split_oversized(text, max_tokens, model):
+    pieces = []
+    for sentence in SENTENCE_END.split(text):
+        if count_tokens(sentence, model) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words = sentence.split()
+        step = max(1, int(len(words) * max_tokens / count_tokens(sentence, model)))
+        pieces += [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+    return pieces
+
+
+# Greedy packing up to max_tokens. A heading always starts a new chunk and is repeated
+# at the top of every chunk of its section; an MCQ is never split from its options.
+# Chunks are yielded as soon as they are full.
+def _pack(units, max_tokens, model):
+    current = []
+    heading, heading_open, used = "", False, 0
+
+    def flush():
+        chunk = "\n".join(([heading] if heading else []) + current) if current else None
+        current.clear()
+        return chunk
+
+    for kind, text in units:
+        if kind == "heading":
+            chunk = flush()
+            if chunk:
+                yield chunk
+            # Consecutive headings (chapter, then section) stay together
+            heading = f"{heading}\n{text}" if heading_open else text
+            heading_open, used = True, 0
+            continue
+        heading_open = False
+        budget = max(max_tokens - (count_tokens(heading, model) if heading else 0), max_tokens // 2)
+        tokens = count_tokens(text, model)
+        pieces = [(text, tokens)] if tokens <= budget else [
+            (piece, count_tokens(piece, model)) for piece in _split_oversized(text, budget, model)
+        ]
+        for piece, piece_tokens in pieces:
+            if current and used + piece_tokens > budget:
+                yield flush()
+                used = 0
+            current.append(piece)
+            used += piece_tokens
+    chunk = flush()
+    if chunk:
+        yield chunk
+
+
+# Generator of chunks from (text, is_heading) lines, pulling lines only as chunks fill up
+def iter_chunks(lines, max_tokens=CHUNK_TOKENS, model=None):
+    chunks = 0
+    for chunk in _pack(_units(lines), max_tokens, model):
+        chunks += 1
+        yield chunk
+    count("docqa_chunks_total", chunks)
+
+
+def chunk_lines(lines, max_tokens=CHUNK_TOKENS, model=None):
+    with timed("chunk") as span:
+        chunks = list(iter_chunks(lines, max_tokens, model))
+        span.set(chunks=len(chunks))
+    return chunks
+
+
+# Plain text has no font information, so headings are guessed from the line shape
+def _classify_text_lines(lines):
+    return ((line, _looks_like_heading(line.strip())) for line in lines)
+
+
+# Structure-aware chunks from extracted text
+def chunk_text(text, max_tokens=CHUNK_TOKENS, model=None):
+    return chunk_lines(_classify_text_lines(text.splitlines()), max_tokens, model)
+
+
+# Same chunks as chunk_text over the joined page texts, but streamed: pages are chunked as
+# they are extracted instead of being collected into one string first
+def iter_text_chunks(pages, max_tokens=CHUNK_TOKENS, model=None):
+    # A page's trailing newline keeps it from running into the next page's first line
+    lines = (line for text in pages if text for line in (text + "\n").splitlines())
+    return iter_chunks(_classify_text_lines(lines), max_tokens, model)
+
+
+# Generator of structure-aware chunks straight from the PDF layout: headings come from font
+# size and weight. The body font size is the most common one over the first
+# BODY_SIZE_SAMPLE_PAGES pages; after those, pages are chunked as they are extracted.
+def iter_pdf_chunks(source, max_tokens=CHUNK_TOKENS, model=None, stats=None):
+    with timed("extract", backend="layout") as span:
+        pages = (lines for _, lines in iter_layout_pages(source, stats=stats))
+        sample = list(islice(pages, BODY_SIZE_SAMPLE_PAGES))
+        sizes = Counter()
+        for lines in sample:
+            for text, size, _ in lines:
+                if size:
+                    sizes[size] += len(text)
+        body_size = sizes.most_common(1)[0][0] if sizes else 0
+        seen = {"pages": 0}
+
+        def classified():
+            for lines in chain(sample, pages):
+                seen["pages"] += 1
+                for text, size, bold in lines:
+                    if not size:  # OCR'd page: no font information
+                        yield text, _looks_like_heading(text)
+                        continue
+                    short = len(text.split()) <= HEADING_MAX_WORDS and text.rstrip()[-1:] not in ".,;:?!"
+                    yield text, (size >= body_size * HEADING_SIZE_RATIO and short) or (bold and short)
+
+        chunks = 0
+        for chunk in iter_chunks(classified(), max_tokens, model):
+            chunks += 1
+            yield chunk
+        span.set(pages=seen["pages"], chunks=chunks)
+
+
+def chunk_pdf(source, max_tokens=CHUNK_TOKENS, model=None, stats=None):
+    return list(iter_pdf_chunks(source, max_tokens, model, stats))
@@ -0,0 +1,18 @@
+import os
+
+# Root folder for everything we persist between runs (indexes, caches, ...)
+CACHE_DIR = os.getenv("DOCQA_CACHE_DIR", os.path.join(".cache", "docqa"))
+
+# Chunking parameters shared by the CLI pipeline, the API and the Streamlit app.
+# CHUNKER names the chunking algorithm; bump it whenever its output changes so cached indexes are rebuilt.
+CHUNKER = "structured-v1"
+CHUNK_TOKENS = int(os.getenv("DOCQA_CHUNK_TOKENS", "200"))
+
+# Chunks handed to the LLM per question
+RETRIEVAL_K = int(os.getenv("DOCQA_RETRIEVAL_K", "2"))
+
+
+def cache_dir(name):
+    path = os.path.join(CACHE_DIR, name)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from config import cache_dir
+from embedding_cache import embed_stream, embed_texts
+from main import iter_pdf_text_chunks, split_text_into_chunks
+
+# Vector ids are (document slot << 32) | chunk number, so every document owns one id range
+DOC_ID_SHIFT = 32
+
+# Documents unused for the TTL are dropped, then the least recently used above the size limit
+# (vectors + chunk text); a dropped chapter is simply embedded again when it is next uploaded
+CORPUS_TTL_SECONDS = int(os.getenv("DOCQA_CORPUS_TTL", str(7 * 24 * 3600)))
+CORPUS_MAX_BYTES = int(os.getenv("DOCQA_CORPUS_MAX_MB", "1024")) * 1024 * 1024
+# Searches only rewrite the manifest when a last-used time moves by more than this
+USE_RESOLUTION_SECONDS = 3600
+
+INDEX_FILE = "corpus.faiss"
+MANIFEST_FILE = "manifest.json"
+
+
+def _id_range(slot):
+    return slot << DOC_ID_SHIFT, (slot + 1) << DOC_ID_SHIFT
+
+
+class CorpusIndex:
+    # Multi-document FAISS index: documents are added / removed one at a time
+    # without re-embedding the rest of the corpus. embedding_model is the default client;
+    # a corpus shared between users takes each caller's own client per call instead.
+
+    def __init__(self, embedding_model, path=None, ttl=CORPUS_TTL_SECONDS, max_bytes=CORPUS_MAX_BYTES):
+        self.embedding_model = embedding_model
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.index = None
+        self.documents = {}
+        self.next_slot = 1
+        self._lock = threading.RLock()
+        if path and os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            self._load()
+            if self.evict():
+                self.save()
+
+    @classmethod
+    def open(cls, name, embedding_model):
+        return cls(embedding_model, path=cache_dir(os.path.join("corpus", name)))
+
+    def __contains__(self, doc_id):
+        return doc_id in self.documents
+
+    def document_ids(self):
+        return list(self.documents)
+
+    def add_document(self, doc_id, pdf=None, text=None, embedding_model=None):
+        # A PDF is chunked and embedded page by page, never held as one string
+        chunks = iter_pdf_text_chunks(pdf) if text is None else split_text_into_chunks(text)
+        chunks, vectors = embed_stream(embedding_model or self.embedding_model, chunks)
+        if not chunks:
+            vectors = None
+
+        with self._lock:
+            if doc_id in self.documents:
+                self._remove(doc_id)
+
+            slot = self.next_slot
+            self.next_slot += 1
+            if vectors is not None:
+                if self.index is None:
+                    self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+                ids = (slot << DOC_ID_SHIFT) + np.arange(len(chunks), dtype=np.int64)
+                self.index.add_with_ids(vectors, ids)
+
+            self.documents[doc_id] = {
+                "slot": slot, "chunks": chunks, "used": time.time(), "bytes": self._size(chunks, self.index.d if vectors is not None else 0)
+            }
+            self.evict(keep=doc_id)
+            self.save()
+        return len(chunks)
+
+    def remove_document(self, doc_id):
+        with self._lock:
+            if doc_id not in self.documents:
+                return False
+            self._remove(doc_id)
+            self.save()
+        return True
+
+    def _remove(self, doc_id):
+        slot = self.documents.pop(doc_id)["slot"]
+        if self.index is not None:
+            self.index.remove_ids(faiss.IDSelectorRange(*_id_range(slot)))
+
+    # float32 vectors + chunk text
+    @staticmethod
+    def _size(chunks, dimension):
+        return len(chunks) * dimension * 4 + sum(len(chunk.encode("utf-8")) for chunk in chunks)
+
+    # Marks documents as used; the manifest is rewritten only when a time has moved noticeably
+    def _touch(self, doc_ids):
+        now = time.time()
+        with self._lock:
+            stale = False
+            for doc_id in doc_ids:
+                info = self.documents.get(doc_id)
+                if info is not None:
+                    stale = stale or now - info["used"] > USE_RESOLUTION_SECONDS
+                    info["used"] = now
+            if stale:
+                self._save_manifest()
+
+    # Drops expired documents, then the least recently used while above max_bytes (never keep);
+    # returns whether anything was removed. The caller saves.
+    def evict(self, keep=None):
+        now = time.time()
+        with self._lock:
+            total = sum(info["bytes"] for info in self.documents.values())
+            removed = False
+            # Oldest use first
+            for doc_id, info in sorted(self.documents.items(), key=lambda item: item[1]["used"]):
+                if doc_id == keep:
+                    continue
+                if now - info["used"] <= self.ttl and total <= self.max_bytes:
+                    break
+                total -= info["bytes"]
+                self._remove(doc_id)
+                removed = True
+            return removed
+
+    def _selector(self, doc_ids):
+        docs = [self.documents[d] for d in doc_ids if d in self.documents]
+        if len(docs) == 1:
+            return faiss.IDSelectorRange(*_id_range(docs[0]["slot"]))
+        ids = [
+            (info["slot"] << DOC_ID_SHIFT) + np.arange(len(info["chunks"]), dtype=np.int64)
+            for info in docs
+        ]
+        return faiss.IDSelectorBatch(np.concatenate(ids) if ids else np.empty(0, dtype=np.int64))
+
+    # A document's chunks and their stored vectors (nothing is re-embedded)
+    def document_vectors(self, doc_id):
+        self._touch([doc_id])
+        with self._lock:
+            info = self.documents[doc_id]
+            if not info["chunks"]:
+                return [], None
+            first = info["slot"] << DOC_ID_SHIFT
+            vectors = np.vstack([self.index.reconstruct(first + i) for i in range(len(info["chunks"]))])
+            return list(info["chunks"]), vectors
+
+    # Returns one list of (doc_id, chunk, distance) per query, optionally restricted to doc_ids
+    def search_many(self, queries, k=4, doc_ids=None, embedding_model=None):
+        if self.index is None or self.index.ntotal == 0 or not queries:
+            return [[] for _ in queries]
+
+        slot_to_doc = {info["slot"]: doc_id for doc_id, info in self.documents.items()}
+        query_matrix = embed_texts(embedding_model or self.embedding_model, queries)
+        with self._lock:
+            params = None
+            if doc_ids is not None:
+                params = faiss.SearchParameters(sel=self._selector(doc_ids))
+            distances, ids = self.index.search(query_matrix, k, params=params)
+
+        results = []
+        for row_distances, row_ids in zip(distances, ids):
+            hits = []
+            for distance, vector_id in zip(row_distances, row_ids):
+                if vector_id == -1:
+                    continue
+                doc_id = slot_to_doc.get(int(vector_id) >> DOC_ID_SHIFT)
+                if doc_id is None:
+                    continue
+                chunk_no = int(vector_id) & ((1 << DOC_ID_SHIFT) - 1)
+                hits.append((doc_id, self.documents[doc_id]["chunks"][chunk_no], float(distance)))
+            results.append(hits)
+        self._touch(doc_ids if doc_ids is not None else {doc_id for hits in results for doc_id, _, _ in hits})
+        return results
+
+    def search(self, query, k=4, doc_ids=None, embedding_model=None):
+        return self.search_many([query], k, doc_ids, embedding_model)[0]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if self.index is not None:
+                tmp_index = os.path.join(self.path, INDEX_FILE + ".tmp")
+                faiss.write_index(self.index, tmp_index)
+                os.replace(tmp_index, os.path.join(self.path, INDEX_FILE))
+            self._save_manifest()
+
+    def _save_manifest(self):
+        if not self.path:
+            return
+        with self._lock:
+            tmp_manifest = os.path.join(self.path, MANIFEST_FILE + ".tmp")
+            with open(tmp_manifest, "w", encoding="utf-8") as f:
+                json.dump({"next_slot": self.next_slot, "documents": self.documents}, f)
+            os.replace(tmp_manifest, os.path.join(self.path, MANIFEST_FILE))
+
+    def _load(self):
+        with open(os.path.join(self.path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.next_slot = manifest["next_slot"]
+        self.documents = manifest["documents"]
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_path):
+            self.index = faiss.read_index(index_path)
+        # Manifests written before expiry existed: count their documents as used now
+        dimension = self.index.d if self.index is not None else 0
+        for info in self.documents.values():
+            info.setdefault("used", time.time())
+            info.setdefault("bytes", self._size(info["chunks"], dimension))
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import zstandard
+
+from config import cache_dir
+from metrics import cache_lookup, timed
+from resources import shared_resource
+
+# Compressed document text kept in memory per process, shared by every session
+DOCUMENT_STORE_MAX_BYTES = int(os.getenv("DOCQA_DOCUMENT_STORE_MB", "64")) * 1024 * 1024
+DOCUMENT_ZSTD_LEVEL = int(os.getenv("DOCQA_DOCUMENT_ZSTD_LEVEL", "3"))
+# The .zst files on disk expire after the TTL and are LRU-evicted above the size limit
+DOCUMENT_STORE_DISK_MAX_BYTES = int(os.getenv("DOCQA_DOCUMENT_STORE_DISK_MB", "1024")) * 1024 * 1024
+DOCUMENT_STORE_TTL_SECONDS = int(os.getenv("DOCQA_DOCUMENT_STORE_TTL", str(7 * 24 * 3600)))
+
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+class DocumentStore:
+    # Content-addressed text of uploaded documents: one zstd-compressed copy per distinct
+    # upload however many sessions hold it. Sessions keep only the handle (a hash). Every
+    # document is written to disk once; the in-memory copies are LRU-evicted down to
+    # max_bytes and evicted documents are read back from disk when asked for again.
+    # On disk, a file's mtime doubles as its "last used" timestamp: documents unused for
+    # ttl seconds, then the least recently used above max_disk_bytes, are deleted.
+
+    def __init__(self, root=None, max_bytes=DOCUMENT_STORE_MAX_BYTES, level=DOCUMENT_ZSTD_LEVEL,
+                 max_disk_bytes=DOCUMENT_STORE_DISK_MAX_BYTES, ttl=DOCUMENT_STORE_TTL_SECONDS):
+        self.root = root or cache_dir("documents")
+        os.makedirs(self.root, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.level = level
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._blobs = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evict()
+
+    def _path(self, handle):
+        return os.path.join(self.root, f"{handle}.zst")
+
+    def __contains__(self, handle):
+        return handle in self._blobs or os.path.exists(self._path(handle))
+
+    def _touch(self, handle):
+        try:
+            os.utime(self._path(handle))
+        except FileNotFoundError:
+            pass
+
+    def _remember(self, handle, blob):
+        with self._lock:
+            if handle in self._blobs:
+                self._blobs.move_to_end(handle)
+                return
+            self._blobs[handle] = blob
+            self._bytes += len(blob)
+            while self._bytes > self.max_bytes and len(self._blobs) > 1:
+                _, evicted = self._blobs.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _put(self, handle, text):
+        if handle in self:
+            self._touch(handle)
+            return handle
+        data = text.encode("utf-8")
+        with timed("document_compress") as span:
+            blob = zstandard.ZstdCompressor(level=self.level).compress(data)
+            span.set(text_bytes=len(data), compressed_bytes=len(blob))
+        # Written to a temp file first so readers never see a partial document
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, self._path(handle))
+        self._remember(handle, blob)
+        self.evict()
+        return handle
+
+    # Handle of a PDF's extracted text; a PDF the store already holds is only hashed
+    def add_pdf(self, pdf, stats=None):
+        from main import extract_text_from_pdf
+
+        handle = hashlib.sha256(_read_bytes(pdf)).hexdigest()[:16]
+        if handle in self:
+            cache_lookup("document_store", True)
+            self._touch(handle)
+            return handle
+        cache_lookup("document_store", False)
+        return self._put(handle, extract_text_from_pdf(pdf, stats=stats))
+
+    def add_text(self, text):
+        return self._put(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], text)
+
+    def text(self, handle):
+        blob = self._blobs.get(handle)
+        if blob is not None:
+            with self._lock:
+                if handle in self._blobs:
+                    self._blobs.move_to_end(handle)
+        else:
+            try:
+                with open(self._path(handle), "rb") as f:
+                    blob = f.read()
+            except FileNotFoundError:
+                raise KeyError(handle) from None
+            self._remember(handle, blob)
+        self._touch(handle)
+        return zstandard.ZstdDecompressor().decompress(blob).decode("utf-8")
+
+    # Deletes expired documents, then the least recently used ones until the files fit
+    # max_disk_bytes; a deleted document is dropped from memory too
+    def evict(self):
+        now = time.time()
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.root):
+                if not name.endswith(".zst"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name[:-len(".zst")]))
+                total += stat.st_size
+
+            # Oldest access first; the newest document stays, like the in-memory LRU's
+            for mtime, size, handle in sorted(entries)[:-1]:
+                if now - mtime <= self.ttl and total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(self._path(handle))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                blob = self._blobs.pop(handle, None)
+                if blob is not None:
+                    self._bytes -= len(blob)
+
+    def stats(self):
+        with self._lock:
+            return {"documents_in_memory": len(self._blobs), "compressed_bytes": self._bytes}
+
+
+@shared_resource
+def get_document_store():
+    return DocumentStore()
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config import cache_dir
+from metrics import active, cache_lookup, record_tokens, timed
+from resources import shared_resource
+from token_utils import count_tokens
+
+# OpenAI accepts up to 2048 inputs / ~300k tokens per embeddings request
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("DOCQA_EMBED_BATCH_TOKENS", "100000"))
+EMBED_BATCH_MAX_ITEMS = 2048
+EMBED_MAX_CONCURRENCY = int(os.getenv("DOCQA_EMBED_CONCURRENCY", "4"))
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def get_model_name(embedding_model):
+    return getattr(embedding_model, "model", None) or type(embedding_model).__name__
+
+
+# Split texts into request-sized batches without exceeding the token budget
+def make_batches(texts, model=None, max_tokens=EMBED_BATCH_MAX_TOKENS, max_items=EMBED_BATCH_MAX_ITEMS):
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = count_tokens(text, model)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+class EmbeddingStore:
+    # Persistent text-hash -> float32 vector map backed by SQLite
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir("embeddings"), "embeddings.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 900):
+                part = keys[start:start + 900]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+            )
+            self._conn.commit()
+
+
+# One SQLite connection per process, shared by every CachedEmbeddings
+@shared_resource
+def get_default_store():
+    return EmbeddingStore()
+
+
+class CachedEmbeddings:
+    # Wraps any LangChain embedding model: dedupes chunks, serves repeats from
+    # the local store and sends only the misses, in parallel batches.
+
+    def __init__(self, embedding_model, store=None, max_concurrency=EMBED_MAX_CONCURRENCY,
+                 max_batch_tokens=EMBED_BATCH_MAX_TOKENS):
+        self.embedding_model = embedding_model
+        self.model = get_model_name(embedding_model)
+        self.store = store or get_default_store()
+        self.max_concurrency = max_concurrency
+        self.max_batch_tokens = max_batch_tokens
+
+    def _key(self, normalized):
+        return hashlib.sha256(f"{self.model}\0{normalized}".encode()).hexdigest()
+
+    def embed_array(self, texts):
+        with timed("embed", model=self.model) as span:
+            return self._embed_array(texts, span)
+
+    def _embed_array(self, texts, span):
+        normalized = [normalize_text(t) for t in texts]
+        keys = [self._key(t) for t in normalized]
+
+        vectors = self.store.get_many(set(keys))
+        missing = {}
+        for key, text in zip(keys, normalized):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        cache_lookup("embedding", True, len(keys) - len(missing))
+        cache_lookup("embedding", False, len(missing))
+        span.set(texts=len(keys), embedded=len(missing))
+
+        if missing:
+            if active():
+                record_tokens(span, self.model, sum(count_tokens(text) for text in missing.values()))
+            batches = list(make_batches(list(missing.values()), None, self.max_batch_tokens))
+            workers = max(1, min(self.max_concurrency, len(batches)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self.embedding_model.embed_documents, batches))
+
+            new_items = list(zip(missing.keys(), (v for batch in results for v in batch)))
+            self.store.put_many(new_items)
+            for key, vector in new_items:
+                vectors[key] = np.asarray(vector, dtype=np.float32)
+
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack([vectors[key] for key in keys])
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
+
+
+# Embed texts as a float32 matrix, skipping the list round-trip when possible
+def embed_texts(embedding_model, texts):
+    if isinstance(embedding_model, CachedEmbeddings):
+        return embedding_model.embed_array(texts)
+    return np.array(embedding_model.embed_documents(texts), dtype=np.float32)
+
+
+# Embed texts as they are produced (e.g. chunks streaming out of a PDF): each request-sized
+# batch is sent as soon as it fills while the producer keeps going. Returns (texts, matrix).
+def embed_stream(embedding_model, texts, max_concurrency=EMBED_MAX_CONCURRENCY):
+    collected = []
+
+    def produced():
+        for text in texts:
+            collected.append(text)
+            yield text
+
+    max_tokens = getattr(embedding_model, "max_batch_tokens", EMBED_BATCH_MAX_TOKENS)
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = [pool.submit(embed_texts, embedding_model, batch) for batch in make_batches(produced(), None, max_tokens)]
+        parts = [future.result() for future in futures]
+    if not parts:
+        return collected, np.empty((0, 0), dtype=np.float32)
+    return collected, np.vstack(parts)
@@ -0,0 +1,153 @@
+import logging
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from embedding_cache import embed_texts
+from metrics import timed
+from resources import shared_resource
+
+logger = logging.getLogger(__name__)
+
+# Candidates taken from each retriever before fusion, and the RRF damping constant
+RETRIEVAL_CANDIDATES = int(os.getenv("DOCQA_RETRIEVAL_CANDIDATES", "20"))
+RRF_K = 60
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Optional local cross-encoder (needs sentence-transformers), e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+RERANKER_MODEL = os.getenv("DOCQA_RERANKER_MODEL", "")
+# Drop fused results scoring below this (RRF score, or reranker score when one is configured)
+RETRIEVAL_MIN_SCORE = float(os.getenv("DOCQA_RETRIEVAL_MIN_SCORE")) if os.getenv("DOCQA_RETRIEVAL_MIN_SCORE") else None
+
+STOPWORDS = frozenset(
+    "a an and are as at be by does for from how in is it its of on or that the this to was what when "
+    "where which who why will with".split()
+)
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    return [token for token in TOKEN.findall(text) if token not in STOPWORDS]
+
+
+class BM25Index:
+    # In-process inverted index: term -> (chunk ids, term frequencies) as numpy arrays,
+    # so a query only touches the postings of its own terms
+
+    def __init__(self, chunks, k1=BM25_K1, b=BM25_B):
+        self.size = len(chunks)
+        postings = defaultdict(lambda: ([], []))
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for chunk_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            lengths[chunk_id] = sum(counts.values())
+            for term, tf in counts.items():
+                ids, tfs = postings[term]
+                ids.append(chunk_id)
+                tfs.append(tf)
+
+        average = lengths.mean() if self.size else 1.0
+        # Length normalisation is per chunk, so fold it in once here
+        self._norm = k1 * (1 - b + b * lengths / max(average, 1e-9))
+        self._k1 = k1
+        self._postings = {}
+        for term, (ids, tfs) in postings.items():
+            idf = math.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5))
+            self._postings[term] = (np.array(ids, dtype=np.int64), np.array(tfs, dtype=np.float32), idf)
+
+    def scores(self, query):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs, idf = posting
+            scores[ids] += idf * tfs * (self._k1 + 1) / (tfs + self._norm[ids])
+        return scores
+
+    # Top-k chunk ids with a positive score, best first
+    def search(self, query, k):
+        scores = self.scores(query)
+        k = min(k, self.size)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [int(i) for i in top if scores[i] > 0]
+
+
+# Reciprocal rank fusion: every list votes 1 / (RRF_K + rank) for each of its ids
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            fused[chunk_id] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name)
+
+    def scores(self, question, passages):
+        return [float(score) for score in self.model.predict([(question, passage) for passage in passages])]
+
+
+@shared_resource
+def get_reranker(model_name=RERANKER_MODEL):
+    if not model_name:
+        return None
+    try:
+        return CrossEncoderReranker(model_name)
+    except ImportError:
+        logger.warning("DOCQA_RERANKER_MODEL=%s needs sentence-transformers; reranking is off.", model_name)
+        return None
+
+
+class HybridRetriever:
+    # BM25 + FAISS candidates fused with RRF, optionally reranked by a cross-encoder
+    # (reranker=None uses DOCQA_RERANKER_MODEL, reranker=False turns reranking off)
+
+    def __init__(self, index, chunks, embedding_model, candidates=RETRIEVAL_CANDIDATES,
+                 reranker=None, min_score=RETRIEVAL_MIN_SCORE):
+        self.index = index
+        self.chunks = chunks
+        self.embedding_model = embedding_model
+        self.candidates = candidates
+        self.reranker = get_reranker() if reranker is None else (reranker or None)
+        self.min_score = min_score
+        self.bm25 = BM25Index(chunks)
+
+    # Vector candidates for the whole batch come from one embeddings request and one index.search
+    def vector_candidates(self, questions, k=None):
+        if not self.chunks:
+            return [[] for _ in questions]
+        query_matrix = embed_texts(self.embedding_model, questions)
+        with timed("vector_search") as span:
+            _, ids = self.index.search(query_matrix, min(k or self.candidates, len(self.chunks)))
+            span.set(queries=len(questions))
+        return [[int(i) for i in row if i != -1] for row in ids]
+
+    def lexical_candidates(self, question, k=None):
+        with timed("bm25_search"):
+            return self.bm25.search(question, k or self.candidates)
+
+    # Returns, per question, a list of (chunk id, score) best first
+    def search_many(self, questions, k):
+        results = []
+        for question, vector_ids in zip(questions, self.vector_candidates(questions)):
+            fused = reciprocal_rank_fusion([vector_ids, self.lexical_candidates(question)])
+            if self.reranker is not None and fused:
+                ids = [chunk_id for chunk_id, _ in fused]
+                with timed("rerank"):
+                    scores = self.reranker.scores(question, [self.chunks[i] for i in ids])
+                fused = sorted(zip(ids, scores), key=lambda item: -item[1])
+            results.append([(i, score) for i, score in fused[:k] if self.min_score is None or score >= self.min_score])
+        return results
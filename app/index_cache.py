@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from config import cache_dir
+from metrics import cache_lookup
+from resources import shared_resource
+
+INDEX_CACHE_MAX_BYTES = int(os.getenv("DOCQA_INDEX_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# Loaded (index, chunks) pairs kept in memory per process, shared by every session
+INDEX_MEMORY_CACHE_SIZE = int(os.getenv("DOCQA_INDEX_MEMORY_CACHE_SIZE", "8"))
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.json"
+
+
+# Key = SHA-256 of the PDF bytes + everything that changes the resulting vectors
+def make_index_key(pdf_bytes, chunker, chunk_size, embedding_model_name, index_type="flat"):
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    params = json.dumps(
+        {
+            "chunker": chunker,
+            "chunk_size": chunk_size,
+            "model": embedding_model_name,
+            "index_type": index_type,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(f"{digest}:{params}".encode()).hexdigest()
+
+
+class IndexCache:
+    # On-disk store of FAISS indexes + chunk lists, one folder per key.
+    # The folder mtime doubles as the "last used" timestamp for LRU eviction.
+
+    def __init__(self, root=None, max_bytes=INDEX_CACHE_MAX_BYTES):
+        self.root = root or cache_dir("indexes")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        import faiss
+
+        entry = self._entry_dir(key)
+        index_path = os.path.join(entry, INDEX_FILE)
+        chunks_path = os.path.join(entry, CHUNKS_FILE)
+        if not (os.path.exists(index_path) and os.path.exists(chunks_path)):
+            return None
+
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            with open(chunks_path, encoding="utf-8") as f:
+                chunks = json.load(f)
+        except (RuntimeError, OSError, ValueError):
+            # Half-written or corrupted entry: drop it and rebuild
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+        os.utime(entry)
+        return index, chunks
+
+    def put(self, key, index, chunks):
+        import faiss
+
+        # Write into a temp folder first so readers never see a partial entry
+        tmp_dir = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        try:
+            faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE))
+            with open(os.path.join(tmp_dir, CHUNKS_FILE), "w", encoding="utf-8") as f:
+                json.dump(chunks, f)
+            entry = self._entry_dir(key)
+            with self._lock:
+                shutil.rmtree(entry, ignore_errors=True)
+                os.replace(tmp_dir, entry)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.root):
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(self.root, name)
+                size = sum(
+                    os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)
+                )
+                entries.append((os.path.getmtime(path), size, path))
+                total += size
+
+            # Oldest access first
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def get_or_build(self, key, build_fn):
+        cached = self.get(key)
+        cache_lookup("index_disk", cached is not None)
+        if cached is not None:
+            return cached
+        index, chunks = build_fn()
+        self.put(key, index, chunks)
+        return index, chunks
+
+
+class LoadedIndexCache:
+    # Small in-process LRU of loaded indexes in front of the on-disk IndexCache, so sessions
+    # asking for the same document share one copy instead of re-reading it. load_fn turns
+    # (index, chunks) into the object kept in memory (e.g. a DocumentIndex with its BM25);
+    # variant separates objects built differently from the same index (e.g. per LLM client).
+
+    def __init__(self, disk=None, max_items=INDEX_MEMORY_CACHE_SIZE):
+        self.disk = disk or get_index_cache()
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, memory_key):
+        with self._lock:
+            value = self._items.get(memory_key)
+            if value is not None:
+                self._items.move_to_end(memory_key)
+        cache_lookup("index_memory", value is not None)
+        return value
+
+    def put(self, key, value, variant=""):
+        memory_key = (key, variant)
+        with self._lock:
+            self._items[memory_key] = value
+            self._items.move_to_end(memory_key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return value
+
+    # From memory, else loaded from disk; None when the index was never built
+    def get(self, key, load_fn=None, variant=""):
+        value = self._lookup((key, variant))
+        if value is None:
+            loaded = self.disk.get(key)
+            if loaded is None:
+                return None
+            value = self.put(key, load_fn(*loaded) if load_fn else loaded, variant)
+        return value
+
+    def get_or_build(self, key, build_fn, load_fn=None, variant=""):
+        value = self._lookup((key, variant))
+        if value is not None:
+            return value
+        # One build per key: concurrent requests for the same document wait for it
+        with self._lock:
+            building = self._building.setdefault(key, threading.Lock())
+        try:
+            with building:
+                with self._lock:
+                    value = self._items.get((key, variant))
+                if value is None:
+                    loaded = self.disk.get_or_build(key, build_fn)
+                    value = self.put(key, load_fn(*loaded) if load_fn else loaded, variant)
+        finally:
+            with self._lock:
+                if self._building.get(key) is building:
+                    del self._building[key]
+        return value
+
+
+@shared_resource
+def get_index_cache():
+    return IndexCache()
+
+
+@shared_resource
+def get_loaded_indexes():
+    return LoadedIndexCache()
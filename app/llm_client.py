@@ -0,0 +1,168 @@
+import contextvars
+import os
+import queue
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from embedding_cache import CachedEmbeddings
+from metrics import active, record_tokens, timed
+from resources import shared_resource
+from response_cache import cached_generate, llm_signature
+from token_utils import count_tokens
+
+LLM_MAX_CONCURRENCY = int(os.getenv("DOCQA_LLM_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = 5
+LLM_BACKOFF_SECONDS = 1.0
+
+
+# One client per (key, model, temperature) so every call reuses the same HTTP connection pool.
+# LangChain's own retries are off: rate limits are retried with backoff in invoke_with_retry.
+# langchain_openai takes over a second to import, so it is only loaded when a client is first needed.
+@shared_resource
+def get_chat_model(openai_key, model="gpt-3.5-turbo", temperature=0.7):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=model, temperature=temperature, openai_api_key=openai_key, max_retries=0)
+
+
+# Completion (instruct) models, e.g. for document QA and the chapter MCQ generator
+@shared_resource
+def get_completion_model(openai_key, model="gpt-3.5-turbo-instruct", temperature=0):
+    from langchain_openai import OpenAI
+
+    return OpenAI(model=model, temperature=temperature, openai_api_key=openai_key)
+
+
+@shared_resource
+def get_embedding_model(openai_key):
+    from langchain_openai import OpenAIEmbeddings
+
+    return CachedEmbeddings(OpenAIEmbeddings(openai_api_key=openai_key))
+
+
+def response_text(response):
+    return response.content if hasattr(response, "content") else str(response)
+
+
+# Latency, tokens and estimated cost of one call (see metrics); tokens are counted only while recording
+def _record_call(span, llm, prompt, text):
+    if active():
+        model = llm_signature(llm)[0]
+        record_tokens(span, model, count_tokens(str(prompt), model), count_tokens(text, model))
+    return text
+
+
+def invoke_with_retry(llm, prompt, retries=LLM_MAX_RETRIES, backoff=LLM_BACKOFF_SECONDS):
+    from openai import RateLimitError
+
+    for attempt in range(retries + 1):
+        try:
+            with timed("llm", model=llm_signature(llm)[0]) as span:
+                return _record_call(span, llm, prompt, response_text(llm.invoke(prompt)))
+        except RateLimitError:
+            if attempt == retries:
+                raise
+            # Exponential backoff with jitter so parallel callers don't retry in lockstep
+            time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+
+
+# llm.batch with the same backoff: only the prompts that hit a rate limit are sent again
+def batch_with_retry(llm, prompts, retries=LLM_MAX_RETRIES, backoff=LLM_BACKOFF_SECONDS):
+    from openai import RateLimitError
+
+    prompts = list(prompts)
+    outputs = [None] * len(prompts)
+    pending = list(range(len(prompts)))
+    model = llm_signature(llm)[0]
+    for attempt in range(retries + 1):
+        limited = []
+        with timed("llm", model=model) as span:
+            results = llm.batch([prompts[i] for i in pending], return_exceptions=True)
+            for i, result in zip(pending, results):
+                if isinstance(result, RateLimitError):
+                    limited.append((i, result))
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    outputs[i] = response_text(result)
+            if active():
+                done = [i for i in pending if outputs[i] is not None]
+                record_tokens(
+                    span, model, sum(count_tokens(prompts[i], model) for i in done),
+                    sum(count_tokens(outputs[i], model) for i in done)
+                )
+        if not limited:
+            return outputs
+        if attempt == retries:
+            raise limited[0][1]
+        pending = [i for i, _ in limited]
+        time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+
+
+# Streams the completion, calling on_token for every piece. A rate limit is only
+# retried before the first token arrives; after that the partial output is already shown.
+def stream_with_retry(llm, prompt, on_token, retries=LLM_MAX_RETRIES, backoff=LLM_BACKOFF_SECONDS):
+    from openai import RateLimitError
+
+    for attempt in range(retries + 1):
+        pieces = []
+        try:
+            with timed("llm", model=llm_signature(llm)[0]) as span:
+                for chunk in llm.stream(prompt):
+                    piece = response_text(chunk)
+                    if piece:
+                        pieces.append(piece)
+                        on_token(piece)
+                return _record_call(span, llm, prompt, "".join(pieces))
+        except RateLimitError:
+            if pieces or attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+
+
+# invoke/stream behind the response cache (see response_cache.cached_generate for bypass).
+# With on_token the completion is streamed; a cache hit arrives as a single piece, passed
+# to on_hit instead when given (so callers can tell a cached answer from a fresh one).
+def cached_invoke(llm, prompt, context_ids=(), bypass=None, on_token=None, on_hit=None):
+    if on_token is None:
+        return cached_generate(llm, prompt, lambda: invoke_with_retry(llm, prompt), context_ids, bypass, on_hit=on_hit)
+    return cached_generate(
+        llm, prompt, lambda: stream_with_retry(llm, prompt, on_token), context_ids, bypass, on_hit=on_hit or on_token
+    )
+
+
+# Runs fn over items on a bounded thread pool and yields (position, result) as each
+# call finishes. Everything reaches the caller on the caller's thread, so it is safe to
+# update the UI. With on_event, fn is called as fn(item, emit) and every emit(payload)
+# from a worker is delivered as on_event(position, payload) before that item's result.
+def map_concurrently(fn, items, max_concurrency=LLM_MAX_CONCURRENCY, on_event=None):
+    items = list(items)
+    if not items:
+        return
+
+    events = queue.Queue()
+
+    def drain():
+        while True:
+            try:
+                position, payload = events.get_nowait()
+            except queue.Empty:
+                return
+            on_event(position, payload)
+
+    # Workers run in a copy of the caller's context, so their spans land in the caller's trace
+    def submit(pool, position, item):
+        if on_event is None:
+            return pool.submit(contextvars.copy_context().run, fn, item)
+        return pool.submit(contextvars.copy_context().run, fn, item, lambda payload: events.put((position, payload)))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items)))) as pool:
+        futures = {submit(pool, i, item): i for i, item in enumerate(items)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.05 if on_event else None, return_when=FIRST_COMPLETED)
+            if on_event:
+                drain()
+            for future in done:
+                yield futures[future], future.result()
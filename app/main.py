@@ -1,68 +1,136 @@
 import os
-import pdfplumber
-import faiss
-import numpy as np
 from dotenv import load_dotenv
 
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, OpenAI
-from langchain_community.vectorstores import FAISS as LangchainFAISS
-from langchain.chains import RetrievalQA
+from ann_index import INDEX_TYPE, build_index
+from chunking import chunk_text, iter_text_chunks
+from config import CHUNK_TOKENS, RETRIEVAL_K
+from embedding_cache import embed_stream
+from hybrid_search import HybridRetriever
+from llm_client import batch_with_retry, get_completion_model, get_embedding_model, invoke_with_retry, stream_with_retry
+from metrics import timed
+from pdf_extraction import PDF_BACKEND, iter_pdf_pages
+from response_cache import answer_key, cached_generate, get_response_cache, lookup_many
 
 # Load environment variables
 load_dotenv()
 
-# Retrieve OpenAI API Key securely
+# Retrieve OpenAI API Key securely (checked on first use, so importing this module never fails)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("Error: OpenAI API Key not found. Please check your .env file.")
-
-# Function to extract text from PDF
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text += extracted + "\n"
-    return text.strip()
-
-# Function to split text into smaller chunks
-def split_text_into_chunks(text, chunk_size=500, overlap=50):
-    text_splitter = CharacterTextSplitter(
-        separator="\n",
-        chunk_size=chunk_size,
-        chunk_overlap=overlap,
-        length_function=len
-    )
-    return text_splitter.split_text(text)
+
+def get_openai_api_key():
+    if not OPENAI_API_KEY:
+        raise ValueError("Error: OpenAI API Key not found. Please check your .env file.")
+    return OPENAI_API_KEY
+
+# Function to extract text from PDF (scanned pages are OCR'd when available; pass a list as
+# stats to get per-page timing and coverage -- see ocr.summarize_pages)
+def extract_text_from_pdf(pdf_path, backend=PDF_BACKEND, stats=None):
+    with timed("extract", backend=backend) as span:
+        pages = [text for _, text in iter_pdf_pages(pdf_path, backend, stats=stats)]
+        span.set(pages=len(pages))
+        return "\n".join(text for text in pages if text).strip()
+
+# Function to split text into smaller chunks (token-sized, along headings and whole MCQs -- see chunking)
+def split_text_into_chunks(text, max_tokens=CHUNK_TOKENS):
+    return chunk_text(text, max_tokens)
+
+# Chunks of a PDF's text, streamed page by page (see chunking.iter_text_chunks)
+def iter_pdf_text_chunks(pdf_path, max_tokens=CHUNK_TOKENS, backend=PDF_BACKEND, stats=None):
+    return iter_text_chunks((text for _, text in iter_pdf_pages(pdf_path, backend, stats=stats)), max_tokens)
+
+# A PDF without a text layer (and no OCR to read it) yields no chunks: there is nothing to index
+class EmptyDocumentError(ValueError):
+    def __init__(self):
+        super().__init__("No text could be extracted from this PDF (scanned pages need OCR).")
 
 # Function to generate embeddings and store in FAISS
-def create_faiss_index(text_chunks, embedding_model):
-    embeddings = embedding_model.embed_documents(text_chunks)
-    dimension = len(embeddings[0])
-    
-    index = faiss.IndexFlatL2(dimension)
-    np_embeddings = np.array(embeddings, dtype=np.float32)
-    index.add(np_embeddings)
+# (exact flat index for small documents, trained ANN index for large corpora -- see ann_index).
+# text_chunks may be a generator: chunks are embedded in batches as they arrive.
+def create_faiss_index(text_chunks, embedding_model, index_type=INDEX_TYPE):
+    text_chunks, np_embeddings = embed_stream(embedding_model, text_chunks)
+    # Raised before anything is built, so an empty index is never cached
+    if not text_chunks:
+        raise EmptyDocumentError()
+    with timed("index_build", index_type=index_type) as span:
+        index = build_index(np_embeddings, index_type)
+        span.set(vectors=len(text_chunks))
 
     return index, text_chunks
 
-# Function to perform question answering using GPT
-def ask_question(question, texts, embedding_model):
-    db = LangchainFAISS.from_texts(texts, embedding_model)
-    retriever = db.as_retriever(search_type="similarity", search_kwargs={"k": 2})
+# Retrieval + QA over one document: the FAISS index is built once and reused for every query.
+# Retrieval is hybrid (BM25 + vectors, see hybrid_search) so exact terms like units and law names are found too.
+class DocumentIndex:
+    def __init__(self, index, text_chunks, embedding_model, llm=None, k=RETRIEVAL_K, reranker=None):
+        from langchain.chains.question_answering.stuff_prompt import PROMPT_SELECTOR
+
+        if not text_chunks:
+            raise EmptyDocumentError()
+        self.index = index
+        self.chunks = text_chunks
+        self.embedding_model = embedding_model
+        self.k = k
+        self.hybrid = HybridRetriever(index, text_chunks, embedding_model, reranker=reranker)
+        self.llm = llm or get_completion_model(get_openai_api_key())
+        self.prompt = PROMPT_SELECTOR.get_prompt(self.llm)
+
+    @classmethod
+    def from_chunks(cls, text_chunks, embedding_model, **kwargs):
+        index, chunk_data = create_faiss_index(text_chunks, embedding_model)
+        return cls(index, chunk_data, embedding_model, **kwargs)
+
+    # LangChain's "stuff" QA prompt, rendered here so it can be streamed and batched
+    def _render_prompt(self, question, chunks):
+        return self.prompt.format(context="\n\n".join(chunks), question=question)
+
+    # Uncached answer to one question from the given chunk texts; on_token streams it
+    def answer(self, question, chunks, on_token=None):
+        prompt = self._render_prompt(question, chunks)
+        if on_token is None:
+            return invoke_with_retry(self.llm, prompt)
+        return stream_with_retry(self.llm, prompt, on_token)
+
+    # Uncached answers to many questions (contexts[i] are question i's chunk texts), as one batch
+    def answer_many(self, questions, contexts):
+        if not questions:
+            return []
+        return batch_with_retry(self.llm, [self._render_prompt(q, chunks) for q, chunks in zip(questions, contexts)])
 
-    llm = OpenAI(openai_api_key=OPENAI_API_KEY, temperature=0)
+    # Answers are cached per (model, question, retrieved chunks); on_token streams the answer
+    def query(self, question, use_cache=True, on_token=None):
+        chunks = self.search_many([question])[0]
+        result = cached_generate(
+            self.llm, question, lambda: self.answer(question, chunks, on_token),
+            bypass=not use_cache, on_hit=on_token, key=answer_key(self.llm, question, chunks)
+        )
+        return {"query": question, "result": result}
 
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        retriever=retriever,
-        return_source_documents=False
-    )
+    # One embeddings request + one index.search for the whole batch of questions
+    def search_many(self, questions, k=None):
+        return [[self.chunks[i] for i, _ in hits] for hits in self.hybrid.search_many(questions, k or self.k)]
 
-    result = qa_chain.invoke(question)
-    return result
+    def query_many(self, questions, use_cache=True):
+        contexts = self.search_many(questions)
+        cache = get_response_cache()
+        keys = [answer_key(self.llm, question, context) for question, context in zip(questions, contexts)]
+        results = lookup_many(keys, cache) if use_cache else [None] * len(keys)
+
+        # Only distinct cache misses go to the LLM, as one batch
+        missing = {}
+        for i, result in enumerate(results):
+            if result is None:
+                missing.setdefault(keys[i], i)
+        outputs = self.answer_many([questions[i] for i in missing.values()], [contexts[i] for i in missing.values()])
+        answers = dict(zip(missing, outputs))
+        for key, answer in answers.items():
+            if use_cache:
+                cache.put(key, answer)
+        results = [answers[key] if result is None else result for key, result in zip(keys, results)]
+
+        return [{"query": question, "result": result} for question, result in zip(questions, results)]
+
+# Function to perform question answering using GPT
+def ask_question(question, document_index):
+    return document_index.query(question)
 
 # Main execution
 if __name__ == "__main__":
@@ -76,11 +144,12 @@ if __name__ == "__main__":
         text_chunks = split_text_into_chunks(extracted_text)
         print(f"Total Chunks Created: {len(text_chunks)}")
 
-        embedding_model = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+        embedding_model = get_embedding_model(get_openai_api_key())
         index, chunk_data = create_faiss_index(text_chunks, embedding_model)
         print("FAISS index created successfully!")
+        document_index = DocumentIndex(index, chunk_data, embedding_model)
 
         # Update your question here
         question = "What is Newton’s third law of motion?"
-        answer = ask_question(question, chunk_data, embedding_model)
+        answer = ask_question(question, document_index)
         print(f"\nQ: {question}\nA: {answer}")
@@ -1,90 +1,71 @@
 import streamlit as st
-from langchain_openai import OpenAI
 from main import extract_text_from_pdf
-import io
-import pandas as pd
-from fpdf import FPDF
+from llm_client import get_completion_model, get_embedding_model
+from metrics import instrument
+from ocr import ocr_warning
+from prompt_budget import build_context
+from mcq_records import JSONL_FORMAT_INSTRUCTIONS, MCQBatch, generate_mcqs
+from pdf_export import create_pdf_download
+from ui_stream import LiveText
 
-def generate_mcqs_from_text(chapter_text, openai_key, num_questions=5):
+MODEL_NAME = "gpt-3.5-turbo-instruct"
+# The instruct model has a 4k context: leave room for the instructions and the answer
+CHAPTER_TOKEN_BUDGET = 2000
+
+@instrument("mcq_generate", generator="chapter")
+def generate_mcqs_from_text(chapter_text, openai_key, num_questions=5, use_cache=True, on_question=None):
+    chapter_context = build_context(chapter_text, CHAPTER_TOKEN_BUDGET, get_embedding_model(openai_key), model=MODEL_NAME)
     prompt = f"""
 You are an AI tutor helping NEET UG aspirants.
 Generate {num_questions} NEET-style MCQs from this chapter:
-{chapter_text[:2000]}
+{chapter_context}
 
 Each must have:
 - 4 options (A to D)
 - Correct answer
 - Difficulty: Easy, Medium, or Hard
 
-Format:
-Q1. <question>
-A. ...
-B. ...
-C. ...
-D. ...
-Answer: <A/B/C/D>
-Difficulty: <Easy/Medium/Hard>
+{JSONL_FORMAT_INSTRUCTIONS}
 """
-    llm = OpenAI(openai_api_key=openai_key, temperature=0.5)
-    return llm.invoke(prompt)
+    llm = get_completion_model(openai_key, MODEL_NAME, 0.5)
+    batch = MCQBatch()
 
-def create_pdf_download(content):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.set_font("Arial", size=12)
-    for line in content.splitlines():
-        pdf.multi_cell(0, 10, line)
-    output = io.BytesIO()
-    output.write(pdf.output(dest='S').encode('latin-1'))
-    output.seek(0)
-    return output
+    def add_question(mcq):
+        batch.append(mcq)
+        if on_question:
+            on_question(len(batch), mcq)
 
-def create_csv_download(content):
-    questions = []
-    current = {}
-    for line in content.splitlines():
-        line = line.strip()
-        if line.startswith("Q") and "." in line:
-            if current:
-                questions.append(current)
-            current = {"question": line}
-        elif line.startswith("A."):
-            current["option_a"] = line[2:].strip()
-        elif line.startswith("B."):
-            current["option_b"] = line[2:].strip()
-        elif line.startswith("C."):
-            current["option_c"] = line[2:].strip()
-        elif line.startswith("D."):
-            current["option_d"] = line[2:].strip()
-        elif line.startswith("Answer:"):
-            current["answer"] = line.replace("Answer:", "").strip()
-        elif line.startswith("Difficulty:"):
-            current["difficulty"] = line.replace("Difficulty:", "").strip()
-    if current:
-        questions.append(current)
-    df = pd.DataFrame(questions)
-    output = io.BytesIO()
-    df.to_csv(output, index=False)
-    output.seek(0)
-    return output
+    # Same chapter context + same count => same request, so serve it from the cache unless asked not to
+    generate_mcqs(llm, prompt, bypass=not use_cache, on_record=add_question, num_questions=num_questions)
+    return batch
 
 def show_mcq_generator_tab(openai_key):
     st.header("📝 Generate NEET-style MCQs")
 
     chapter_pdf = st.file_uploader("📄 Upload Chapter PDF", type="pdf", key="mcq_chapter_pdf")
     num_questions = st.selectbox("📌 Number of MCQs to generate", options=[3, 5, 10], index=1)
+    use_cache = st.checkbox("♻️ Reuse earlier results for identical requests (untick for fresh questions)", value=True, key="mcq_use_cache")
 
     if chapter_pdf:
         if st.button("🧠 Generate MCQs"):
             with st.spinner("Generating questions..."):
-                chapter_text = extract_text_from_pdf(chapter_pdf)
-                result = generate_mcqs_from_text(chapter_text, openai_key, num_questions)
-
-                st.success(f"Here are {num_questions} NEET-style MCQs with difficulty tags:")
-                st.markdown(f"""```text\n{result}```""")
+                page_stats = []
+                chapter_text = extract_text_from_pdf(chapter_pdf, stats=page_stats)
+                warning = ocr_warning(page_stats)
+                if warning:
+                    st.warning(f"⚠️ {warning}")
+                # Filled in once generation is done, with the number actually generated
+                status = st.empty()
+                live = LiveText(st.empty(), min_interval=0)
+                batch = generate_mcqs_from_text(
+                    chapter_text, openai_key, num_questions, use_cache=use_cache,
+                    on_question=lambda number, mcq: live.append(mcq.to_text(number) + "\n\n")
+                )
+                live.placeholder.markdown(f"""```text\n{batch.to_text()}```""")
+                status.success(f"Here are {len(batch)} NEET-style MCQs with difficulty tags:")
 
-                st.download_button("⬇️ Download as PDF", create_pdf_download(result), file_name="mcqs.pdf")
-                st.download_button("⬇️ Download as CSV", create_csv_download(result), file_name="mcqs.csv")
+                st.download_button("⬇️ Download as PDF", create_pdf_download(batch), file_name="mcqs.pdf")
+                st.download_button("⬇️ Download as CSV", batch.to_csv(), file_name="mcqs.csv")
+                st.download_button("⬇️ Download as Parquet", batch.to_parquet(), file_name="mcqs.parquet")
     else:
         st.info("Please upload a chapter PDF to generate MCQs.")
@@ -0,0 +1,307 @@
+import csv
+import io
+import json
+import os
+import re
+from dataclasses import asdict, dataclass
+
+from llm_client import cached_invoke, invoke_with_retry, map_concurrently, response_text
+from response_cache import llm_signature
+from token_utils import count_tokens
+
+# Malformed items are re-requested one by one, up to this many per generation
+MCQ_MAX_REPAIRS = int(os.getenv("DOCQA_MCQ_MAX_REPAIRS", "10"))
+# Completion tokens per generated MCQ (one JSON line is ~80), plus slack for the whole answer
+MCQ_COMPLETION_TOKENS = 90
+MCQ_COMPLETION_MARGIN = 100
+# Prompt + completion limit of the models whose window a full answer could overflow
+MODEL_CONTEXT_TOKENS = {"gpt-3.5-turbo-instruct": 4096}
+
+LETTERS = "ABCD"
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+COLUMNS = ("chapter", "question", "option_a", "option_b", "option_c", "option_d", "answer", "difficulty")
+
+# Shared by every generator prompt. One object per line keeps the output streamable.
+JSONL_FORMAT_INSTRUCTIONS = """Output format: JSON Lines. One JSON object per line, one line per question,
+with no numbering, no code fences and no other text:
+{"question": "<question text>", "options": ["<A>", "<B>", "<C>", "<D>"], "answer": "<A/B/C/D>", "difficulty": "<Easy/Medium/Hard>"}"""
+
+REPAIR_PROMPT = """Rewrite the following multiple-choice question as exactly one JSON object on a single line,
+with the keys "question", "options" (a list of 4 strings), "answer" (A, B, C or D) and "difficulty"
+(Easy, Medium or Hard). Output only the JSON object.
+
+{item}"""
+
+QUESTION_PREFIX = re.compile(r"^\s*(?:\[Chapter:[^\]]*\]\s*)?(?:Q(?:uestion)?\.?\s*)?\d{1,3}\s*[.):]\s*", re.IGNORECASE)
+OPTION_PREFIX = re.compile(r"^\s*\(?([A-Da-d])[.):]\s*")
+ANSWER_LETTER = re.compile(r"^\s*(?:option\s*)?\(?([A-Da-d])\b\)?")
+TEXT_OPTION_LINE = re.compile(r"^\s*\(?([A-D])[.)]\s*(.*)$")
+TEXT_META_LINE = re.compile(r"^\s*(answer|correct answer|difficulty)\s*:\s*(.*)$", re.IGNORECASE)
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+@dataclass(slots=True, frozen=True)
+class MCQ:
+    question: str
+    options: tuple
+    answer: str
+    difficulty: str = "Medium"
+    chapter: str = ""
+
+    def to_text(self, number=None):
+        lines = [f"Q{number}. {self.question}" if number is not None else self.question]
+        lines += [f"{letter}. {option}" for letter, option in zip(LETTERS, self.options)]
+        lines += [f"Answer: {self.answer}", f"Difficulty: {self.difficulty}"]
+        return "\n".join(lines)
+
+
+def _clean_option(option):
+    return OPTION_PREFIX.sub("", str(option)).strip()
+
+
+def _normalize_answer(answer, options):
+    answer = str(answer).strip()
+    # The option text itself instead of its letter
+    for letter, option in zip(LETTERS, options):
+        if answer.lower() == option.lower():
+            return letter
+    match = ANSWER_LETTER.match(answer)
+    return match.group(1).upper() if match else None
+
+
+def _normalize_difficulty(difficulty):
+    difficulty = str(difficulty or "").strip().capitalize()
+    return difficulty if difficulty in DIFFICULTIES else "Medium"
+
+
+# Validate a decoded object into an MCQ, fixing the usual drift (option dicts,
+# "B) ..." answers, numbered questions, lowercase difficulty). None if unusable.
+def mcq_from_dict(data, chapter=""):
+    if not isinstance(data, dict):
+        return None
+    data = {str(key).lower(): value for key, value in data.items()}
+    question = QUESTION_PREFIX.sub("", str(data.get("question") or data.get("stem") or "")).strip()
+    options = data.get("options") or data.get("choices")
+    if isinstance(options, dict):
+        options = [options.get(letter, options.get(letter.lower())) for letter in LETTERS]
+    elif options is None:
+        options = [data.get(f"option_{letter.lower()}") for letter in LETTERS]
+    if not question or not isinstance(options, list) or len(options) != 4 or not all(options):
+        return None
+    options = tuple(_clean_option(option) for option in options)
+    answer = _normalize_answer(data.get("answer", data.get("correct_answer", "")), options)
+    if answer is None:
+        return None
+    return MCQ(question, options, answer, _normalize_difficulty(data.get("difficulty")), chapter or str(data.get("chapter") or ""))
+
+
+# The older "Q1. / A. ... D. / Answer: / Difficulty:" text format, for when the model ignores the JSON instructions
+def mcq_from_text(block, chapter=""):
+    question_lines, options, meta = [], {}, {}
+    for line in block.strip().splitlines():
+        option = TEXT_OPTION_LINE.match(line)
+        meta_line = TEXT_META_LINE.match(line)
+        if meta_line:
+            meta[meta_line.group(1).lower().replace("correct ", "")] = meta_line.group(2)
+        elif option and not options.get(option.group(1)):
+            options[option.group(1)] = option.group(2)
+        elif not options:
+            question_lines.append(line)
+    return mcq_from_dict(
+        {"question": " ".join(question_lines), "options": [options.get(letter) for letter in LETTERS], **meta},
+        chapter,
+    )
+
+
+def parse_item(item, chapter=""):
+    item = item.strip()
+    if not item.startswith("{"):
+        return mcq_from_text(item, chapter)
+    item = item[:item.rfind("}") + 1]
+    for candidate in (item, TRAILING_COMMA.sub(r"\1", item)):
+        try:
+            return mcq_from_dict(json.loads(candidate), chapter)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+# Route one line of model output: a JSON line is an item of its own, text lines
+# collect into a block that a blank line closes. Code fences and list markers are dropped.
+def _route_line(line, block, items):
+    stripped = line.strip().lstrip("-*").strip()
+    if not stripped or stripped.startswith("```") or stripped.startswith("{"):
+        if block:
+            items.append("\n".join(block))
+            block.clear()
+        if stripped.startswith("{"):
+            items.append(stripped)
+    else:
+        block.append(line)
+
+
+def split_items(text):
+    items, block = [], []
+    for line in text.splitlines():
+        _route_line(line, block, items)
+    if block:
+        items.append("\n".join(block))
+    return items
+
+
+# Ask the model to fix each malformed item on its own instead of regenerating everything
+def repair_items(llm, items, chapter="", max_repairs=MCQ_MAX_REPAIRS):
+    def repair(item):
+        reply = response_text(invoke_with_retry(llm, REPAIR_PROMPT.format(item=item)))
+        return next(filter(None, (parse_item(i, chapter) for i in split_items(reply))), None)
+
+    repaired = [None] * len(items[:max_repairs])
+    for i, record in map_concurrently(repair, items[:max_repairs]):
+        repaired[i] = record
+    return [record for record in repaired if record is not None]
+
+
+class MCQLineParser:
+    # Incremental version of split_items + parse_item: feed tokens, get back each
+    # question as soon as its line (or text block) is complete
+
+    def __init__(self, chapter=""):
+        self.chapter = chapter
+        self.malformed = []
+        self._buffer = ""
+        self._block = []
+
+    def _take(self, items):
+        records = []
+        for item in items:
+            record = parse_item(item, self.chapter)
+            if record is not None:
+                records.append(record)
+            elif len(item) > 20:  # stray prose lines are not worth a repair request
+                self.malformed.append(item)
+        return records
+
+    def feed(self, piece):
+        self._buffer += piece
+        if "\n" not in self._buffer:
+            return []
+        complete, self._buffer = self._buffer.rsplit("\n", 1)
+        items = []
+        for line in complete.split("\n"):
+            _route_line(line, self._block, items)
+        return self._take(items)
+
+    def close(self):
+        items = []
+        _route_line(self._buffer, self._block, items)
+        if self._block:
+            items.append("\n".join(self._block))
+        self._buffer, self._block = "", []
+        return self._take(items)
+
+
+# Returns (records, malformed raw items)
+def parse_mcq_output(text, chapter=""):
+    parser = MCQLineParser(chapter)
+    records = parser.feed(text) + parser.close()
+    return records, parser.malformed
+
+
+# Completion budget for a prompt asking for num_questions MCQs, within what the model's
+# context window leaves after the prompt
+def mcq_max_tokens(llm, prompt, num_questions):
+    model = llm_signature(llm)[0]
+    wanted = num_questions * MCQ_COMPLETION_TOKENS + MCQ_COMPLETION_MARGIN
+    window = MODEL_CONTEXT_TOKENS.get(model)
+    if window:
+        wanted = min(wanted, window - count_tokens(prompt, model))
+    return max(wanted, MCQ_COMPLETION_TOKENS)
+
+
+# Stream one generation into MCQ records. on_record(mcq) fires as each question
+# completes; malformed items are repaired once the stream ends. bypass as in cached_invoke.
+# num_questions sizes max_tokens for the answer: completion models otherwise stop at 256
+# tokens, i.e. after about three questions. on_cache_hit() fires before the records of an
+# answer served from the response cache.
+def generate_mcqs(llm, prompt, bypass=None, chapter="", on_record=None, num_questions=None, on_cache_hit=None):
+    parser = MCQLineParser(chapter)
+    records = []
+
+    def take(new_records):
+        for mcq in new_records:
+            records.append(mcq)
+            if on_record:
+                on_record(mcq)
+
+    generator = llm.bind(max_tokens=mcq_max_tokens(llm, prompt, num_questions)) if num_questions else llm
+    feed = lambda piece: take(parser.feed(piece))
+
+    def cache_hit(text):
+        if on_cache_hit:
+            on_cache_hit()
+        feed(text)
+
+    cached_invoke(generator, prompt, bypass=bypass, on_token=feed, on_hit=cache_hit)
+    take(parser.close())
+    take(repair_items(llm, parser.malformed, chapter))
+    return records
+
+
+class MCQBatch:
+    # Column-oriented MCQ collection: exports go straight from the columns,
+    # nothing is re-parsed from text
+
+    __slots__ = ("columns",)
+
+    def __init__(self, records=()):
+        self.columns = {name: [] for name in COLUMNS}
+        self.extend(records)
+
+    def append(self, mcq):
+        row = (mcq.chapter, mcq.question, *mcq.options, mcq.answer, mcq.difficulty)
+        for name, value in zip(COLUMNS, row):
+            self.columns[name].append(value)
+
+    def extend(self, records):
+        for mcq in records:
+            self.append(mcq)
+
+    def __len__(self):
+        return len(self.columns["question"])
+
+    def __iter__(self):
+        for chapter, question, a, b, c, d, answer, difficulty in zip(*self.columns.values()):
+            yield MCQ(question, (a, b, c, d), answer, difficulty, chapter)
+
+    def to_text(self):
+        return "\n\n".join(
+            (f"[Chapter: {mcq.chapter}]\n" if mcq.chapter else "") + mcq.to_text(i)
+            for i, mcq in enumerate(self, start=1)
+        )
+
+    def to_dicts(self):
+        return [asdict(mcq) for mcq in self]
+
+    def to_csv(self):
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(COLUMNS)
+        writer.writerows(zip(*self.columns.values()))
+        return io.BytesIO(text.getvalue().encode("utf-8"))
+
+    def to_arrow(self):
+        import pyarrow as pa
+
+        table = pa.table(self.columns)
+        # Few distinct values: dictionary-encode them
+        for name in ("chapter", "answer", "difficulty"):
+            table = table.set_column(table.schema.get_field_index(name), name, table[name].dictionary_encode())
+        return table
+
+    def to_parquet(self):
+        import pyarrow.parquet as pq
+
+        output = io.BytesIO()
+        pq.write_table(self.to_arrow(), output)
+        output.seek(0)
+        return output
@@ -0,0 +1,275 @@
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Process-wide metrics (Prometheus text via render_prometheus, JSON lines via DOCQA_METRICS_LOG).
+# With DOCQA_METRICS=0 and no trace open, timed() is a shared no-op and decorated functions
+# cost one ContextVar lookup.
+METRICS_ENABLED = os.getenv("DOCQA_METRICS", "1") != "0"
+# File to append one JSON object per span / request to ("-" for stderr)
+METRICS_LOG = os.getenv("DOCQA_METRICS_LOG", "")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# USD per 1K tokens as (prompt, completion); override with DOCQA_MODEL_PRICES='{"model": [0.001, 0.002]}'
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-3.5-turbo-instruct": (0.0015, 0.002),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "text-embedding-ada-002": (0.0001, 0.0),
+    "text-embedding-3-small": (0.00002, 0.0),
+    "text-embedding-3-large": (0.00013, 0.0),
+}
+MODEL_PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("DOCQA_MODEL_PRICES", "{}")).items()})
+
+# Spans of the request being traced (a list), and labels added to everything recorded inside it
+_trace = contextvars.ContextVar("docqa_trace", default=None)
+_labels = contextvars.ContextVar("docqa_labels", default=())
+
+
+def active():
+    return METRICS_ENABLED or _trace.get() is not None
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens=0):
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    # Counters and histograms keyed by (name, sorted label pairs)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def counter_total(self, name, **labels):
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(v for (n, key), v in self.counters.items() if n == name and wanted <= set(key))
+
+    # Hit rate per cache, from docqa_cache_requests_total
+    def cache_hit_rates(self):
+        totals = {}
+        with self._lock:
+            for (name, key), value in self.counters.items():
+                if name != "docqa_cache_requests_total":
+                    continue
+                labels = dict(key)
+                hits, lookups = totals.get(labels["cache"], (0, 0))
+                totals[labels["cache"]] = (hits + value * (labels["result"] == "hit"), lookups + value)
+        return {cache: hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+    def render_prometheus(self):
+        def label_text(key, extra=()):
+            pairs = list(key) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (n, key), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{label_text(key)} {value}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, key), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{label_text(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{label_text(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{label_text(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+@functools.lru_cache(maxsize=None)
+def _json_logger():
+    logger = logging.getLogger("docqa.metrics")
+    logger.propagate = False
+    handler = logging.StreamHandler() if METRICS_LOG == "-" else logging.FileHandler(METRICS_LOG, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def log_event(event, **fields):
+    if METRICS_LOG:
+        _json_logger().info(json.dumps({"ts": time.time(), "event": event, **fields}, default=str))
+
+
+class _Span:
+    __slots__ = ("stage", "labels", "attrs", "start")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = {**dict(_labels.get()), **labels}
+        self.attrs = {}
+
+    # Numbers about this call (pages, chunks, tokens...): kept in the trace and the JSON log
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        if METRICS_ENABLED:
+            registry.observe("docqa_stage_seconds", seconds, stage=self.stage, **self.labels)
+        record = {"stage": self.stage, "seconds": seconds, **self.labels, **self.attrs}
+        spans = _trace.get()
+        if spans is not None:
+            spans.append(record)
+        log_event("span", **record)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+# with timed("embed", model=name) as span: ...; span.set(texts=12)
+def timed(stage, **labels):
+    return _Span(stage, labels) if active() else _NO_SPAN
+
+
+# Decorator form of timed(); its labels also apply to everything recorded inside the call,
+# e.g. @instrument("mcq_generate", generator="chapter") labels that generator's LLM tokens
+def instrument(stage, **labels):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED and _trace.get() is None:
+                return fn(*args, **kwargs)
+            with labelled(**labels), _Span(stage, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, value=1, **labels):
+    if METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def cache_lookup(cache, hit, value=1):
+    if METRICS_ENABLED and value:
+        registry.inc("docqa_cache_requests_total", value, cache=cache, result="hit" if hit else "miss")
+
+
+# Tokens and estimated cost of one model call (cached answers cost nothing)
+def record_tokens(span, model, prompt_tokens, completion_tokens=0):
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    span.set(model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cost_usd=cost)
+    if METRICS_ENABLED:
+        labels = {"model": model, **dict(_labels.get())}
+        registry.inc("docqa_llm_tokens_total", prompt_tokens, kind="prompt", **labels)
+        if completion_tokens:
+            registry.inc("docqa_llm_tokens_total", completion_tokens, kind="completion", **labels)
+        registry.inc("docqa_llm_cost_usd_total", cost, **labels)
+
+
+# Adds labels (e.g. generator="past_papers") to everything recorded inside the block
+@contextmanager
+def labelled(**labels):
+    token = _labels.set(tuple({**dict(_labels.get()), **labels}.items()))
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+# Collects every span recorded inside the block (this thread, and worker threads started
+# with a copy of the context) into the yielded list; enabled=False yields None
+@contextmanager
+def trace(enabled=True):
+    if not enabled:
+        yield None
+        return
+    spans = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+def summarize_trace(spans):
+    stages = {}
+    for span in spans:
+        seconds, calls = stages.get(span["stage"], (0.0, 0))
+        stages[span["stage"]] = (seconds + span["seconds"], calls + 1)
+    return {
+        "stages": {stage: {"seconds": seconds, "calls": calls} for stage, (seconds, calls) in stages.items()},
+        "prompt_tokens": sum(span.get("prompt_tokens", 0) for span in spans),
+        "completion_tokens": sum(span.get("completion_tokens", 0) for span in spans),
+        "cost_usd": sum(span.get("cost_usd", 0.0) for span in spans),
+    }
+
+
+def render_prometheus():
+    return registry.render_prometheus()
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+import pypdfium2 as pdfium
+
+from config import cache_dir
+from resources import shared_resource
+
+try:
+    import pytesseract
+except ImportError:  # OCR is optional: scanned pages then stay empty
+    pytesseract = None
+
+# "auto" uses OCR when pytesseract and the tesseract binary are installed, "off" never does
+OCR_MODE = os.getenv("DOCQA_OCR", "auto")
+OCR_DPI = int(os.getenv("DOCQA_OCR_DPI", "300"))
+OCR_LANG = os.getenv("DOCQA_OCR_LANG", "eng")
+# A page with fewer visible characters than this has no usable text layer
+OCR_MIN_CHARS = int(os.getenv("DOCQA_OCR_MIN_CHARS", "20"))
+OCR_WORKERS = int(os.getenv("DOCQA_OCR_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def needs_ocr(text):
+    return sum(not c.isspace() for c in text) < OCR_MIN_CHARS
+
+
+@lru_cache(maxsize=None)
+def engine_version():
+    if OCR_MODE == "off" or pytesseract is None:
+        return None
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except (pytesseract.TesseractNotFoundError, OSError):
+        return None
+
+
+def ocr_available():
+    return engine_version() is not None
+
+
+class OCRStore:
+    # Persistent page-image-hash -> OCR text map backed by SQLite (shared by all worker processes)
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir("ocr"), "ocr.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, text TEXT NOT NULL, seconds REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM pages WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, text, seconds):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO pages (key, text, seconds) VALUES (?, ?, ?)", (key, text, seconds))
+            self._conn.commit()
+
+
+@shared_resource
+def get_ocr_store():
+    return OCRStore()
+
+
+def render_page(path, index, dpi=OCR_DPI):
+    pdf = pdfium.PdfDocument(path)
+    try:
+        page = pdf[index]
+        image = page.render(scale=dpi / 72, grayscale=True).to_pil()
+        page.close()
+        return image
+    finally:
+        pdf.close()
+
+
+# Key = the rendered pixels, so the same scanned page is recognised inside any PDF
+def page_key(image, lang=OCR_LANG):
+    digest = hashlib.sha256(image.tobytes())
+    digest.update(f"{image.size}:{image.mode}:{lang}:{engine_version()}".encode())
+    return digest.hexdigest()
+
+
+# Runs inside a worker process: OCR one page (0-based index), returns (text, seconds, from_cache)
+def ocr_page(path, index, dpi=OCR_DPI, lang=OCR_LANG):
+    start = time.perf_counter()
+    image = render_page(path, index, dpi)
+    key = page_key(image, lang)
+    store = get_ocr_store()
+    text = store.get(key)
+    if text is not None:
+        return text, time.perf_counter() - start, True
+
+    text = pytesseract.image_to_string(image, lang=lang)
+    seconds = time.perf_counter() - start
+    store.put(key, text, seconds)
+    return text, seconds, False
+
+
+# Coverage of a per-page stats list collected by iter_pdf_pages
+def summarize_pages(stats):
+    by_source = {source: [s for s in stats if s["source"] == source] for source in ("text", "ocr", "ocr_cache", "empty")}
+    pages = len(stats)
+    return {
+        "pages": pages,
+        "text_pages": len(by_source["text"]),
+        "ocr_pages": len(by_source["ocr"]) + len(by_source["ocr_cache"]),
+        "ocr_cached": len(by_source["ocr_cache"]),
+        "empty_pages": len(by_source["empty"]),
+        "coverage": (pages - len(by_source["empty"])) / pages if pages else 1.0,
+        "ocr_available": ocr_available(),
+        "text_seconds": sum(s["seconds"] for s in by_source["text"]),
+        "ocr_seconds": sum(s["seconds"] for s in by_source["ocr"] + by_source["ocr_cache"]),
+    }
+
+
+def describe_coverage(stats):
+    summary = summarize_pages(stats)
+    message = f"{summary['pages']} pages: {summary['text_pages']} with text"
+    if summary["ocr_pages"]:
+        message += (
+            f", {summary['ocr_pages']} OCR'd ({summary['ocr_cached']} from cache, "
+            f"{summary['ocr_seconds']:.1f}s)"
+        )
+    if summary["empty_pages"]:
+        message += f", {summary['empty_pages']} unreadable"
+    return message
+
+
+# Shown as a UI warning when scanned pages came back empty because OCR can't run here
+def ocr_warning(stats):
+    empty = summarize_pages(stats)["empty_pages"]
+    if not empty or ocr_available():
+        return None
+    if OCR_MODE == "off":
+        reason = "OCR is switched off (DOCQA_OCR=off)"
+    else:
+        reason = "OCR is unavailable: install pytesseract and the tesseract-ocr binary"
+    return f"{empty} scanned page(s) have no text layer and were skipped; {reason}."
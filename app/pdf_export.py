@@ -0,0 +1,179 @@
+import io
+import os
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from mcq_records import LETTERS
+from resources import shared_resource
+
+# DejaVu covers Greek, μ, arrows, sub/superscripts... Set DOCQA_PDF_FONT to use another TTF.
+PDF_FONT_PATH = os.getenv("DOCQA_PDF_FONT")
+FONT_SEARCH_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/Library/Fonts/DejaVuSans.ttf",
+    "C:/Windows/Fonts/DejaVuSans.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+]
+
+PAGE_SIZE = A4
+MARGIN = 40
+COLUMN_GAP = 20
+FONT_SIZE = 9.5
+LINE_HEIGHT = 12
+BLOCK_GAP = 8
+KEY_COLUMNS = 8
+
+
+def _bold_variant(path):
+    root, ext = os.path.splitext(path)
+    for candidate in (f"{root}-Bold{ext}", f"{root}bd{ext}"):
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+# Registered once per process: parsing and subsetting a TTF is the slow part of a small export
+@shared_resource
+def get_fonts():
+    candidates = [PDF_FONT_PATH] if PDF_FONT_PATH else []
+    candidates += FONT_SEARCH_PATHS
+    path = next((p for p in candidates if p and os.path.exists(p)), None)
+    if path is None:
+        # Bundled with reportlab: Unicode, but without Greek
+        import reportlab
+
+        path = os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+    pdfmetrics.registerFont(TTFont("DocQA", path))
+    pdfmetrics.registerFont(TTFont("DocQA-Bold", _bold_variant(path)))
+    return "DocQA", "DocQA-Bold"
+
+
+class MCQPaper:
+    # Two-column question paper written straight into a reportlab canvas. Questions
+    # are laid out as they arrive; only the answer letters are kept for the final key.
+
+    def __init__(self, output, title="NEET MCQs"):
+        self.font, self.bold = get_fonts()
+        face = pdfmetrics.getFont(self.font).face
+        self._char_widths, self._default_width = face.charWidths, face.defaultWidth
+        self.canvas = canvas.Canvas(output, pagesize=PAGE_SIZE, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.title = title
+        self.width, self.height = PAGE_SIZE
+        self.column_width = (self.width - 2 * MARGIN - COLUMN_GAP) / 2
+        self.answers = []
+        self._chapter = None
+        self._page = 0
+        self._new_page()
+
+    def _new_page(self):
+        if self._page:
+            self.canvas.showPage()
+        self._page += 1
+        self.canvas.setFont(self.font, 8)
+        self.canvas.drawCentredString(self.width / 2, MARGIN / 2, str(self._page))
+        top = self.height - MARGIN
+        if self._page == 1:
+            self.canvas.setFont(self.bold, 14)
+            self.canvas.drawString(MARGIN, top - 14, self.title)
+            top -= 30
+        self._top = top
+        self._column = 0
+        self._y = top
+
+    def _next_column(self):
+        if self._column == 0:
+            self._column = 1
+            self._y = self._top
+        else:
+            self._new_page()
+
+    def _draw(self, lines, font=None):
+        # A block moves to the next column when it doesn't fit; only a block taller
+        # than a whole column is split
+        if self._y - len(lines) * LINE_HEIGHT < MARGIN and self._y != self._top:
+            self._next_column()
+        while lines:
+            fits = max(1, int((self._y - MARGIN) // LINE_HEIGHT))
+            text = self.canvas.beginText(MARGIN + self._column * (self.column_width + COLUMN_GAP), self._y - FONT_SIZE)
+            text.setFont(font or self.font, FONT_SIZE, LINE_HEIGHT)
+            for line in lines[:fits]:
+                text.textLine(line)
+            self.canvas.drawText(text)
+            self._y -= len(lines[:fits]) * LINE_HEIGHT + BLOCK_GAP
+            lines = lines[fits:]
+            if lines:
+                self._next_column()
+
+    def _width(self, text):
+        return sum(self._char_widths.get(ord(ch), self._default_width) for ch in text) * FONT_SIZE / 1000
+
+    # Greedy word wrap on the font's glyph widths (simpleSplit re-measures every word through pdfmetrics)
+    def _wrap(self, text, indent=""):
+        width = self.column_width - self._width(indent)
+        space = self._width(" ")
+        lines, line, line_width = [], [], 0.0
+        for word in text.split():
+            word_width = self._width(word)
+            if line and line_width + space + word_width > width:
+                lines.append(indent + " ".join(line))
+                line, line_width = [], 0.0
+            line_width += word_width + (space if line else 0.0)
+            line.append(word)
+        lines.append(indent + " ".join(line))
+        return lines
+
+    def add(self, mcq):
+        if mcq.chapter and mcq.chapter != self._chapter:
+            self._chapter = mcq.chapter
+            self._draw([mcq.chapter], self.bold)
+        number = len(self.answers) + 1
+        lines = self._wrap(f"Q{number}. {mcq.question}")
+        for letter, option in zip(LETTERS, mcq.options):
+            lines += self._wrap(f"({letter}) {option}", "    ")
+        lines.append(f"    [{mcq.difficulty}]")
+        self._draw(lines)
+        self.answers.append(mcq.answer)
+
+    def _answer_key(self):
+        self._new_page()
+        self.canvas.setFont(self.bold, 12)
+        self.canvas.drawString(MARGIN, self._y - 12, "Answer Key")
+        self.canvas.setFont(self.font, FONT_SIZE)
+        cell = (self.width - 2 * MARGIN) / KEY_COLUMNS
+        y = self._y - 32
+        for start in range(0, len(self.answers), KEY_COLUMNS):
+            if y < MARGIN:
+                self._new_page()
+                self.canvas.setFont(self.font, FONT_SIZE)
+                y = self._y - FONT_SIZE
+            for i, answer in enumerate(self.answers[start:start + KEY_COLUMNS]):
+                self.canvas.drawString(MARGIN + i * cell, y, f"{start + i + 1}. {answer}")
+            y -= LINE_HEIGHT
+
+    def close(self, answer_key=True):
+        if answer_key and self.answers:
+            self._answer_key()
+        self.canvas.save()
+
+
+# Write any iterable of MCQ records (e.g. an MCQBatch, or a generator for very large
+# papers) to output, a path or binary file object
+def write_mcq_pdf(mcqs, output, title="NEET MCQs", answer_key=True):
+    paper = MCQPaper(output, title)
+    for mcq in mcqs:
+        paper.add(mcq)
+    paper.close(answer_key)
+    return len(paper.answers)
+
+
+def create_pdf_download(mcqs, title="NEET MCQs", answer_key=True):
+    buffer = io.BytesIO()
+    write_mcq_pdf(mcqs, buffer, title, answer_key)
+    buffer.seek(0)
+    return buffer
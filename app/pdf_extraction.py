@@ -0,0 +1,266 @@
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from itertools import islice
+
+import pypdfium2 as pdfium
+
+from metrics import cache_lookup, count
+from ocr import OCR_WORKERS, needs_ocr, ocr_available, ocr_page
+from resources import shared_resource
+
+# "pdfplumber" keeps the old layout-aware output; "pypdfium2" / "pypdf" are much faster
+PDF_BACKEND = os.getenv("DOCQA_PDF_BACKEND", "pdfplumber")
+PAGES_PER_TASK = 16
+# Below this a process pool costs more than it saves
+PARALLEL_MIN_PAGES = 48
+MAX_WORKERS = int(os.getenv("DOCQA_PDF_WORKERS", "0")) or os.cpu_count() or 1
+# Scanned pages waiting for OCR before the reader blocks on the oldest one
+OCR_MAX_PENDING = 64
+
+
+# Workers open the PDF by path, so uploads (file-like objects / bytes) are spilled to a temp file
+@contextmanager
+def _as_path(source):
+    if isinstance(source, (str, os.PathLike)):
+        yield os.fspath(source)
+        return
+
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    elif hasattr(source, "getvalue"):
+        data = source.getvalue()
+    else:
+        position = source.tell()
+        data = source.read()
+        source.seek(position)
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        yield path
+    finally:
+        os.remove(path)
+
+
+# One long-lived pool per worker count for the whole process. Workers are spawned, not
+# forked: forking the Streamlit / API server copies its threads' locks into the children.
+@shared_resource
+def get_process_pool(max_workers):
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+# A worker that died (e.g. killed for memory) breaks its pool for good: build a new one next time
+@contextmanager
+def _pool_guard():
+    try:
+        yield
+    except BrokenProcessPool:
+        get_process_pool.cache_clear()
+        raise
+
+
+def count_pages(path):
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+# Fast backends lose text on some pages (odd encodings, rotated/complex layout)
+def _needs_layout_fallback(text):
+    return not text.strip() or "�" in text
+
+
+def _extract_with_pdfplumber(path, page_numbers):
+    import pdfplumber
+
+    texts = {}
+    with pdfplumber.open(path) as pdf:
+        for i in page_numbers:
+            page = pdf.pages[i]
+            texts[i] = page.extract_text() or ""
+            page.close()
+    return texts
+
+
+def _extract_with_pdfium(path, page_numbers):
+    texts = {}
+    pdf = pdfium.PdfDocument(path)
+    try:
+        for i in page_numbers:
+            page = pdf[i]
+            textpage = page.get_textpage()
+            texts[i] = textpage.get_text_bounded().replace("\r\n", "\n")
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return texts
+
+
+def _extract_with_pypdf(path, page_numbers):
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return {i: reader.pages[i].extract_text() or "" for i in page_numbers}
+
+
+BACKENDS = {
+    "pdfplumber": _extract_with_pdfplumber,
+    "pypdfium2": _extract_with_pdfium,
+    "pypdf": _extract_with_pypdf,
+}
+
+
+# Runs inside a worker process: extract pages [start, stop) and return them in order
+def extract_page_range(path, start, stop, backend=PDF_BACKEND):
+    page_numbers = range(start, stop)
+    texts = BACKENDS[backend](path, page_numbers)
+
+    if backend != "pdfplumber":
+        fallback = [i for i in page_numbers if _needs_layout_fallback(texts[i])]
+        if fallback:
+            texts.update(_extract_with_pdfplumber(path, fallback))
+
+    return [(i + 1, texts[i]) for i in page_numbers]
+
+
+# Runs inside a worker process: the text lines of pages [start, stop) as
+# (text, font size, bold) so chunking can tell headings from body text
+def extract_layout_range(path, start, stop):
+    import pdfplumber
+
+    pages = []
+    with pdfplumber.open(path) as pdf:
+        for i in range(start, stop):
+            page = pdf.pages[i]
+            lines = []
+            for line in page.extract_text_lines(return_chars=True, strip=True):
+                chars = [c for c in line["chars"] if c["text"].strip()]
+                if not chars:
+                    continue
+                size = statistics.median(c["size"] for c in chars)
+                bold = sum("Bold" in c["fontname"] or "Black" in c["fontname"] for c in chars) * 2 > len(chars)
+                lines.append((line["text"], round(size, 1), bold))
+            pages.append((i + 1, lines))
+            page.close()
+    return pages
+
+
+# Runs inside a worker process: fn over pages [start, stop) as (page_no, item, seconds),
+# seconds being the range's extraction time spread evenly over its pages
+def _timed_range(fn, path, start, stop, *args):
+    began = time.perf_counter()
+    items = fn(path, start, stop, *args)
+    seconds = (time.perf_counter() - began) / max(stop - start, 1)
+    return [(page_no, item, seconds) for page_no, item in items]
+
+
+# Runs fn(path, start, stop, *args) over the PDF in page ranges and yields its items
+# in page order. Large PDFs are split across a process pool; only a bounded window
+# of page ranges is in flight, so memory stays flat.
+def _map_page_ranges(path, fn, args=(), max_workers=MAX_WORKERS):
+    page_count = count_pages(path)
+    ranges = [
+        (start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ]
+
+    if page_count < PARALLEL_MIN_PAGES or max_workers <= 1:
+        for start, stop in ranges:
+            yield from _timed_range(fn, path, start, stop, *args)
+        return
+
+    workers = min(max_workers, len(ranges))
+    pool = get_process_pool(max_workers)
+    remaining = iter(ranges)
+    pending = deque()
+    try:
+        with _pool_guard():
+            pending.extend(
+                pool.submit(_timed_range, fn, path, start, stop, *args)
+                for start, stop in islice(remaining, workers * 2)
+            )
+            while pending:
+                future = pending.popleft()
+                for start, stop in islice(remaining, 1):
+                    pending.append(pool.submit(_timed_range, fn, path, start, stop, *args))
+                yield from future.result()
+    finally:
+        # The pool outlives this call: drop the ranges nobody will read
+        for future in pending:
+            future.cancel()
+
+
+# Pages without a text layer are rendered and OCR'd in the shared process pool
+# (cached by page image, see ocr); text pages pass straight through. text_of reads
+# an item's text, from_ocr turns OCR text into an item. Page order is preserved.
+def _with_ocr(path, pages, text_of, from_ocr, stats=None, max_workers=OCR_WORKERS):
+    use_ocr = ocr_available()
+    pool, pending = None, deque()
+
+    def resolve(page_no, item, result):
+        if isinstance(result, Future):
+            text, seconds, cached = result.result()
+            item, source = from_ocr(text), "ocr_cache" if cached else "ocr"
+        else:
+            seconds, source = result, "empty" if needs_ocr(text_of(item)) else "text"
+        if stats is not None:
+            stats.append({"page": page_no, "source": source, "seconds": seconds, "chars": len(text_of(item))})
+        count("docqa_pdf_pages_total", source=source)
+        if source.startswith("ocr"):
+            cache_lookup("ocr", source == "ocr_cache")
+        return page_no, item
+
+    try:
+        with _pool_guard():
+            for page_no, item, seconds in pages:
+                if use_ocr and needs_ocr(text_of(item)):
+                    if pool is None:
+                        pool = get_process_pool(max(1, max_workers))
+                    pending.append((page_no, item, pool.submit(ocr_page, path, page_no - 1)))
+                else:
+                    pending.append((page_no, item, seconds))
+                # Yield whatever is ready at the front; block only when too many pages are queued
+                while pending and (
+                    not isinstance(pending[0][2], Future) or pending[0][2].done() or len(pending) > OCR_MAX_PENDING
+                ):
+                    yield resolve(*pending.popleft())
+            while pending:
+                yield resolve(*pending.popleft())
+    finally:
+        for _, _, result in pending:
+            if isinstance(result, Future):
+                result.cancel()
+
+
+# Generator of (page_no, text) in page order. Pass a list as stats to collect per-page
+# {"page", "source" (text / ocr / ocr_cache / empty), "seconds", "chars"} -- see ocr.summarize_pages
+def iter_pdf_pages(source, backend=PDF_BACKEND, max_workers=MAX_WORKERS, stats=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend: {backend}")
+    with _as_path(source) as path:
+        pages = _map_page_ranges(path, extract_page_range, (backend,), max_workers)
+        yield from _with_ocr(path, pages, lambda text: text, lambda text: text, stats)
+
+
+# Generator of (page_no, [(text, font size, bold), ...]) in page order
+# (OCR'd pages have no font information: size 0, not bold)
+def iter_layout_pages(source, max_workers=MAX_WORKERS, stats=None):
+    with _as_path(source) as path:
+        pages = _map_page_ranges(path, extract_layout_range, (), max_workers)
+        yield from _with_ocr(
+            path, pages,
+            lambda lines: "\n".join(text for text, _, _ in lines),
+            lambda text: [(line.strip(), 0, False) for line in text.splitlines() if line.strip()],
+            stats,
+        )
@@ -1,39 +1,39 @@
 import streamlit as st
-from langchain_openai import ChatOpenAI
-from main import extract_text_from_pdf
-import io
-from fpdf import FPDF
+from ocr import describe_coverage, ocr_warning
+from llm_client import get_chat_model, get_embedding_model
+from metrics import instrument
+from prompt_budget import build_context
+from mcq_records import JSONL_FORMAT_INSTRUCTIONS, MCQ, MCQBatch, generate_mcqs
+from question_bank import get_question_bank
+from question_dedup import QuestionDeduper
+from pdf_export import create_pdf_download
+from ui_stream import LiveText
 import random
-import hashlib
+import uuid
 
-PAST_LIMIT = 4000
+MODEL_NAME = "gpt-3.5-turbo"
+# Tokens of past-paper context per prompt, chosen to cover the papers' range of topics
+PAST_TOKEN_BUDGET = 6000
 
 FEW_SHOT_EXAMPLES = """
-Q1. A capacitor of 5 μF is charged to a potential difference of 200 V. What is the energy stored?
-A. 0.1 J
-B. 0.05 J
-C. 0.25 J
-D. 0.5 J
-Answer: A
-Difficulty: Medium
-
-Q2. The phenomenon responsible for the twinkling of stars is:
-A. Reflection
-B. Refraction
-C. Scattering
-D. Total internal reflection
-Answer: B
-Difficulty: Easy
+{"question": "A capacitor of 5 μF is charged to a potential difference of 200 V. What is the energy stored?", "options": ["0.1 J", "0.05 J", "0.25 J", "0.5 J"], "answer": "A", "difficulty": "Medium"}
+{"question": "The phenomenon responsible for the twinkling of stars is:", "options": ["Reflection", "Refraction", "Scattering", "Total internal reflection"], "answer": "B", "difficulty": "Easy"}
 """
 
-seen_question_hashes_past = set()
-
-def hash_question_block(mcq_block):
-    return hashlib.md5(mcq_block.strip().encode()).hexdigest()
-
+@instrument("mcq_generate", generator="past_papers")
 def generate_mcqs_from_past_only(
-    past_questions_text, openai_key, num_questions=25, difficulty_filter="All"
+    past_questions_text, openai_key, num_questions=25, difficulty_filter="All", use_cache=True,
+    on_question=None, dedup=None, paper_ids=None
 ):
+    # The most representative (and varied) questions of these papers, from the shared question bank.
+    # paper_ids: papers already in the bank; otherwise past_questions_text is added to it.
+    bank = get_question_bank()
+    embedding_model = get_embedding_model(openai_key)
+    paper_ids = bank.papers_for(past_questions_text, paper_ids)
+    past_context = bank.context(PAST_TOKEN_BUDGET, paper_ids, embedding_model=embedding_model) if paper_ids else ""
+    if not past_context:
+        past_context = build_context(past_questions_text, PAST_TOKEN_BUDGET, embedding_model, model=MODEL_NAME)
+
     difficulty_instruction = ""
     if difficulty_filter != "All":
         difficulty_instruction = f"\n- Focus ONLY on {difficulty_filter.upper()} difficulty questions."
@@ -49,48 +49,40 @@ def generate_mcqs_from_past_only(
 - Study the question patterns, topics & complexity from past papers.
 - Rephrase and innovate to predict fresh but realistic questions.
 - NO direct repetition; each question must look fresh yet aligned with NEET's standards.
-- Include:  
-   - Options (A/B/C/D)  
-   - Correct answer at the end  
-   - Difficulty tag (Easy, Medium, Hard)  
+- Each question has 4 options (A/B/C/D), the correct answer and a difficulty tag (Easy, Medium, Hard).
 - Ensure excellent topic coverage (no bias).  
 - Aim for more **Medium and Hard** questions to make it realistic.{difficulty_instruction}
 
-💡 **Example format:**
+{JSONL_FORMAT_INSTRUCTIONS}
+
+💡 **Examples:**
 {FEW_SHOT_EXAMPLES}
 
 ### 🗂 Past NEET Questions:
-{past_questions_text[:PAST_LIMIT]}
+{past_context}
 """
 
-    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7, openai_api_key=openai_key)
-    response = llm.invoke(prompt)
-    result = response.content if hasattr(response, "content") else str(response)
-
-    all_mcqs_list = []
-    question_counter = 1
-    for block in result.strip().split("\n\n"):
-        h = hash_question_block(block)
-        if h not in seen_question_hashes_past:
-            seen_question_hashes_past.add(h)
-            numbered = f"Q{question_counter}. " + block.strip()
-            all_mcqs_list.append(numbered)
-            question_counter += 1
-
-    return "\n\n".join(all_mcqs_list)
-
-def create_pdf_download(content):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.set_font("Arial", size=12)
-    for line in content.splitlines():
-        pdf.multi_cell(0, 10, line.encode("latin-1", errors="ignore").decode("latin-1"))
-    buffer = io.BytesIO()
-    pdf_bytes = pdf.output(dest="S").encode("latin-1")
-    buffer.write(pdf_bytes)
-    buffer.seek(0)
-    return buffer
+    llm = get_chat_model(openai_key, MODEL_NAME, 0.7)
+    # Each question is numbered and handed to on_question(number, mcq) as soon as it is complete.
+    # Near-copies of the uploaded papers are always dropped; an answer served from the
+    # response cache is an identical repeat by design, so only it may repeat questions this
+    # session has seen. A fresh completion must bring fresh questions.
+    dedup = dedup or QuestionDeduper()
+    dedup.add_reference(bank.paper_text(paper_ids) or past_questions_text)
+    batch = MCQBatch()
+    served = {"from_cache": False}
+
+    def add_question(mcq):
+        if dedup.filter([mcq], allow_seen=served["from_cache"], key=MCQ.to_text):
+            batch.append(mcq)
+            if on_question:
+                on_question(len(batch), mcq)
+
+    generate_mcqs(
+        llm, prompt, bypass=not use_cache, on_record=add_question, num_questions=num_questions,
+        on_cache_hit=lambda: served.update(from_cache=True)
+    )
+    return batch
 
 def show_predict_from_past_tab(openai_key):
     st.header("📚 Predict NEET MCQs from Past Papers Only")
@@ -109,6 +101,12 @@ def show_predict_from_past_tab(openai_key):
         key="past_difficulty_select"
     )
 
+    use_cache = st.checkbox(
+        "♻️ Reuse earlier results for identical requests (untick for fresh questions)",
+        value=True,
+        key="past_use_cache"
+    )
+
     past_papers_pdfs = st.file_uploader(
         "📄 Upload Past NEET Question Papers (1 or more)",
         type="pdf",
@@ -117,25 +115,54 @@ def show_predict_from_past_tab(openai_key):
     )
 
     if past_papers_pdfs:
+        # Papers are read and segmented into the shared question bank once, not on every click
+        bank = get_question_bank()
+        page_stats = []
+        with st.spinner("Reading past papers..."):
+            paper_ids = [bank.add_pdf(pdf, stats=page_stats) for pdf in past_papers_pdfs]
+        if page_stats:
+            st.session_state.past_tab_coverage = describe_coverage(page_stats)
+            st.session_state.past_tab_ocr_warning = ocr_warning(page_stats)
+        if st.session_state.get("past_tab_coverage"):
+            st.caption(f"📄 {st.session_state.past_tab_coverage}")
+        if st.session_state.get("past_tab_ocr_warning"):
+            st.warning(f"⚠️ {st.session_state.past_tab_ocr_warning}")
+        st.caption(f"📚 Question bank: {bank.describe(paper_ids)}")
+
         if st.button("🔮 Generate MCQs from Past Papers", key="past_generate_button"):
             with st.spinner("Analyzing past papers and predicting questions..."):
-                all_past_texts = [extract_text_from_pdf(pdf) for pdf in past_papers_pdfs]
-                past_questions_text = "\n".join(all_past_texts)
+                counter = st.empty()
+                live = LiveText(st.empty())
+
+                def question_ready(number, mcq):
+                    live.append(mcq.to_text(number) + "\n\n")
+                    counter.caption(f"✅ {number} question(s) ready")
 
-                mcqs = generate_mcqs_from_past_only(
-                    past_questions_text,
+                batch = generate_mcqs_from_past_only(
+                    "",
                     openai_key,
                     num_questions=num_questions,
-                    difficulty_filter=difficulty_filter
+                    difficulty_filter=difficulty_filter,
+                    use_cache=use_cache,
+                    on_question=question_ready,
+                    dedup=QuestionDeduper(st.session_state.setdefault("dedup_scope", uuid.uuid4().hex)),
+                    paper_ids=paper_ids
                 )
-
-                st.success(f"Here are {num_questions} NEET-style MCQs predicted!")
-                st.markdown(f"""```text\n{mcqs}```""")
+                # Once done, the progress line becomes the result: how many were actually kept
+                counter.success(f"Here are {len(batch)} NEET-style MCQs predicted!")
+                mcqs = batch.to_text()
+                live.placeholder.markdown(f"""```text\n{mcqs}```""")
                 st.download_button(
                     "⬇️ Download MCQs PDF",
-                    create_pdf_download(mcqs),
+                    create_pdf_download(batch, title="Predicted NEET MCQs (past papers)"),
                     file_name="mcqs_from_past.pdf",
                     key="past_download_button"
                 )
+                st.download_button(
+                    "⬇️ Download MCQs CSV",
+                    batch.to_csv(),
+                    file_name="mcqs_from_past.csv",
+                    key="past_download_csv_button"
+                )
     else:
         st.info("📥 Please upload at least one NEET past paper PDF.")
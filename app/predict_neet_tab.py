@@ -1,146 +1,323 @@
 import streamlit as st
-from langchain_openai import ChatOpenAI
-from main import extract_text_from_pdf
-import io
-from fpdf import FPDF
-import random
-import hashlib
-
-CHAPTER_LIMIT = 4000
-PAST_LIMIT = 3000
+from main import split_text_into_chunks
+from document_store import get_document_store
+from ocr import describe_coverage, ocr_warning
+from embedding_cache import get_model_name
+from llm_client import get_chat_model, get_embedding_model, map_concurrently
+from metrics import estimate_cost, instrument
+from mcq_records import JSONL_FORMAT_INSTRUCTIONS, MCQ_COMPLETION_TOKENS, MCQBatch, generate_mcqs
+from question_dedup import QuestionDeduper
+from prompt_budget import build_context, centroid, select_chunks
+from question_bank import get_question_bank
+from quota_scheduler import (
+    MAX_TOPUP_ROUNDS, allocate_quotas, chapter_weights, context_budget, plan_calls, shortfall
+)
+from resources import shared_resource
+from token_utils import count_tokens
+from pdf_export import create_pdf_download
+from ui_stream import LiveText
+from dataclasses import replace
+import uuid
+
+MODEL_NAME = "gpt-3.5-turbo"
+# Token budgets for the chapter and past-paper context in each prompt
+CHAPTER_TOKEN_BUDGET = 2500
+PAST_TOKEN_BUDGET = 1500
 
 FEW_SHOT_EXAMPLES = """
-Q1. A block of mass 2kg is placed on a frictionless surface. If a force of 10N is applied, what is its acceleration?
-A. 5 m/s^2
-B. 10 m/s^2
-C. 2 m/s^2
-D. 20 m/s^2
-Answer: A
-Difficulty: Medium
-
-Q2. Which law of motion defines the relationship F = ma?
-A. First Law
-B. Second Law
-C. Third Law
-D. Newton’s Universal Law
-Answer: B
-Difficulty: Easy
+{"question": "A block of mass 2kg is placed on a frictionless surface. If a force of 10N is applied, what is its acceleration?", "options": ["5 m/s^2", "10 m/s^2", "2 m/s^2", "20 m/s^2"], "answer": "A", "difficulty": "Medium"}
+{"question": "Which law of motion defines the relationship F = ma?", "options": ["First Law", "Second Law", "Third Law", "Newton’s Universal Law"], "answer": "B", "difficulty": "Easy"}
 """
 
-seen_question_hashes = set()
-
-def hash_question_block(mcq_block):
-    return hashlib.md5(mcq_block.strip().encode()).hexdigest()
-
-def generate_mcqs_from_combined_text(
-    chapter_chunks, past_questions_text, openai_key,
-    num_questions=25, exclude_logic=False, question_type="Mixed", difficulty_filter="All"
+# Renders the prompt for one call. sections: [(chapter name, trimmed chapter text, questions)];
+# avoid: questions already generated for these chapters (top-up calls)
+def render_chapters_prompt(
+    sections, past_context, exclude_logic=False, question_type="Mixed", difficulty_filter="All", avoid=()
 ):
-    if len(chapter_chunks) == 0:
-        return "❌ No chapters left or selected. Please upload new PDFs or pick different chapters."
-
-    questions_per_chunk = max(1, num_questions // len(chapter_chunks))
-    all_mcqs_list = []
-    question_counter = 1
-    random.shuffle(chapter_chunks)
-
-    for chapter_name, chunk in chapter_chunks:
-        chunk_trimmed = chunk[:CHAPTER_LIMIT].strip()
-        past_trimmed = past_questions_text[:PAST_LIMIT].strip()
-
-        logic_instruction = "\n- 🚫 Do not include Logic Gates or Digital Electronics questions." if exclude_logic else ""
-        type_instruction = f"\n- Only include **{question_type.lower()}** questions." if question_type != "Mixed" else ""
-        difficulty_instruction = (
-            f"\n- Prioritize **{difficulty_filter.lower()}** difficulty questions."
-            if difficulty_filter != "All" else "\n- Focus more on **Medium and Hard** questions overall."
+    logic_instruction = "\n- 🚫 Do not include Logic Gates or Digital Electronics questions." if exclude_logic else ""
+    type_instruction = f"\n- Only include **{question_type.lower()}** questions." if question_type != "Mixed" else ""
+    difficulty_instruction = (
+        f"\n- Prioritize **{difficulty_filter.lower()}** difficulty questions."
+        if difficulty_filter != "All" else "\n- Focus more on **Medium and Hard** questions overall."
+    )
+    total = sum(quota for _, _, quota in sections)
+    if len(sections) == 1:
+        chapter_rule = f"- Every question is about the chapter **{sections[0][0]}**."
+    else:
+        chapter_rule = (
+            "- Exactly this many questions per chapter: "
+            + ", ".join(f"**{name}**: {quota}" for name, _, quota in sections)
+            + '.\n- Add a "chapter" key to every JSON object, with the chapter name exactly as written above.'
         )
+    chapter_sections = "\n\n".join(f"### 📚 Chapter: {name}\n{text}" for name, text, _ in sections)
+    avoid_section = ""
+    if avoid:
+        avoid_section = "\n### 🚫 Already generated (do not repeat or paraphrase):\n" + "\n".join(f"- {q}" for q in avoid) + "\n"
 
-        prompt = f"""
+    return f"""
 📢 **ROLE:** You are a **senior NEET UG 2025 paper setter** (Physics/Chemistry/Biology expert).
 
 🗓 **Context:** The NEET UG 2025 exam will be held on **4 May 2025.**
 
-🔍 **Your task:** Predict {questions_per_chunk} **high-quality NEET-style MCQs** (no descriptive questions), based on the **chapter content + past NEET papers** provided.
+🔍 **Your task:** Predict {total} **high-quality NEET-style MCQs** (no descriptive questions), based on the **chapter content + past NEET papers** provided.
 
 ✅ **Rules:**
 - Aim for ~50% conceptual and 50% numerical questions.
 - Strongly align with recent NEET trends (2023, 2024) and syllabus (e.g., capacitors, oscillations, kinematics in Physics).
 {logic_instruction}{type_instruction}{difficulty_instruction}
-- Tag each question with the chapter: **{chapter_name}**.
-- Add **Difficulty: Easy, Medium, Hard**.
+{chapter_rule}
+- Add a difficulty: Easy, Medium or Hard.
 - 🚫 Do NOT copy old questions word-for-word; rephrase, innovate, and focus on real NEET standard.
 
-✍️ **Example format:**
+{JSONL_FORMAT_INSTRUCTIONS}
+
+✍️ **Examples:**
 {FEW_SHOT_EXAMPLES}
 
-### 📚 Chapter Summary:
-{chunk_trimmed}
+{chapter_sections}
 
 ### 📝 Past NEET Questions:
-{past_trimmed}
-"""
+{past_context}
+{avoid_section}"""
+
+# chapters: [(name, text, questions, chapter context budget)]. Each chapter keeps its most
+# representative passages, taken from the chapter corpus (stored chunks and vectors, see
+# CorpusIndex) when doc_ids maps it to a corpus document, else chunked and embedded here; the past
+# questions closest to these chapters come from the question bank (keyword + vector match), or
+# from the raw text when it holds no numbered questions.
+def build_chapters_prompt(
+    chapters, past_questions_text, exclude_logic=False, question_type="Mixed", difficulty_filter="All",
+    embedding_model=None, avoid=(), paper_ids=None, subject=None, corpus=None, doc_ids=None
+):
+    stored = {}
+    if corpus is not None and doc_ids:
+        stored = {name: corpus.document_vectors(doc_ids[name]) for name, _, _, _ in chapters if doc_ids.get(name) in corpus}
+    chapter_vectors = {}
+    for name, text, _, _ in chapters:
+        if name in stored:
+            if stored[name][1] is not None:
+                chapter_vectors[name] = stored[name][1].mean(axis=0)
+        elif embedding_model is not None:
+            chapter_vectors[name] = centroid(embedding_model, split_text_into_chunks(text) or [text])
+    sections = []
+    for name, text, quota, budget in chapters:
+        if name in stored:
+            chunks, vectors = stored[name]
+            context = "\n".join(select_chunks(chunks, budget, None, chapter_vectors.get(name), MODEL_NAME, vectors=vectors)).strip()
+        else:
+            context = build_context(text, budget, embedding_model, chapter_vectors.get(name), MODEL_NAME)
+        sections.append((name, context, quota))
+    past_vector = sum(chapter_vectors.values()) / len(chapter_vectors) if chapter_vectors else None
+    past_trimmed = ""
+    if paper_ids:
+        past_trimmed = get_question_bank().context(
+            PAST_TOKEN_BUDGET, paper_ids, subject, embedding_model,
+            query_text="\n".join(text for _, text, _, _ in chapters), query_vector=past_vector
+        )
+    if not past_trimmed:
+        past_trimmed = build_context(past_questions_text, PAST_TOKEN_BUDGET, embedding_model, past_vector, MODEL_NAME)
+    return render_chapters_prompt(sections, past_trimmed, exclude_logic, question_type, difficulty_filter, avoid)
+
+# Exact per-chapter quotas (see quota_scheduler) and the calls that will produce them.
+# Nothing is sent to the API, so this is also the dry run: planned calls, tokens and cost.
+# paper_ids: past papers already in the question bank (else past_questions_text is added to it).
+def plan_combined_generation(
+    chapter_chunks, past_questions_text, num_questions=25, weighting="size", paper_ids=None, subject=None
+):
+    names = [name for name, _ in chapter_chunks]
+    texts = [text for _, text in chapter_chunks]
+    sizes = [count_tokens(text, MODEL_NAME) for text in texts]
+    bank = get_question_bank()
+    paper_ids = bank.papers_for(past_questions_text, paper_ids)
+    past_questions = bank.questions(paper_ids, subject) if paper_ids else []
+    weights = chapter_weights(texts, [q.text for q in past_questions], weighting, MODEL_NAME, sizes)
+    quotas = allocate_quotas(weights, num_questions)
+    context_tokens = [context_budget(size, quota, CHAPTER_TOKEN_BUDGET) for size, quota in zip(sizes, quotas)]
+    calls = plan_calls(names, quotas, context_tokens, CHAPTER_TOKEN_BUDGET)
+
+    past_tokens = min(sum(q.tokens for q in past_questions) or count_tokens(past_questions_text, MODEL_NAME), PAST_TOKEN_BUDGET)
+    prompt_tokens = completion_tokens = 0
+    for call in calls:
+        template = render_chapters_prompt([(name, "", quota) for name, quota in call["chapters"]], "")
+        call["prompt_tokens"] = count_tokens(template, MODEL_NAME) + call["context_tokens"] + past_tokens
+        prompt_tokens += call["prompt_tokens"]
+        completion_tokens += call["questions"] * MCQ_COMPLETION_TOKENS
+    return {
+        "weighting": weighting,
+        "paper_ids": paper_ids,
+        "quotas": dict(zip(names, quotas)),
+        "sizes": dict(zip(names, sizes)),
+        "context_tokens": dict(zip(names, context_tokens)),
+        "calls": calls,
+        "estimate": {
+            "calls": len(calls),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": estimate_cost(MODEL_NAME, prompt_tokens, completion_tokens),
+        },
+    }
+
+@instrument("mcq_generate", generator="predict")
+def generate_mcqs_from_combined_text(
+    chapter_chunks, past_questions_text, openai_key,
+    num_questions=25, exclude_logic=False, question_type="Mixed", difficulty_filter="All",
+    on_progress=None, on_question=None, dedup=None, weighting="size", paper_ids=None, subject=None,
+    corpus=None, doc_ids=None
+):
+    if len(chapter_chunks) == 0:
+        return MCQBatch()
+
+    plan = plan_combined_generation(chapter_chunks, past_questions_text, num_questions, weighting, paper_ids, subject)
+    paper_ids = plan["paper_ids"]
+    quotas = plan["quotas"]
+    texts = dict(chapter_chunks)
+    llm = get_chat_model(openai_key, MODEL_NAME, 0.7)
+    embedding_model = get_embedding_model(openai_key)
+    # Repeats of this session's earlier questions and near-copies of the past papers don't count
+    dedup = dedup or QuestionDeduper()
+    dedup.add_reference(get_question_bank().paper_text(paper_ids) or past_questions_text)
+    kept = {name: [] for name in quotas}
+
+    def generate_for_call(call, emit):
+        names = [name for name, _ in call["chapters"]]
+        wanted = dict(call["chapters"])
+        by_name = {name.lower(): name for name in names}
+        avoid = [mcq.question[:120] for name in names for mcq in kept[name]]
+        prompt = build_chapters_prompt(
+            [(name, texts[name], quota, context_budget(plan["sizes"][name], quota, CHAPTER_TOKEN_BUDGET))
+             for name, quota in call["chapters"]],
+            past_questions_text, exclude_logic, question_type, difficulty_filter, embedding_model, avoid,
+            paper_ids, subject, corpus, doc_ids
+        )
+        records = []
+
+        # A packed prompt tags each question with its chapter; an unknown tag goes to the
+        # chapter of this call that still needs the most questions
+        def take(mcq):
+            name = by_name.get(mcq.chapter.strip().lower()) or max(names, key=lambda n: wanted[n])
+            wanted[name] -= 1
+            mcq = replace(mcq, chapter=name)
+            records.append(mcq)
+            emit(mcq)
+
+        # Stream the completion and emit every question as soon as it is complete
+        generate_mcqs(
+            llm, prompt, chapter=names[0] if len(names) == 1 else "", on_record=take, num_questions=call["questions"]
+        )
+        return records
+
+    def question_streamed(i, mcq):
+        if on_question:
+            on_question(mcq.chapter, mcq)
+
+    # Every call goes out in parallel through one shared client. Each chapter keeps its
+    # first quota fresh questions; chapters that come back short get targeted top-up calls.
+    calls, done, total_calls = plan["calls"], 0, len(plan["calls"])
+    for round_number in range(MAX_TOPUP_ROUNDS + 1):
+        for i, records in map_concurrently(generate_for_call, calls, on_event=question_streamed):
+            for mcq in records:
+                if len(kept[mcq.chapter]) < quotas[mcq.chapter] and dedup.check(mcq.to_text()) is None:
+                    dedup.add(mcq.to_text())
+                    kept[mcq.chapter].append(mcq)
+            done += 1
+            if on_progress:
+                on_progress(done, total_calls, ", ".join(name for name, _ in calls[i]["chapters"]))
+        missing = shortfall(quotas, {name: len(records) for name, records in kept.items()})
+        if not missing or round_number == MAX_TOPUP_ROUNDS:
+            break
+        calls = plan_calls(
+            list(missing), list(missing.values()),
+            [context_budget(plan["sizes"][name], count, CHAPTER_TOKEN_BUDGET) for name, count in missing.items()],
+            CHAPTER_TOKEN_BUDGET
+        )
+        total_calls += len(calls)
+
+    # Numbering follows chapter order
+    return MCQBatch(mcq for name in quotas for mcq in kept[name])
 
-        llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7, openai_api_key=openai_key)
-        response = llm.invoke(prompt)
-        result = response.content if hasattr(response, "content") else str(response)
-
-        for block in result.strip().split("\n\n"):
-            h = hash_question_block(block)
-            if h not in seen_question_hashes:
-                seen_question_hashes.add(h)
-                numbered = f"Q{question_counter}. " + block.strip()
-                all_mcqs_list.append(f"[Chapter: {chapter_name}]\n{numbered}")
-                question_counter += 1
-
-    return "\n\n".join(all_mcqs_list)
-
-def create_pdf_download(content):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.set_font("Arial", size=12)
-    for line in content.splitlines():
-        pdf.multi_cell(0, 10, line.encode("latin-1", errors="ignore").decode("latin-1"))
-    buffer = io.BytesIO()
-    pdf_bytes = pdf.output(dest="S").encode("latin-1")
-    buffer.write(pdf_bytes)
-    buffer.seek(0)
-    return buffer
+# One persistent chapter corpus per subject and embedding model, shared by every session in this
+# process (and so by every API key: each session embeds with its own client, see CorpusIndex)
+@shared_resource
+def get_chapter_corpus(subject, embedding_model_name):
+    from corpus_index import CorpusIndex
+
+    return CorpusIndex.open(f"{subject.lower()}-{embedding_model_name}", None)
 
 def show_predict_neet_tab(openai_key):
     st.header("🚙 Predict NEET MCQs Only")
 
-    # Initialize session state variables
-    if "chapter_text_map" not in st.session_state:
-        st.session_state.chapter_text_map = {}
+    # Initialize session state variables. Chapter text lives once per process in the
+    # document store; a session only keeps {chapter name: handle}
+    if "chapter_handles" not in st.session_state:
+        st.session_state.chapter_handles = {}
 
     if "used_chapter_names" not in st.session_state:
         st.session_state.used_chapter_names = set()
 
-    if "past_questions_text" not in st.session_state:
-        st.session_state.past_questions_text = ""
+    if "past_paper_ids" not in st.session_state:
+        st.session_state.past_paper_ids = []
+
+    if "chapter_doc_ids" not in st.session_state:
+        st.session_state.chapter_doc_ids = {}
 
     subject = st.selectbox("🧪 Select Subject", ["Physics", "Chemistry", "Biology"], key="neet_subject_select")
     question_type = st.radio("⚙️ Question Type", ["Mixed", "Conceptual Only", "Numerical Only"], key="neet_qtype_radio")
     difficulty = st.selectbox("🎯 Focus on Difficulty Level", ["All", "Easy", "Medium", "Hard"], key="neet_difficulty_select")
     num_questions = st.selectbox("🔹 Number of MCQs to Generate", [5, 10, 20, 25, 30, 50], index=3, key="neet_num_questions_select")
     exclude_logic = st.toggle("🚫 Exclude Logic/Digital Electronics Questions", value=False, key="neet_exclude_logic_toggle")
+    weighting = st.radio(
+        "⚖️ Share questions between chapters by", ["size", "past_papers"], horizontal=True, key="neet_weighting_radio",
+        format_func={"size": "Chapter length", "past_papers": "Past-paper frequency"}.get
+    )
 
     # Upload PDFs
     chapter_pdfs = st.file_uploader("📄 Upload ALL Chapter PDFs", type="pdf", key="predict_chapter_upload", accept_multiple_files=True)
     past_papers_pdfs = st.file_uploader("📄 Upload Past NEET Question Papers (1 or more)", type="pdf", key="predict_papers_upload", accept_multiple_files=True)
 
+    store = get_document_store()
     if chapter_pdfs:
+        embedding_model = get_embedding_model(openai_key)
+        corpus = get_chapter_corpus(subject, get_model_name(embedding_model))
+        chapter_stats = []
         for pdf in chapter_pdfs:
             name = pdf.name.replace(".pdf", "")
-            if name not in st.session_state.chapter_text_map:
-                st.session_state.chapter_text_map[name] = extract_text_from_pdf(pdf)
-
-    if past_papers_pdfs and not st.session_state.past_questions_text:
-        all_past_texts = [extract_text_from_pdf(pdf) for pdf in past_papers_pdfs]
-        st.session_state.past_questions_text = "\n".join(all_past_texts)
+            # Identical uploads (from any session) are extracted once
+            handle = store.add_pdf(pdf, stats=chapter_stats)
+            st.session_state.chapter_handles[name] = handle
+            # Only a chapter the corpus has not seen yet gets embedded
+            doc_id = f"{name}:{handle}"
+            if doc_id not in corpus:
+                corpus.add_document(doc_id, text=store.text(handle), embedding_model=embedding_model)
+            st.session_state.chapter_doc_ids[name] = doc_id
+        if chapter_stats:
+            st.session_state.chapter_ocr_warning = ocr_warning(chapter_stats)
+    # Chapters unused for longer than the store keeps documents have to be uploaded again
+    expired = [name for name, handle in st.session_state.chapter_handles.items() if handle not in store]
+    for name in expired:
+        del st.session_state.chapter_handles[name]
+        st.session_state.chapter_doc_ids.pop(name, None)
+    if expired:
+        st.warning(f"⚠️ These chapters have expired, please upload them again: {', '.join(expired)}")
+    if st.session_state.get("chapter_ocr_warning"):
+        st.warning(f"⚠️ Chapters: {st.session_state.chapter_ocr_warning}")
+
+    # Every uploaded paper goes into the shared question bank; one it already holds is only hashed
+    if past_papers_pdfs:
+        bank = get_question_bank()
+        page_stats = []
+        st.session_state.past_paper_ids = [bank.add_pdf(pdf, stats=page_stats) for pdf in past_papers_pdfs]
+        if page_stats:
+            st.session_state.past_pages_coverage = describe_coverage(page_stats)
+            st.session_state.past_pages_ocr_warning = ocr_warning(page_stats)
+        st.caption(f"📚 Question bank: {bank.describe(st.session_state.past_paper_ids, subject)}")
+    else:
+        st.session_state.past_paper_ids = []
+    if st.session_state.get("past_pages_coverage"):
+        st.caption(f"📄 Past papers: {st.session_state.past_pages_coverage}")
+    if st.session_state.get("past_pages_ocr_warning"):
+        st.warning(f"⚠️ Past papers: {st.session_state.past_pages_ocr_warning}")
 
-    available_chapters = [c for c in st.session_state.chapter_text_map if c not in st.session_state.used_chapter_names]
+    available_chapters = [c for c in st.session_state.chapter_handles if c not in st.session_state.used_chapter_names]
     if available_chapters:
         selected_chapters = st.multiselect("📌 Select Chapter(s) to focus (leave empty for all unused)", available_chapters, default=available_chapters, key="neet_chapter_multiselect")
     else:
@@ -150,28 +327,68 @@ def show_predict_neet_tab(openai_key):
         st.session_state.used_chapter_names.clear()
         st.success("✅ Chapters reset! You can now reuse all uploaded chapters.")
 
+    # Dry run: the planned quotas, calls, tokens and cost, before anything is spent
+    if st.button("🧮 Estimate calls & cost", key="neet_estimate_button") and selected_chapters:
+        plan = plan_combined_generation(
+            [(name, store.text(st.session_state.chapter_handles[name])) for name in selected_chapters],
+            "", num_questions, weighting, st.session_state.past_paper_ids, subject
+        )
+        estimate = plan["estimate"]
+        st.info(
+            f"{estimate['calls']} LLM calls, ≈{estimate['prompt_tokens']} prompt + "
+            f"{estimate['completion_tokens']} completion tokens (≈ ${estimate['cost_usd']:.4f})"
+        )
+        st.dataframe(
+            [{"chapter": name, "questions": quota} for name, quota in plan["quotas"].items()], hide_index=True
+        )
+
     if st.button("🔮 Generate NEET MCQs", key="neet_generate_button"):
         if not selected_chapters:
             st.error("⚠️ No chapters selected or available. Upload more PDFs or reset the app.")
             return
 
-        selected_chunks = [(name, st.session_state.chapter_text_map[name]) for name in selected_chapters]
+        selected_chunks = [(name, store.text(st.session_state.chapter_handles[name])) for name in selected_chapters]
         for name in selected_chapters:
             st.session_state.used_chapter_names.add(name)
 
-        mcqs = generate_mcqs_from_combined_text(
+        # Show each question as soon as it is generated, grouped by chapter
+        progress_area = st.empty()
+        progress_box = progress_area.container()
+        progress_bar = progress_box.progress(0.0, text="Generating questions...")
+        chapter_slots = {name: LiveText(progress_box.empty(), min_interval=0) for name in selected_chapters}
+
+        def show_question(chapter_name, mcq):
+            slot = chapter_slots[chapter_name]
+            block = mcq.to_text()
+            slot.append(f"{block}\n\n" if slot.text else f"[Chapter: {chapter_name}]\n\n{block}\n\n")
+
+        def show_progress(done, total, chapter_names):
+            progress_bar.progress(done / total, text=f"✅ {chapter_names}")
+
+        batch = generate_mcqs_from_combined_text(
             selected_chunks,
-            st.session_state.past_questions_text,
+            "",
             openai_key,
             num_questions=num_questions,
             exclude_logic=exclude_logic,
             question_type=question_type,
-            difficulty_filter=difficulty
+            difficulty_filter=difficulty,
+            on_progress=show_progress,
+            on_question=show_question,
+            dedup=QuestionDeduper(st.session_state.setdefault("dedup_scope", uuid.uuid4().hex)),
+            weighting=weighting,
+            paper_ids=st.session_state.past_paper_ids,
+            subject=subject,
+            corpus=get_chapter_corpus(subject, get_model_name(get_embedding_model(openai_key))),
+            doc_ids=st.session_state.chapter_doc_ids
         )
+        progress_area.empty()
 
-        st.success(f"Here are {num_questions} NEET-style MCQs:")
+        mcqs = batch.to_text()
+        st.success(f"Here are {len(batch)} NEET-style MCQs:")
         st.markdown(f"""```text\n{mcqs}```""")
-        st.download_button("⬇️ Download MCQs PDF", create_pdf_download(mcqs), file_name="mcqs.pdf", key="neet_download_button")
+        st.download_button("⬇️ Download MCQs PDF", create_pdf_download(batch, title="Predicted NEET MCQs"), file_name="mcqs.pdf", key="neet_download_button")
+        st.download_button("⬇️ Download MCQs CSV", batch.to_csv(), file_name="mcqs.csv", key="neet_download_csv_button")
 
     elif not chapter_pdfs or not past_papers_pdfs:
         st.info("📥 Please upload both chapter PDFs and at least one NEET question paper PDF.")
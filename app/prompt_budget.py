@@ -0,0 +1,68 @@
+import numpy as np
+
+from embedding_cache import embed_texts
+from main import split_text_into_chunks
+from token_utils import count_tokens
+
+# 1.0 = pure relevance, 0.0 = pure diversity
+MMR_LAMBDA = 0.6
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# Maximal marginal relevance: rank chunks by relevance to the query, penalising
+# chunks that repeat what has already been picked.
+def mmr_order(query_vector, chunk_vectors, lambda_mult=MMR_LAMBDA):
+    chunk_vectors = _normalize(np.asarray(chunk_vectors, dtype=np.float32))
+    relevance = chunk_vectors @ _normalize(np.asarray(query_vector, dtype=np.float32))
+    redundancy = np.full(len(chunk_vectors), -np.inf, dtype=np.float32)
+    remaining = np.ones(len(chunk_vectors), dtype=bool)
+
+    order = []
+    for _ in range(len(chunk_vectors)):
+        penalty = np.where(np.isinf(redundancy), 0.0, redundancy)
+        scores = np.where(remaining, lambda_mult * relevance - (1 - lambda_mult) * penalty, -np.inf)
+        best = int(np.argmax(scores))
+        order.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, chunk_vectors @ chunk_vectors[best])
+    return order
+
+
+def centroid(embedding_model, chunks):
+    return embed_texts(embedding_model, chunks).mean(axis=0)
+
+
+# Pick the chunks that best use the token budget. If everything fits, nothing is
+# embedded; otherwise chunks are taken in MMR order (against query_vector, or the
+# chunks' own centroid) and returned in their original document order.
+# vectors: the chunks' embeddings when already known (e.g. stored in a CorpusIndex).
+def select_chunks(chunks, budget, embedding_model=None, query_vector=None, model=None,
+                  lambda_mult=MMR_LAMBDA, vectors=None):
+    token_counts = [count_tokens(chunk, model) for chunk in chunks]
+    if sum(token_counts) <= budget:
+        return list(chunks)
+
+    if vectors is None and embedding_model is None:
+        order = range(len(chunks))
+    else:
+        if vectors is None:
+            vectors = embed_texts(embedding_model, chunks)
+        if query_vector is None:
+            query_vector = vectors.mean(axis=0)
+        order = mmr_order(query_vector, vectors, lambda_mult)
+
+    picked, used = [], 0
+    for i in order:
+        if used + token_counts[i] <= budget:
+            picked.append(i)
+            used += token_counts[i]
+    return [chunks[i] for i in sorted(picked)]
+
+
+def build_context(text, budget, embedding_model=None, query_vector=None, model=None):
+    chunks = split_text_into_chunks(text)
+    return "\n".join(select_chunks(chunks, budget, embedding_model, query_vector, model)).strip()
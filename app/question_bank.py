@@ -0,0 +1,467 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from config import cache_dir
+from embedding_cache import embed_texts, get_model_name
+from hybrid_search import reciprocal_rank_fusion, tokenize
+from metrics import cache_lookup, timed
+from prompt_budget import mmr_order
+from question_dedup import (
+    DEDUP_THRESHOLD, META_LINE, PAST_QUESTION_START, SeenQuestionStore, minhash, normalize_question, split_past_questions
+)
+from resources import shared_resource
+from response_cache import context_id
+from token_utils import count_tokens
+
+# Candidates taken from each index before fusion / MMR when picking a prompt's past questions
+BANK_CANDIDATES = int(os.getenv("DOCQA_BANK_CANDIDATES", "200"))
+# Chapter terms sent to the keyword index
+CHAPTER_KEYWORDS = 12
+# Prompt contexts remembered per process (same papers + same chapter => same questions)
+BANK_CONTEXT_CACHE_SIZE = 256
+MIN_TOPIC_TERM_CHARS = 4
+
+# Option markers: "(1)" / "(a)" anywhere, or "A." / "b)" at the start of a line
+OPTION_MARK = re.compile(r"(?:^|(?<=\s))\(([1-4A-Da-d])\)\s*|^[ \t]*([A-Da-d])[.)][ \t]+", re.MULTILINE)
+YEAR = re.compile(r"(?<!\d)(19[89]\d|20[0-4]\d)(?!\d)")
+SUBJECT_HEADER = re.compile(
+    r"^\s*(?:(?:section|part|subject)\s*[-:]?\s*[A-Z0-9]?\s*[-:]?\s*)?(physics|chemistry|botany|zoology|biology)\b[^\n]{0,30}$",
+    re.IGNORECASE,
+)
+SUBJECT_WORD = re.compile(r"(physics|chemistry|botany|zoology|biology)", re.IGNORECASE)
+SUBJECTS = {"physics": "Physics", "chemistry": "Chemistry", "botany": "Biology", "zoology": "Biology", "biology": "Biology"}
+
+
+@dataclass(slots=True, frozen=True)
+class PastQuestion:
+    id: int
+    paper_id: str
+    number: int
+    year: int | None
+    subject: str
+    stem: str
+    options: tuple
+    text: str
+    tokens: int = 0
+
+
+def detect_year(name, text):
+    match = YEAR.search(name or "")
+    if match:
+        return int(match.group(1))
+    years = Counter(YEAR.findall(text[:2000]))
+    return int(years.most_common(1)[0][0]) if years else None
+
+
+def detect_subject(text):
+    match = SUBJECT_HEADER.match(text.strip())
+    return SUBJECTS[match.group(1).lower()] if match else ""
+
+
+def split_options(block):
+    marks = list(OPTION_MARK.finditer(block))
+    if len(marks) < 4:
+        return block.strip(), ()
+    marks = marks[-4:]
+    bounds = [m.start() for m in marks] + [len(block)]
+    options = tuple(" ".join(block[marks[i].end():bounds[i + 1]].split()) for i in range(4))
+    return " ".join(block[:marks[0].start()].split()), options
+
+
+# Past paper text -> question dicts (number, subject, stem, options, text). Subject headings
+# ("PHYSICS", "Section A - Botany") between questions set the subject of the ones after them;
+# answer / difficulty / explanation lines are dropped.
+def segment_questions(text, subject=""):
+    starts = [m.start() for m in PAST_QUESTION_START.finditer(text)]
+    if len(starts) < 2:
+        # No numbering to go by: one record per paragraph, as the deduper splits it
+        return [
+            {"number": i, "subject": subject, "stem": " ".join(block.split()), "options": (), "text": block}
+            for i, block in enumerate(split_past_questions(text), start=1)
+        ]
+    for line in text[:starts[0]].splitlines():
+        subject = detect_subject(line) or subject
+
+    questions = []
+    bounds = starts + [len(text)]
+    for i in range(len(starts)):
+        lines, next_subject = [], subject
+        for line in text[bounds[i]:bounds[i + 1]].splitlines():
+            heading = detect_subject(line)
+            if heading:
+                next_subject = heading
+            elif not META_LINE.match(line):  # answer keys and difficulty tags are not part of the question
+                lines.append(line)
+        block = "\n".join(lines).strip()
+        number_match = re.match(r"\s*(?:Q\.?\s*)?(\d{1,3})", block)
+        body = PAST_QUESTION_START.sub("", block, count=1)
+        stem, options = split_options(body)
+        if stem:
+            questions.append({
+                "number": int(number_match.group(1)) if number_match else i + 1,
+                "subject": subject,
+                "stem": stem,
+                "options": options,
+                "text": block,
+            })
+        subject = next_subject
+    return questions
+
+
+def topic_terms(text):
+    return {term for term in tokenize(text) if len(term) >= MIN_TOPIC_TERM_CHARS and not term.isdigit()}
+
+
+class QuestionBank:
+    # Persistent store of past-paper questions, shared by every tab, session and the API:
+    # papers are segmented once into question records (year, subject, options), a repeated or
+    # reworded question is stored once with one appearance per paper, and the questions get a keyword index (SQLite FTS5), per-paper term counts
+    # and, per embedding model, an in-memory FAISS index built from the embedding cache.
+
+    def __init__(self, path=None):
+        root = path or cache_dir("question_bank")
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, "bank.sqlite3")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS papers ("
+            "paper_id TEXT PRIMARY KEY, name TEXT NOT NULL, year INTEGER, subject TEXT NOT NULL, "
+            "questions INTEGER NOT NULL, duplicates INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "id INTEGER PRIMARY KEY, fingerprint TEXT UNIQUE NOT NULL, signature_id INTEGER, paper_id TEXT NOT NULL, "
+            "number INTEGER NOT NULL, year INTEGER, subject TEXT NOT NULL, stem TEXT NOT NULL, "
+            "options TEXT NOT NULL, text TEXT NOT NULL, tokens INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS questions_signature ON questions (signature_id);"
+            "CREATE TABLE IF NOT EXISTS appearances ("
+            "question_id INTEGER NOT NULL, paper_id TEXT NOT NULL, number INTEGER NOT NULL, PRIMARY KEY (paper_id, question_id));"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(text, content='questions', content_rowid='id');"
+            "CREATE TABLE IF NOT EXISTS paper_terms ("
+            "paper_id TEXT NOT NULL, term TEXT NOT NULL, subject TEXT NOT NULL, questions INTEGER NOT NULL, "
+            "PRIMARY KEY (paper_id, term, subject));"
+        )
+        self._conn.commit()
+        # MinHash signatures of every question in the bank, for near-duplicate checks. They live
+        # in bank.sqlite3 itself, so a paper's questions and signatures commit (or roll back) together.
+        self.signatures = SeenQuestionStore(
+            ttl=math.inf, max_per_scope=10 ** 9, conn=self._conn, lock=self._lock, prefix="signature_"
+        )
+        self._backfill_signatures()
+        self._vectors = {}
+        self._contexts = OrderedDict()
+
+    # Banks written before the signatures moved in here kept them in a separate file
+    def _backfill_signatures(self):
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM signature_questions LIMIT 1").fetchone() is not None:
+                return
+            rows = self._conn.execute("SELECT id, text FROM questions ORDER BY id").fetchall()
+            if not rows:
+                return
+            with self._conn:
+                ids = self.signatures.add_many("bank", [minhash(normalize_question(text)) for _, text in rows])
+                self._conn.executemany(
+                    "UPDATE questions SET signature_id = ? WHERE id = ?",
+                    [(signature_id, question_id) for signature_id, (question_id, _) in zip(ids, rows)],
+                )
+
+    def __contains__(self, paper_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM papers WHERE paper_id = ?", (paper_id,)).fetchone() is not None
+
+    # Ingest a PDF (bytes, uploaded file or path) once; later calls only hash the bytes
+    def add_pdf(self, pdf, name=None, stats=None):
+        from main import extract_text_from_pdf
+
+        if isinstance(pdf, (bytes, bytearray)):
+            data = bytes(pdf)
+        elif hasattr(pdf, "getvalue"):
+            data = pdf.getvalue()
+        else:
+            with open(pdf, "rb") as f:
+                data = f.read()
+        paper_id = hashlib.sha256(data).hexdigest()[:16]
+        if paper_id not in self:
+            name = name or getattr(pdf, "name", None) or os.path.basename(str(pdf))
+            self.add_text(extract_text_from_pdf(pdf, stats=stats), name, paper_id=paper_id)
+        return paper_id
+
+    def add_text(self, text, name="", paper_id=None, year=None, subject=""):
+        paper_id = paper_id or context_id(text)
+        if paper_id in self:
+            return paper_id
+        with timed("bank_ingest") as span:
+            year = year or detect_year(name, text)
+            named = SUBJECT_WORD.search(name)
+            subject = subject or (SUBJECTS[named.group(1).lower()] if named else "")
+            records = segment_questions(text, subject)
+            with self._lock:
+                # Checked again under the lock: another session may have ingested the same paper meanwhile
+                if paper_id in self:
+                    return paper_id
+                try:
+                    with self._conn:
+                        added, duplicates = self._insert_paper(paper_id, name, year, subject, records)
+                finally:
+                    self._contexts.clear()
+            span.set(questions=added, duplicates=duplicates)
+        return paper_id
+
+    # One transaction (the caller's): the questions, their appearances and term counts, then the paper row
+    def _insert_paper(self, paper_id, name, year, subject, records):
+        added, duplicates, terms = 0, 0, Counter()
+        for record in records:
+            normalized = normalize_question(record["text"])
+            fingerprint = context_id(normalized)
+            signature = minhash(normalized)
+            row = self._conn.execute("SELECT id FROM questions WHERE fingerprint = ?", (fingerprint,)).fetchone()
+            if row is None:
+                score, signature_id = self.signatures.closest(["bank"], signature)
+                if score >= DEDUP_THRESHOLD:
+                    row = self._conn.execute("SELECT id FROM questions WHERE signature_id = ?", (signature_id,)).fetchone()
+            if row is not None:
+                # Asked before (maybe reworded): one record, one more appearance
+                question_id = row[0]
+                duplicates += 1
+            else:
+                (signature_id,) = self.signatures.add_many("bank", [signature])
+                question_id = self._conn.execute(
+                    "INSERT INTO questions (fingerprint, signature_id, paper_id, number, year, subject, stem, options, text, tokens) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (fingerprint, signature_id, paper_id, record["number"], year, record["subject"], record["stem"],
+                     json.dumps(record["options"], ensure_ascii=False), record["text"], count_tokens(record["text"])),
+                ).lastrowid
+                self._conn.execute("INSERT INTO questions_fts (rowid, text) VALUES (?, ?)", (question_id, record["text"]))
+                added += 1
+            appeared = self._conn.execute(
+                "INSERT OR IGNORE INTO appearances (question_id, paper_id, number) VALUES (?, ?, ?)",
+                (question_id, paper_id, record["number"]),
+            ).rowcount
+            # Topic counts follow appearances: a topic asked again in another year counts again
+            if appeared:
+                terms.update((term, record["subject"]) for term in topic_terms(record["text"]))
+        self._conn.executemany(
+            "INSERT INTO paper_terms (paper_id, term, subject, questions) VALUES (?, ?, ?, ?)",
+            [(paper_id, term, term_subject, n) for (term, term_subject), n in terms.items()],
+        )
+        self._conn.execute(
+            "INSERT INTO papers (paper_id, name, year, subject, questions, duplicates) VALUES (?, ?, ?, ?, ?, ?)",
+            (paper_id, name, year, subject, added, duplicates),
+        )
+        return added, duplicates
+
+    # Papers to draw on: the given ids, else the pasted text ingested as a paper of its own
+    def papers_for(self, past_questions_text="", paper_ids=None):
+        if paper_ids is not None:
+            return list(paper_ids)
+        return [self.add_text(past_questions_text)] if past_questions_text.strip() else []
+
+    def papers(self, paper_ids=None):
+        with self._lock:
+            rows = self._conn.execute("SELECT paper_id, name, year, subject, questions, duplicates FROM papers").fetchall()
+        columns = ("paper_id", "name", "year", "subject", "questions", "duplicates")
+        return [dict(zip(columns, row)) for row in rows if paper_ids is None or row[0] in paper_ids]
+
+    def _filter(self, paper_ids=None, subject=None):
+        clauses, params = [], []
+        if paper_ids is not None:
+            clauses.append(f"id IN (SELECT question_id FROM appearances WHERE paper_id IN ({','.join('?' * len(paper_ids))}))")
+            params += list(paper_ids)
+        if subject:
+            # Questions whose subject could not be told are kept
+            clauses.append("subject IN (?, '')")
+            params.append(subject)
+        return "".join(f" AND {clause}" for clause in clauses), params
+
+    def questions(self, paper_ids=None, subject=None):
+        where, params = self._filter(paper_ids, subject)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, paper_id, number, year, subject, stem, options, text, tokens FROM questions WHERE 1{where} ORDER BY id", params
+            ).fetchall()
+        return [PastQuestion(*row[:6], tuple(json.loads(row[6])), *row[7:]) for row in rows]
+
+    def paper_text(self, paper_ids=None, subject=None):
+        return "\n\n".join(question.text for question in self.questions(paper_ids, subject))
+
+    # Most frequent topic terms (the number of questions using each) across paper_ids (default:
+    # every paper), from the precomputed per-paper counts
+    def topic_counts(self, subject=None, top=20, paper_ids=None):
+        clauses, params = [], []
+        if paper_ids is not None:
+            clauses.append(f"paper_id IN ({','.join('?' * len(paper_ids))})")
+            params += list(paper_ids)
+        if subject:
+            clauses.append("subject IN (?, '')")
+            params.append(subject)
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT term, SUM(questions) AS n FROM paper_terms {where} GROUP BY term ORDER BY n DESC, term LIMIT ?",
+                params + [top],
+            ).fetchall()
+        return rows
+
+    # Chapter terms that are frequent in the chapter and distinctive in the bank (tf-idf)
+    def keywords(self, text, top=CHAPTER_KEYWORDS):
+        counts = Counter(term for term in tokenize(text) if len(term) >= MIN_TOPIC_TERM_CHARS and not term.isdigit())
+        if not counts:
+            return []
+        terms = list(counts)
+        with self._lock:
+            (total,) = self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()
+            df = {}
+            for start in range(0, len(terms), 900):
+                part = terms[start:start + 900]
+                df.update(self._conn.execute(
+                    f"SELECT term, SUM(questions) FROM paper_terms WHERE term IN ({','.join('?' * len(part))}) GROUP BY term", part
+                ).fetchall())
+        # Terms no past question uses can't find anything
+        scored = [(counts[t] * math.log(1 + total / df[t]), t) for t in terms if df.get(t)]
+        return [t for _, t in sorted(scored, reverse=True)[:top]]
+
+    def keyword_search(self, terms, k=BANK_CANDIDATES, paper_ids=None, subject=None):
+        if not terms:
+            return []
+        where, params = self._filter(paper_ids, subject)
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT questions_fts.rowid FROM questions_fts JOIN questions ON questions.id = questions_fts.rowid "
+                f"WHERE questions_fts MATCH ?{where} ORDER BY bm25(questions_fts) LIMIT ?",
+                [match] + params + [k],
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    # FAISS (inner product over normalised vectors) per embedding model, holding the questions
+    # asked for so far: any of questions not in it yet are embedded (through the embedding cache,
+    # outside the lock so other readers aren't held up) and added
+    def _vector_index(self, embedding_model, questions):
+        import faiss
+
+        model_name = get_model_name(embedding_model)
+        with self._lock:
+            entry = self._vectors.get(model_name)
+            known = entry["ids"] if entry else set()
+            new = [q for q in questions if q.id not in known]
+        if not new:
+            return entry
+        vectors = embed_texts(embedding_model, [q.text for q in new])
+        faiss.normalize_L2(vectors)
+        with self._lock:
+            entry = self._vectors.get(model_name)
+            if entry is None:
+                entry = self._vectors[model_name] = {
+                    "index": faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1])), "ids": set()
+                }
+            # Another caller may have added some of them meanwhile
+            keep = [i for i, q in enumerate(new) if q.id not in entry["ids"]]
+            if keep:
+                entry["index"].add_with_ids(vectors[keep], np.array([new[i].id for i in keep], dtype=np.int64))
+                entry["ids"].update(new[i].id for i in keep)
+        return entry
+
+    def vectors(self, embedding_model, questions):
+        entry = self._vector_index(embedding_model, questions)
+        with self._lock:
+            return np.vstack([entry["index"].reconstruct(int(q.id)) for q in questions])
+
+    def vector_search(self, embedding_model, query_vector, k=BANK_CANDIDATES, paper_ids=None, subject=None):
+        import faiss
+
+        questions = self.questions(paper_ids, subject)
+        if not questions:
+            return []
+        entry = self._vector_index(embedding_model, questions)
+        params = None
+        if paper_ids is not None or subject:
+            allowed = np.array([q.id for q in questions], dtype=np.int64)
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(allowed))
+        query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(query)
+        with timed("bank_vector_search"), self._lock:
+            _, ids = entry["index"].search(query, min(k, len(questions)), params=params)
+        return [int(i) for i in ids[0] if i != -1]
+
+    # The most representative past questions for a prompt, within budget tokens, in paper order.
+    # With a query (a chapter's text and vector) candidates come from both indexes fused with RRF;
+    # without one, from all selected questions ranked against their centroid. MMR keeps them varied.
+    # Results are cached, so asking again for the same chapter and papers costs a dict lookup.
+    def context(self, budget, paper_ids=None, subject=None, embedding_model=None, query_text="", query_vector=None):
+        questions = {q.id: q for q in self.questions(paper_ids, subject)}
+        if not questions:
+            return ""
+        vector_key = context_id(np.asarray(query_vector, dtype=np.float32).tobytes().hex()) if query_vector is not None else ""
+        key = (tuple(sorted(paper_ids)) if paper_ids is not None else None, subject, budget,
+               get_model_name(embedding_model) if embedding_model is not None else "", context_id(query_text), vector_key)
+        with self._lock:
+            cached = self._contexts.get(key)
+            if cached is not None:
+                self._contexts.move_to_end(key)
+        cache_lookup("question_bank", cached is not None)
+        if cached is not None:
+            return cached
+
+        ids = list(questions)
+        if query_text or query_vector is not None:
+            rankings = [self.keyword_search(self.keywords(query_text), BANK_CANDIDATES, paper_ids, subject)] if query_text else []
+            if embedding_model is not None and query_vector is not None:
+                rankings.append(self.vector_search(embedding_model, query_vector, BANK_CANDIDATES, paper_ids, subject))
+            fused = [qid for qid, _ in reciprocal_rank_fusion(rankings)]
+            seen = set(fused)
+            ids = fused + [qid for qid in ids if qid not in seen]
+        ids = ids[:BANK_CANDIDATES]
+
+        order = range(len(ids))
+        if embedding_model is not None:
+            vectors = self.vectors(embedding_model, [questions[qid] for qid in ids])
+            order = mmr_order(vectors.mean(axis=0) if query_vector is None else query_vector, vectors)
+        picked, used = [], 0
+        for i in order:
+            tokens = questions[ids[i]].tokens
+            if used + tokens <= budget:
+                picked.append(ids[i])
+                used += tokens
+        text = "\n\n".join(questions[qid].text for qid in sorted(picked))
+
+        with self._lock:
+            self._contexts[key] = text
+            while len(self._contexts) > BANK_CONTEXT_CACHE_SIZE:
+                self._contexts.popitem(last=False)
+        return text
+
+    def stats(self, paper_ids=None):
+        papers = self.papers(paper_ids)
+        return {
+            "papers": len(papers),
+            "questions": len(self.questions(paper_ids)),
+            "repeats": sum(p["duplicates"] for p in papers),
+            "years": sorted({p["year"] for p in papers if p["year"]}),
+        }
+
+    def describe(self, paper_ids=None, subject=None, top=8):
+        stats = self.stats(paper_ids)
+        message = f"{stats['questions']} questions from {stats['papers']} paper(s)"
+        if stats["years"]:
+            message += f" ({stats['years'][0]}–{stats['years'][-1]})"
+        if stats["repeats"]:
+            message += f", {stats['repeats']} repeats merged"
+        topics = self.topic_counts(subject, top, paper_ids)
+        if topics:
+            message += "; most asked: " + ", ".join(term for term, _ in topics)
+        return message
+
+
+@shared_resource
+def get_question_bank():
+    return QuestionBank()
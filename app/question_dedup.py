@@ -0,0 +1,240 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from config import cache_dir
+from embedding_cache import normalize_text
+from resources import shared_resource
+from response_cache import context_id
+
+# MinHash LSH: 32 bands x 4 rows puts the candidate cut-off around 0.4 Jaccard,
+# candidates are then confirmed against DEDUP_THRESHOLD on the full signature
+DEDUP_NUM_PERM = 128
+DEDUP_BANDS = 32
+DEDUP_SHINGLE_CHARS = 5
+DEDUP_THRESHOLD = float(os.getenv("DOCQA_DEDUP_THRESHOLD", "0.6"))
+DEDUP_MAX_PER_SCOPE = int(os.getenv("DOCQA_DEDUP_MAX_PER_SCOPE", "5000"))
+DEDUP_TTL_SECONDS = int(os.getenv("DOCQA_DEDUP_TTL", str(30 * 24 * 3600)))
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, (1 << 61) - 1, DEDUP_NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, (1 << 61) - 1, DEDUP_NUM_PERM, dtype=np.uint64)
+
+QUESTION_NUMBER = re.compile(r"^\s*(?:\[Chapter:[^\]]*\]\s*)?(?:Q(?:uestion)?\.?\s*)?\d{1,3}\s*[.):]\s*", re.IGNORECASE)
+META_LINE = re.compile(r"^\s*(?:answer|correct answer|difficulty|chapter|explanation)\s*[:\-]", re.IGNORECASE)
+# Past papers are rarely blank-line separated, so split them on the question numbers
+PAST_QUESTION_START = re.compile(r"(?m)^\s*(?:Q\.?\s*)?\d{1,3}\s*[.)]\s+")
+
+
+# Question stem + options only: numbering, chapter tags, answers and difficulty
+# differ between otherwise identical questions
+def normalize_question(block):
+    lines = [line for line in block.strip().splitlines() if not META_LINE.match(line)]
+    text = normalize_text(QUESTION_NUMBER.sub("", "\n".join(lines), count=1)).lower()
+    return re.sub(r"[^\w]+", " ", text).strip()
+
+
+# Character shingles survive the small rewordings ("2kg" / "2 kg") that word shingles miss
+def shingles(text):
+    if len(text) <= DEDUP_SHINGLE_CHARS:
+        return {text}
+    return {text[i:i + DEDUP_SHINGLE_CHARS] for i in range(len(text) - DEDUP_SHINGLE_CHARS + 1)}
+
+
+def minhash(text):
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles(text)), dtype=np.uint64)
+    # uint64 wrap-around is part of the hash family, silence numpy about it
+    with np.errstate(over="ignore"):
+        permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _MERSENNE_PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def similarity(a, b):
+    return float(np.mean(a == b))
+
+
+def band_keys(signature):
+    rows = DEDUP_NUM_PERM // DEDUP_BANDS
+    return [bytes([band]) + signature[band * rows:(band + 1) * rows].tobytes() for band in range(DEDUP_BANDS)]
+
+
+def split_past_questions(text):
+    starts = [m.start() for m in PAST_QUESTION_START.finditer(text)]
+    if len(starts) < 2:
+        return [block.strip() for block in re.split(r"\n[ \t]*\n", text) if block.strip()]
+    bounds = starts + [len(text)]
+    return [text[bounds[i]:bounds[i + 1]].strip() for i in range(len(starts))]
+
+
+class SeenQuestionStore:
+    # MinHash signatures per scope (a session, or one set of past papers), with LSH
+    # band buckets for candidate lookup, TTL expiry and a per-scope size cap.
+    # Given conn (and its lock), the tables live in that database under prefix and nothing
+    # is committed here: writes join the owner's transaction (see QuestionBank).
+
+    def __init__(self, path=None, ttl=DEDUP_TTL_SECONDS, max_per_scope=DEDUP_MAX_PER_SCOPE, conn=None, lock=None,
+                 prefix=""):
+        self.ttl = ttl
+        self.max_per_scope = max_per_scope
+        self._owned = conn is None
+        self._lock = lock or threading.Lock()
+        self._questions = f"{prefix}questions"
+        self._bands = f"{prefix}bands"
+        if self._owned:
+            self.path = path or os.path.join(cache_dir("dedup"), "questions.sqlite3")
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+        self._conn = conn
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self._questions} ("
+            "id INTEGER PRIMARY KEY, scope TEXT NOT NULL, signature BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self._bands} ("
+            "scope TEXT NOT NULL, bucket BLOB NOT NULL, "
+            f"question_id INTEGER NOT NULL REFERENCES {self._questions} (id) ON DELETE CASCADE)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self._questions}_scope ON {self._questions} (scope, created)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self._bands}_bucket ON {self._bands} (scope, bucket)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self._bands}_question ON {self._bands} (question_id)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self._questions}_created ON {self._questions} (created)")
+        self._purge_expired(time.time())
+        self._conn.commit()
+
+    def _commit(self):
+        if self._owned:
+            self._conn.commit()
+
+    # Every scope's expired rows: session scopes are fresh ids that never write again
+    def _purge_expired(self, now):
+        self._conn.execute(f"DELETE FROM {self._questions} WHERE created < ?", (now - self.ttl,))
+
+    # Live (unexpired) signatures in scope
+    def count(self, scope):
+        with self._lock:
+            (count,) = self._conn.execute(
+                f"SELECT COUNT(*) FROM {self._questions} WHERE scope = ? AND created >= ?",
+                (scope, time.time() - self.ttl),
+            ).fetchone()
+            return count
+
+    # (similarity, stored id) of the closest signature in scopes, (0.0, None) when nothing is close
+    def closest(self, scopes, signature):
+        keys = band_keys(signature)
+        marks = ",".join("?" * len(keys))
+        best, best_id = 0.0, None
+        with self._lock:
+            for scope in scopes:
+                rows = self._conn.execute(
+                    f"SELECT DISTINCT q.id, q.signature FROM {self._bands} b JOIN {self._questions} q ON q.id = b.question_id "
+                    f"WHERE b.scope = ? AND b.bucket IN ({marks}) AND q.created >= ?",
+                    (scope, *keys, time.time() - self.ttl),
+                ).fetchall()
+                for question_id, blob in rows:
+                    score = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+                    if score > best:
+                        best, best_id = score, question_id
+        return best, best_id
+
+    def best_match(self, scopes, signature):
+        return self.closest(scopes, signature)[0]
+
+    # Returns the stored ids of the new signatures
+    def add_many(self, scope, signatures):
+        now = time.time()
+        ids = []
+        with self._lock:
+            for signature in signatures:
+                question_id = self._conn.execute(
+                    f"INSERT INTO {self._questions} (scope, signature, created) VALUES (?, ?, ?)",
+                    (scope, signature.tobytes(), now),
+                ).lastrowid
+                ids.append(question_id)
+                self._conn.executemany(
+                    f"INSERT INTO {self._bands} (scope, bucket, question_id) VALUES (?, ?, ?)",
+                    [(scope, key, question_id) for key in band_keys(signature)],
+                )
+            self._purge_expired(now)
+            (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self._questions} WHERE scope = ?", (scope,)).fetchone()
+            if count > self.max_per_scope:
+                # Oldest first, with 10% headroom so this doesn't run on every insert
+                excess = count - int(self.max_per_scope * 0.9)
+                self._conn.execute(
+                    f"DELETE FROM {self._questions} WHERE id IN "
+                    f"(SELECT id FROM {self._questions} WHERE scope = ? ORDER BY created, id LIMIT ?)",
+                    (scope, excess),
+                )
+            self._commit()
+        return ids
+
+    def clear(self, scope):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self._questions} WHERE scope = ?", (scope,))
+            self._commit()
+
+
+@shared_resource
+def get_seen_question_store():
+    return SeenQuestionStore()
+
+
+class QuestionDeduper:
+    # Filters generated MCQs that repeat (or paraphrase) a question this scope has
+    # already been shown, or that copy one of the uploaded past-paper questions.
+    # scope=None keeps the history in memory for a single call only.
+
+    def __init__(self, scope=None, store=None, threshold=DEDUP_THRESHOLD):
+        self.scope = scope
+        self.store = store or (get_seen_question_store() if scope else SeenQuestionStore(":memory:"))
+        self.threshold = threshold
+        self.reference_scopes = []
+
+    def add_reference(self, past_questions_text):
+        if not past_questions_text.strip():
+            return
+        # Keyed by content, so every session uploading the same papers shares one copy
+        scope = f"paper:{context_id(past_questions_text)}"
+        # Once a paper's signatures expire they are added again
+        if self.store.count(scope) == 0:
+            signatures = [minhash(normalize_question(q)) for q in split_past_questions(past_questions_text)]
+            self.store.add_many(scope, signatures)
+        if scope not in self.reference_scopes:
+            self.reference_scopes.append(scope)
+
+    # Returns None for a fresh question, else "past_paper" or "seen"
+    def check(self, block):
+        signature = minhash(normalize_question(block))
+        if self.reference_scopes and self.store.best_match(self.reference_scopes, signature) >= self.threshold:
+            return "past_paper"
+        if self.store.best_match([self._session_scope], signature) >= self.threshold:
+            return "seen"
+        return None
+
+    def add(self, block):
+        self.store.add_many(self._session_scope, [minhash(normalize_question(block))])
+
+    # Keep only fresh questions and remember them; allow_seen lets repeats of this
+    # scope's earlier questions through (e.g. a deliberately reused cached answer).
+    # key turns an item (e.g. an MCQ record) into its question text.
+    def filter(self, items, allow_seen=False, key=None):
+        fresh = []
+        for item in items:
+            block = key(item) if key else item
+            reason = self.check(block)
+            if reason is None:
+                self.add(block)
+            if reason is None or (allow_seen and reason == "seen"):
+                fresh.append(item)
+        return fresh
+
+    @property
+    def _session_scope(self):
+        return f"session:{self.scope or 'local'}"
@@ -0,0 +1,86 @@
+import math
+import os
+
+from hybrid_search import BM25Index
+from token_utils import count_tokens
+
+# Questions asked for in one prompt (each JSON line is ~80 tokens of completion)
+MAX_QUESTIONS_PER_CALL = int(os.getenv("DOCQA_MAX_QUESTIONS_PER_CALL", "15"))
+# Chapter context carried per requested question. A chapter asked for few questions gets
+# little context, so several such chapters fit in one call.
+CONTEXT_TOKENS_PER_QUESTION = int(os.getenv("DOCQA_CONTEXT_TOKENS_PER_QUESTION", "300"))
+# Follow-up rounds for chapters that came back short (dropped as malformed or duplicate)
+MAX_TOPUP_ROUNDS = int(os.getenv("DOCQA_MAX_TOPUP_ROUNDS", "2"))
+WEIGHTINGS = ("size", "past_papers")
+
+
+# Largest-remainder (Hamilton) apportionment: quotas are proportional to weights and sum
+# to exactly total. Ties go to the heavier chapter, then the earlier one.
+def allocate_quotas(weights, total):
+    if not weights or total <= 0:
+        return [0] * len(weights)
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        weights, weight_sum = [1] * len(weights), len(weights)
+    shares = [total * weight / weight_sum for weight in weights]
+    quotas = [math.floor(share) for share in shares]
+    order = sorted(range(len(weights)), key=lambda i: (-(shares[i] - quotas[i]), -weights[i], i))
+    for i in order[:total - sum(quotas)]:
+        quotas[i] += 1
+    return quotas
+
+
+# How many past-paper questions land on each chapter: every question (e.g. from the
+# question bank) votes for the chapter it matches best under BM25; questions matching nothing don't vote
+def topic_frequency(chapter_texts, past_questions):
+    counts = [0] * len(chapter_texts)
+    if not past_questions or not chapter_texts:
+        return counts
+    index = BM25Index(chapter_texts)
+    for question in past_questions:
+        best = index.search(question, 1)
+        if best:
+            counts[best[0]] += 1
+    return counts
+
+
+# weighting="size": chapter length in tokens (sizes, when already counted); "past_papers": how
+# often the past papers ask about the chapter (+1, so one they never mention can still get a question)
+def chapter_weights(chapter_texts, past_questions=(), weighting="size", model=None, sizes=None):
+    if weighting == "past_papers" and past_questions:
+        return [count + 1 for count in topic_frequency(chapter_texts, past_questions)]
+    return list(sizes) if sizes is not None else [count_tokens(text, model) for text in chapter_texts]
+
+
+# Context tokens for a chapter of size tokens asked for questions questions, at most cap
+def context_budget(size, questions, cap, per_question=CONTEXT_TOKENS_PER_QUESTION):
+    return min(size, questions * per_question, cap)
+
+
+# Packs (chapter, quota) work into calls: first-fit decreasing on context tokens, so small
+# chapters share a prompt up to budget tokens of chapter context and max_questions questions.
+# A quota above max_questions is split across calls that each carry the chapter's context.
+def plan_calls(names, quotas, context_tokens, budget, max_questions=MAX_QUESTIONS_PER_CALL):
+    parts = []
+    for name, quota, tokens in zip(names, quotas, context_tokens):
+        while quota > 0:
+            parts.append((name, min(quota, max_questions), min(tokens, budget)))
+            quota -= max_questions
+
+    calls = []
+    for name, quota, tokens in sorted(parts, key=lambda part: -part[2]):
+        for call in calls:
+            if (call["context_tokens"] + tokens <= budget and call["questions"] + quota <= max_questions
+                    and name not in dict(call["chapters"])):
+                call["chapters"].append((name, quota))
+                call["context_tokens"] += tokens
+                call["questions"] += quota
+                break
+        else:
+            calls.append({"chapters": [(name, quota)], "context_tokens": tokens, "questions": quota})
+    return calls
+
+
+# Per-chapter shortfall after a round: quota minus what was kept
+def shortfall(quotas, delivered):
+    return {name: quota - delivered.get(name, 0) for name, quota in quotas.items() if quota > delivered.get(name, 0)}
@@ -0,0 +1,74 @@
+import functools
+import threading
+import time
+
+# Every @shared_resource factory in the process, by qualified name
+_registry = {}
+
+
+class SharedResource:
+    # Process-wide memoised factory (the st.cache_resource idea without Streamlit): one
+    # instance per argument tuple, built once even when several sessions ask at the same
+    # time, and shared by the Streamlit app, the API and the benchmarks alike
+
+    def __init__(self, factory):
+        functools.update_wrapper(self, factory)
+        self.factory = factory
+        self.name = f"{factory.__module__}.{factory.__qualname__}"
+        self._values = {}
+        self._building = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.build_seconds = 0.0
+
+    def __call__(self, *args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+        try:
+            value = self._values[key]
+            self.hits += 1
+            return value
+        except KeyError:
+            pass
+
+        with self._lock:
+            building = self._building.setdefault(key, threading.Lock())
+        with building:
+            if key in self._values:
+                self.hits += 1
+                return self._values[key]
+            start = time.perf_counter()
+            value = self.factory(*args, **kwargs)
+            self.build_seconds += time.perf_counter() - start
+            self.builds += 1
+            self._values[key] = value
+        return value
+
+    def cache_clear(self):
+        with self._lock:
+            self._values.clear()
+            self._building.clear()
+
+
+def shared_resource(factory):
+    resource = SharedResource(factory)
+    _registry[resource.name] = resource
+    return resource
+
+
+def clear_resources():
+    for resource in _registry.values():
+        resource.cache_clear()
+
+
+def resource_report():
+    return [
+        {
+            "name": name,
+            "instances": len(resource._values),
+            "builds": resource.builds,
+            "hits": resource.hits,
+            "build_seconds": resource.build_seconds,
+        }
+        for name, resource in sorted(_registry.items())
+    ]
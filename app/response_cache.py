@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import cache_dir
+from metrics import cache_lookup
+from resources import shared_resource
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("DOCQA_RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("DOCQA_RESPONSE_CACHE_MAX_ENTRIES", "20000"))
+
+
+def make_response_key(model, temperature, prompt, context_ids=()):
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "prompt": prompt, "context": list(context_ids)},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def context_id(text):
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def llm_signature(llm):
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+    return model, getattr(llm, "temperature", 0) or 0
+
+
+# Key of a retrieval-augmented answer. The QA prompt is rendered from the question and the
+# chunks alone, so (model, question, chunk ids) stands for it. An answer produced by any other
+# prompt gets a namespace (e.g. "bulk": one of several questions asked together) and is never
+# served to a single-question ask.
+def answer_key(llm, question, chunks, namespace=""):
+    model, temperature = llm_signature(llm)
+    prompt = f"{namespace}\0{question}" if namespace else question
+    return make_response_key(model, temperature, prompt, [context_id(chunk) for chunk in chunks])
+
+
+class ResponseCache:
+    # Persistent prompt -> completion cache with TTL and LRU size eviction
+
+    def __init__(self, path=None, ttl=RESPONSE_CACHE_TTL_SECONDS, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path or os.path.join(cache_dir("responses"), "responses.sqlite3")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                # Evict in bulk (10% headroom) so we don't pay for this on every insert
+                excess = count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+            }
+
+
+@shared_resource
+def get_response_cache():
+    return ResponseCache()
+
+
+# Cached values of keys (None where missing), counted as response cache hits / misses
+def lookup_many(keys, cache=None):
+    cache = cache or get_response_cache()
+    results = [cache.get(key) for key in keys]
+    hits = sum(result is not None for result in results)
+    cache_lookup("response", True, hits)
+    cache_lookup("response", False, len(results) - hits)
+    return results
+
+
+# Serve a generation from the cache, or run generate() and remember its output.
+# bypass=None means "cache only deterministic (temperature 0) calls"; key overrides the
+# (prompt, context_ids) key, e.g. with answer_key().
+def cached_generate(llm, prompt, generate, context_ids=(), bypass=None, cache=None, on_hit=None, key=None):
+    model, temperature = llm_signature(llm)
+    if bypass is None:
+        bypass = temperature > 0
+    if bypass:
+        return generate()
+
+    cache = cache or get_response_cache()
+    key = key or make_response_key(model, temperature, prompt, context_ids)
+    cached = cache.get(key)
+    cache_lookup("response", cached is not None)
+    if cached is not None:
+        if on_hit:
+            on_hit(cached)
+        return cached
+    result = generate()
+    cache.put(key, result)
+    return result
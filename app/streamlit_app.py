@@ -1,14 +1,12 @@
-import os
 import streamlit as st
-import pdfplumber
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, OpenAI
-from langchain_community.vectorstores import FAISS as LangchainFAISS
-from langchain.chains import RetrievalQA
 
+# Tab modules import only light dependencies; LangChain, OpenAI, FAISS and pdfplumber are
+# loaded on first use and clients live in the process-wide registry (see resources)
+from ask_pdf_tab import show_ask_pdf_tab
 from predict_from_past_tab import show_predict_from_past_tab
 from predict_neet_tab import show_predict_neet_tab
 from mcq_generator_tab import show_mcq_generator_tab
+from metrics import registry, summarize_trace, trace
 
 # ✅ MUST be first Streamlit command
 st.set_page_config(page_title="📄 AI-Powered NEET Assistant", layout="centered")
@@ -27,8 +25,25 @@ if not OPENAI_API_KEY:
     st.warning("Please enter your OpenAI API key to use the app.")
     st.stop()
 
+def show_trace_panel(spans):
+    # Where this interaction's time and tokens went (stages recorded by metrics.timed)
+    summary = summarize_trace(spans)
+    with st.sidebar.expander("🔬 Request trace", expanded=True):
+        st.caption(
+            f"{summary['prompt_tokens']} prompt + {summary['completion_tokens']} completion tokens, "
+            f"≈ ${summary['cost_usd']:.4f}"
+        )
+        st.dataframe(
+            [{"stage": stage, "calls": row["calls"], "seconds": round(row["seconds"], 3)} for stage, row in summary["stages"].items()],
+            hide_index=True,
+        )
+        hit_rates = registry.cache_hit_rates()
+        if hit_rates:
+            st.caption("Cache hit rates: " + ", ".join(f"{cache} {rate:.0%}" for cache, rate in sorted(hit_rates.items())))
+
 # Tab Layout
 st.title("📄 AI-Powered NEET Assistant")
+show_trace = st.sidebar.toggle("🔬 Show request trace", key="show_trace")
 
 tab1, tab2, tab3, tab4 = st.tabs([
     "📊 Predict from Past Papers",
@@ -37,55 +52,18 @@ tab1, tab2, tab3, tab4 = st.tabs([
     "📝 Generate MCQs"
 ])
 
-with tab1:
-    show_predict_from_past_tab(OPENAI_API_KEY)
-
-with tab2:
-    # You already had this tab
-    def extract_text_from_pdf(file):
-        text = ""
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text
-
-    def split_text(text):
-        splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50, separator="\n")
-        return splitter.split_text(text)
-
-    def build_vector_store(text_chunks):
-        embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        return LangchainFAISS.from_texts(text_chunks, embedding=embeddings), embeddings
-
-    def answer_question(query, vector_store, embeddings):
-        retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 2})
-        llm = OpenAI(openai_api_key=OPENAI_API_KEY, temperature=0)
-        qa = RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
-        result = qa.invoke(query)
-        return result['result'] if isinstance(result, dict) and 'result' in result else result
-
-    st.header("📘 Ask Your PDF")
-    uploaded_file = st.file_uploader("📤 Upload a PDF file", type="pdf")
-
-    if uploaded_file:
-        with st.spinner("Reading and indexing your PDF..."):
-            text = extract_text_from_pdf(uploaded_file)
-            chunks = split_text(text)
-            vector_store, embeddings = build_vector_store(chunks)
-            st.success("PDF processed successfully!")
+with trace(enabled=show_trace) as spans:
+    with tab1:
+        show_predict_from_past_tab(OPENAI_API_KEY)
 
-        question = st.text_input("❓ Ask a question from your document")
+    with tab2:
+        show_ask_pdf_tab(OPENAI_API_KEY)
 
-        if question:
-            with st.spinner("Thinking..."):
-                answer = answer_question(question, vector_store, embeddings)
-                st.markdown("### 🧠 Answer:")
-                st.write({"query": question, "result": answer})
+    with tab3:
+        show_predict_neet_tab(OPENAI_API_KEY)
 
-with tab3:
-    show_predict_neet_tab(OPENAI_API_KEY)
+    with tab4:
+        show_mcq_generator_tab(OPENAI_API_KEY)
 
-with tab4:
-    show_mcq_generator_tab(OPENAI_API_KEY)
+if show_trace:
+    show_trace_panel(spans)
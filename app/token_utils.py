@@ -0,0 +1,26 @@
+import tiktoken
+
+from resources import shared_resource
+
+DEFAULT_ENCODING = "cl100k_base"
+
+
+# Encoders are expensive to build, so keep one per model for the whole process
+@shared_resource
+def get_encoding(model=None):
+    try:
+        name = tiktoken.encoding_name_for_model(model) if model else DEFAULT_ENCODING
+    except KeyError:
+        name = DEFAULT_ENCODING
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:
+        # BPE files could not be downloaded (offline box): fall back to estimating
+        return None
+
+
+def count_tokens(text, model=None):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,25 @@
+import time
+
+
+class LiveText:
+    # Renders streamed text into an st.empty() placeholder, throttled so a fast
+    # token stream doesn't flood the browser with redraws
+
+    def __init__(self, placeholder, min_interval=0.15, code_block=True):
+        self.placeholder = placeholder
+        self.min_interval = min_interval
+        self.code_block = code_block
+        self.text = ""
+        self._last_render = 0.0
+
+    def append(self, piece):
+        self.text += piece
+        if time.monotonic() - self._last_render >= self.min_interval:
+            self.render()
+
+    def render(self):
+        self._last_render = time.monotonic()
+        if self.code_block:
+            self.placeholder.markdown(f"```text\n{self.text}```")
+        else:
+            self.placeholder.markdown(self.text)
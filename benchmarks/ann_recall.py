@@ -0,0 +1,52 @@
+# Recall@k vs latency vs memory of every ANN index type against the exact flat baseline.
+#
+#   python benchmarks/ann_recall.py --vectors 200000 --dim 1536 --output ann_report.json
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from ann_index import INDEX_TYPES, recall_report  # noqa: E402
+
+
+# Clustered vectors: real chunk embeddings are grouped by topic, which is what IVF relies on
+def synthetic_vectors(count, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN index recall/latency report")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=INDEX_TYPES, choices=INDEX_TYPES)
+    parser.add_argument("--output", default="ann_report.json")
+    args = parser.parse_args()
+
+    data = synthetic_vectors(args.vectors + args.queries, args.dim, args.clusters, seed=0)
+    vectors, queries = data[:args.vectors], data[args.vectors:]
+    rows = recall_report(vectors, queries, k=args.k, index_types=args.types)
+
+    print(f"{'index':<12} {'params':<18} {'recall@' + str(args.k):>10} {'ms/query':>10} {'MB':>10}")
+    for row in rows:
+        params = ",".join(f"{k}={v}" for k, v in row["params"].items())
+        print(
+            f"{row['index_type']:<12} {params:<18} {row['recall_at_k']:>10.3f} "
+            f"{row['latency_ms']:>10.3f} {row['memory_bytes'] / 1e6:>10.1f}"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
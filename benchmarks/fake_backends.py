@@ -0,0 +1,133 @@
+# Deterministic, offline stand-ins for OpenAIEmbeddings, OpenAI and ChatOpenAI.
+# Same input -> same output, with an optional simulated network latency.
+import hashlib
+import json
+import re
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.language_models.llms import LLM
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, GenerationChunk
+
+FAKE_EMBEDDING_DIM = 1536
+
+
+def _seed(text):
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, dim=FAKE_EMBEDDING_DIM, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model = f"fake-embedding-{dim}"
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _vector(self, text):
+        vector = np.random.default_rng(_seed(text)).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def embed_documents(self, texts):
+        # One "request" per call, like the real client
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# Bag-of-words feature hashing: texts sharing words get similar vectors, so vector
+# retrieval behaves plausibly offline (FakeEmbeddings vectors are unrelated to the text)
+class HashingEmbeddings(FakeEmbeddings):
+    def __init__(self, dim=256, latency=0.0):
+        super().__init__(dim, latency)
+        self.model = f"hashing-embedding-{dim}"
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            seed = _seed(word)
+            vector[seed % self.dim] += 1.0 if (seed >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+# Canned MCQs in the format the generators ask for (JSON Lines or the older text
+# format); the count follows the prompt
+def fake_mcq_text(prompt, default_count=5):
+    match = re.search(r"(?:Generate|Predict)\s+(\d+)", prompt)
+    count = int(match.group(1)) if match else default_count
+    as_json = "JSON" in prompt
+    seed = _seed(prompt)
+    blocks = []
+    for i in range(1, count + 1):
+        value = (seed >> (i % 32)) % 97 + 1
+        question = f"A body of mass {value} kg moves with velocity {i} m/s. What is its momentum?"
+        options = [f"{value * i} kg m/s", f"{value + i} kg m/s", f"{value} kg m/s", f"{i} kg m/s"]
+        difficulty = ["Easy", "Medium", "Hard"][i % 3]
+        if as_json:
+            blocks.append(json.dumps({"question": question, "options": options, "answer": "A", "difficulty": difficulty}))
+        else:
+            blocks.append(
+                f"Q{i}. {question}\n" + "".join(f"{l}. {o}\n" for l, o in zip("ABCD", options))
+                + f"Answer: A\nDifficulty: {difficulty}"
+            )
+    return ("\n" if as_json else "\n\n").join(blocks)
+
+
+# Numbered answers for a multi-question prompt (see bulk_qa.BULK_PROMPT)
+def fake_answers_text(prompt):
+    questions = prompt.split("Questions:", 1)[1].split("\n\n", 1)[0]
+    numbers = re.findall(r"^(\d+)\. ", questions, re.MULTILINE)
+    return "\n".join(f"{n}. Fake answer {_seed(prompt + n) % 1000}." for n in numbers)
+
+
+def _pieces(text, size=16):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeLLM(LLM):
+    model_name: str = "fake-llm"
+    temperature: float = 0.0
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-llm"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        if "Questions:" in prompt:
+            return fake_answers_text(prompt)
+        return fake_mcq_text(prompt)
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        for piece in _pieces(self._call(prompt)):
+            yield GenerationChunk(text=piece)
+
+
+class FakeChatModel(SimpleChatModel):
+    model_name: str = "fake-chat"
+    temperature: float = 0.0
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return fake_mcq_text(messages[-1].content)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for piece in _pieces(self._call(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
@@ -0,0 +1,165 @@
+# Retrieval hit rate on a small labelled set: NEET physics notes rendered to a PDF, extracted
+# and chunked like an upload, then each question is checked for whether one of the top-k
+# chunks contains its expected passage.
+#
+#   python benchmarks/retrieval_eval.py                      # offline, hashing embeddings
+#   python benchmarks/retrieval_eval.py --embeddings openai  # real embeddings (needs OPENAI_API_KEY)
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, "benchmarks", "data")
+os.environ.setdefault("DOCQA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "docqa-retrieval-eval"))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.pdfbase.pdfmetrics import stringWidth  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+
+from langchain.text_splitter import CharacterTextSplitter  # noqa: E402
+
+from chunking import chunk_pdf, chunk_text  # noqa: E402
+from fake_backends import HashingEmbeddings  # noqa: E402
+from hybrid_search import HybridRetriever, get_reranker  # noqa: E402
+from main import create_faiss_index, extract_text_from_pdf  # noqa: E402
+from pdf_export import get_fonts  # noqa: E402
+
+# "character" is the old 500/50 CharacterTextSplitter, kept as the baseline
+CHUNKERS = {
+    "character": lambda text, pdf_path: CharacterTextSplitter(
+        separator="\n", chunk_size=500, chunk_overlap=50, length_function=len
+    ).split_text(text),
+    "structured-text": lambda text, pdf_path: chunk_text(text),
+    "structured-pdf": lambda text, pdf_path: chunk_pdf(pdf_path),
+}
+
+
+def _wrap(text, font, size, width):
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if line and stringWidth(candidate, font, size) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    return lines + [line] if line else lines
+
+
+# Headings in a larger bold font, paragraphs wrapped like a textbook page
+def render_notes_pdf(markdown_path, pdf_path):
+    font, bold = get_fonts()
+    width, height = A4
+    c = canvas.Canvas(pdf_path, pagesize=A4)
+    y = height - 50
+    with open(markdown_path, encoding="utf-8") as f:
+        for raw in f:
+            raw = raw.rstrip("\n")
+            is_heading = raw.startswith("# ")
+            text, face, size = (raw[2:], bold, 15) if is_heading else (raw, font, 10.5)
+            lines = _wrap(text, face, size, width - 100) if text else [""]
+            for line in lines:
+                if y < 60:
+                    c.showPage()
+                    y = height - 50
+                if is_heading:
+                    y -= 8
+                c.setFont(face, size)
+                c.drawString(50, y, line)
+                y -= size + 4
+    c.save()
+
+
+def load_eval_set(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def score(rankings, chunks, eval_set, k):
+    hits, reciprocal_ranks = 0, 0.0
+    for ranking, item in zip(rankings, eval_set):
+        expected = _normalize(item["expected"])
+        for rank, chunk_id in enumerate(ranking[:k]):
+            if expected in _normalize(chunks[chunk_id]):
+                hits += 1
+                reciprocal_ranks += 1.0 / (rank + 1)
+                break
+    return {"hit_rate": hits / len(eval_set), "mrr": reciprocal_ranks / len(eval_set)}
+
+
+def evaluate(chunks, embedding_model, eval_set, k):
+    index, _ = create_faiss_index(chunks, embedding_model, index_type="flat")
+    retriever = HybridRetriever(index, chunks, embedding_model, reranker=False)
+    questions = [item["question"] for item in eval_set]
+
+    vector = retriever.vector_candidates(questions, k)
+    start = time.perf_counter()
+    lexical = [retriever.lexical_candidates(question, k) for question in questions]
+    bm25_ms = (time.perf_counter() - start) * 1000 / len(questions)
+    rows = {
+        "vector": score(vector, chunks, eval_set, k),
+        "bm25": score(lexical, chunks, eval_set, k),
+        "hybrid": score([[i for i, _ in hits] for hits in retriever.search_many(questions, k)], chunks, eval_set, k),
+    }
+    rows["bm25"]["query_ms"] = bm25_ms
+    reranker = get_reranker()
+    if reranker is not None:
+        retriever.reranker = reranker
+        rows["hybrid+rerank"] = score(
+            [[i for i, _ in hits] for hits in retriever.search_many(questions, k)], chunks, eval_set, k
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval hit-rate evaluation")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunkers", nargs="+", default=list(CHUNKERS), choices=list(CHUNKERS))
+    parser.add_argument("--embeddings", choices=["hashing", "openai"], default="hashing")
+    parser.add_argument("--notes", default=os.path.join(DATA_DIR, "physics_notes.md"))
+    parser.add_argument("--eval-set", default=os.path.join(DATA_DIR, "retrieval_eval.jsonl"))
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    if args.embeddings == "openai":
+        from llm_client import get_embedding_model
+        from main import get_openai_api_key
+
+        embedding_model = get_embedding_model(get_openai_api_key())
+    else:
+        embedding_model = HashingEmbeddings()
+
+    eval_set = load_eval_set(args.eval_set)
+    pdf_path = os.path.join(os.environ["DOCQA_CACHE_DIR"], "physics_notes.pdf")
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+    render_notes_pdf(args.notes, pdf_path)
+    text = extract_text_from_pdf(pdf_path)
+
+    report = {"embeddings": args.embeddings, "questions": len(eval_set), "results": {}}
+    print(f"{'chunker':<16} {'chunks':>6} {'k':>3} {'mode':<14} {'hit rate':>9} {'MRR':>6}")
+    for name in args.chunkers:
+        chunks = CHUNKERS[name](text, pdf_path)
+        report["results"][name] = {"chunks": len(chunks), "by_k": {}}
+        for k in args.k:
+            rows = evaluate(chunks, embedding_model, eval_set, k)
+            report["results"][name]["by_k"][k] = rows
+            for mode, row in rows.items():
+                print(f"{name:<16} {len(chunks):>6} {k:>3} {mode:<14} {row['hit_rate']:>9.2f} {row['mrr']:>6.2f}")
+        print(f"{name:<16} BM25 search: {rows['bm25']['query_ms']:.3f} ms/query")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# Offline benchmark of the hot paths, using fake OpenAI backends.
+#
+#   python benchmarks/run_benchmarks.py --pages 10 100 300 --output bench.json
+#   python benchmarks/run_benchmarks.py --compare bench_before.json --output bench_after.json
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="docqa-bench-")
+# Every cache the app keeps goes into a throwaway folder, so runs start cold
+os.environ["DOCQA_CACHE_DIR"] = os.path.join(WORK_DIR, "cache")
+sys.path[:0] = [os.path.join(ROOT, "app"), os.path.join(ROOT, "utils")]
+
+from ann_index import build_index, choose_index_type  # noqa: E402
+from fake_backends import FakeEmbeddings, FakeLLM, fake_mcq_text  # noqa: E402
+from generate_sample_pdf import create_synthetic_pdf  # noqa: E402
+from embedding_cache import CachedEmbeddings, EmbeddingStore  # noqa: E402
+from bulk_qa import BulkAnswerer  # noqa: E402
+from document_store import DocumentStore  # noqa: E402
+from main import DocumentIndex, extract_text_from_pdf, split_text_into_chunks  # noqa: E402
+from mcq_records import MCQBatch, parse_mcq_output  # noqa: E402
+from pdf_export import create_pdf_download  # noqa: E402
+from question_bank import QuestionBank  # noqa: E402
+
+
+def measure(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return {"min_s": min(timings), "median_s": statistics.median(timings), "runs": repeat}, result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_corpus(pages, args):
+    results = {}
+    pdf_path = create_synthetic_pdf(os.path.join(WORK_DIR, f"synthetic_{pages}p.pdf"), pages)
+
+    text = ""
+    for backend in args.backends:
+        results[f"extract[{backend}]"], text = measure(lambda: extract_text_from_pdf(pdf_path, backend), args.repeat)
+    results["extract_chars"] = len(text)
+
+    # Shared document store: first upload extracts + compresses, repeats (any session) only hash
+    documents = DocumentStore(os.path.join(WORK_DIR, f"documents_{pages}"))
+    results["document_store_add"], handle = measure(lambda: documents.add_pdf(pdf_path), 1)
+    results["document_store_reupload"], _ = measure(lambda: documents.add_pdf(pdf_path), args.repeat)
+    results["document_store_text"], _ = measure(lambda: documents.text(handle), args.repeat)
+    results["document_store_add"]["compressed_bytes"] = documents.stats()["compressed_bytes"]
+
+    results["chunk"], chunks = measure(lambda: split_text_into_chunks(text), args.repeat)
+    results["chunk_count"] = len(chunks)
+
+    # Cold: every chunk goes to the (fake) API. Warm: everything comes from the local store.
+    fake = FakeEmbeddings(latency=args.embed_latency)
+    store = EmbeddingStore(os.path.join(WORK_DIR, f"embeddings_{pages}.sqlite3"))
+    embeddings = CachedEmbeddings(fake, store=store)
+    results["embed_cold"], vectors = measure(lambda: embeddings.embed_array(chunks), 1)
+    results["embed_cold"]["api_calls"] = fake.calls
+    results["embed_warm"], _ = measure(lambda: embeddings.embed_array(chunks), args.repeat)
+
+    # The index the app would build (DOCQA_INDEX_TYPE), then any other requested types
+    results["index_build"], index = measure(lambda: build_index(vectors), args.repeat)
+    results["index_build"]["index_type"] = choose_index_type(len(vectors))
+    for index_type in args.index_types:
+        results[f"index_build[{index_type}]"], _ = measure(lambda: build_index(vectors, index_type), args.repeat)
+        results[f"index_build[{index_type}]"]["index_type"] = choose_index_type(len(vectors), index_type)
+
+    document_index = DocumentIndex(index, chunks, embeddings, llm=FakeLLM(latency=args.llm_latency))
+    queries = [f"Question {i}: what is the momentum of a body?" for i in range(args.queries)]
+    results["search_many"], _ = measure(lambda: document_index.search_many(queries), args.repeat)
+    results["search_many"]["queries"] = len(queries)
+
+    # Whole worksheet, uncached: shared-context questions go out as one prompt, prompts run concurrently
+    answerer = BulkAnswerer(document_index)
+    results["bulk_qa"], _ = measure(lambda: list(answerer.answer(queries, use_cache=False)), 1)
+    results["bulk_qa"].update(queries=len(queries), llm_calls=answerer.llm_calls)
+
+    mcq_text = fake_mcq_text(f"Generate {args.mcqs} MCQs as JSON Lines")
+    results["mcq_parse"], (records, _) = measure(lambda: parse_mcq_output(mcq_text), args.repeat)
+    results["mcq_parse"]["questions"] = len(records)
+    batch = MCQBatch(records)
+
+    # Past-paper bank: segment + dedup + index once, then per-prompt selection (cold, then cached)
+    bank = QuestionBank(os.path.join(WORK_DIR, f"bank_{pages}"))
+    past_text = fake_mcq_text(f"Generate {args.mcqs} MCQs")
+    results["bank_ingest"], paper_id = measure(lambda: bank.add_text(past_text), 1)
+    results["bank_ingest"]["questions"] = bank.stats([paper_id])["questions"]
+    results["bank_context_cold"], _ = measure(lambda: bank.context(1500, [paper_id], embedding_model=embeddings), 1)
+    results["bank_context"], _ = measure(lambda: bank.context(1500, [paper_id], embedding_model=embeddings), args.repeat)
+    results["export_csv"], _ = measure(batch.to_csv, args.repeat)
+    results["export_parquet"], _ = measure(batch.to_parquet, args.repeat)
+    results["export_pdf"], _ = measure(lambda: create_pdf_download(batch), args.repeat)
+    return results
+
+
+def compare(previous, current, threshold):
+    regressions = []
+    for pages, stages in current["results"].items():
+        for stage, value in stages.items():
+            old = previous.get("results", {}).get(pages, {}).get(stage)
+            if not isinstance(value, dict) or not isinstance(old, dict):
+                continue
+            ratio = value["min_s"] / old["min_s"] if old["min_s"] else float("inf")
+            flag = "REGRESSION" if ratio > 1 + threshold else ""
+            print(f"{pages:>6}p  {stage:<24} {old['min_s']:.4f}s -> {value['min_s']:.4f}s  x{ratio:.2f} {flag}")
+            if flag:
+                regressions.append((pages, stage))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the Document QnA hot paths")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument("--backends", nargs="+", default=["pdfplumber", "pypdfium2"])
+    parser.add_argument("--index-types", nargs="*", default=[], help="also time these index types (see ann_index)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--mcqs", type=int, default=500)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="simulated seconds per embeddings request")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="previous JSON result to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown ratio counted as a regression")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.time(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+    for pages in args.pages:
+        print(f"Benchmarking {pages}-page corpus...")
+        report["results"][str(pages)] = bench_corpus(pages, args)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
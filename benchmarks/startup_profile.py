@@ -0,0 +1,115 @@
+# Cold-start and rerun profile of the Streamlit app, fully offline.
+#
+# Import cost of each module is measured in a fresh interpreter (python -X importtime);
+# the app itself is driven with Streamlit's AppTest: one cold first run, then reruns
+# and widget interactions, which is what a user pays on every click.
+#
+#   python benchmarks/startup_profile.py
+#   python benchmarks/startup_profile.py --reruns 20 --output startup.json
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+os.environ.setdefault("DOCQA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "docqa-startup-profile"))
+sys.path.insert(0, APP_DIR)
+
+MODULES = ["ask_pdf_tab", "predict_from_past_tab", "predict_neet_tab", "mcq_generator_tab", "main"]
+
+
+# (seconds to import module, heaviest top-level packages it pulled in) in a fresh interpreter
+def import_profile(module, top=6):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, capture_output=True, text=True, check=True,
+    )
+    total, packages = 0.0, defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative = int(cumulative) / 1e6
+        except ValueError:
+            continue  # header line
+        name = name.strip()
+        if name == module:
+            total = cumulative
+        else:
+            package = name.split(".")[0]
+            packages[package] = max(packages[package], cumulative)
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return total, heaviest
+
+
+def _timed_run(app):
+    start = time.perf_counter()
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return time.perf_counter() - start
+
+
+def rerun_profile(reruns):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(APP_DIR, "streamlit_app.py"), default_timeout=120)
+    app.secrets["OPENAI_API_KEY"] = "sk-offline-profile"
+    first = _timed_run(app)
+    plain = [_timed_run(app) for _ in range(reruns)]
+
+    # Changing a widget reruns the whole script, like a user clicking around
+    interactions = []
+    for _ in range(reruns):
+        use_cache = app.checkbox(key="mcq_use_cache")
+        use_cache.set_value(not use_cache.value)
+        interactions.append(_timed_run(app))
+
+    return {
+        "first_run_s": first,
+        "rerun_median_s": statistics.median(plain),
+        "rerun_max_s": max(plain),
+        "interaction_median_s": statistics.median(interactions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit cold-start and rerun profile")
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    report = {"imports": {}}
+    print(f"{'module':<24} {'import s':>9}  heaviest dependencies")
+    for module in args.modules:
+        total, heaviest = import_profile(module)
+        report["imports"][module] = {"seconds": total, "heaviest": dict(heaviest)}
+        print(f"{module:<24} {total:>9.2f}  " + ", ".join(f"{name} {seconds:.2f}" for name, seconds in heaviest))
+
+    # Runs in this (still cold) process, so the first run includes every import the app needs
+    report["app"] = rerun_profile(args.reruns)
+    for name, seconds in report["app"].items():
+        print(f"{name:<24} {seconds:>9.3f}")
+
+    from resources import resource_report
+
+    report["resources"] = resource_report()
+    for row in report["resources"]:
+        if row["builds"] or row["hits"]:
+            print(f"{row['name']:<48} builds {row['builds']:>3}  hits {row['hits']:>5}  {row['build_seconds']:.3f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from ann_index import MIN_PQ_TRAINING_POINTS, build_index, choose_index_type  # noqa: E402
+
+
+def random_vectors(count, dimension=64, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+
+@pytest.mark.parametrize("index_type", ["ivf_pq", "opq_ivf_pq"])
+def test_pq_types_fall_back_to_flat_below_training_minimum(index_type, caplog):
+    vectors = random_vectors(120)
+    with caplog.at_level("WARNING", logger="ann_index"):
+        index = build_index(vectors, index_type)
+    assert "flat index" in caplog.text
+    assert index.ntotal == 120
+    _, ids = index.search(vectors[:5], 1)
+    assert ids[:, 0].tolist() == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("index_type", ["ivf_pq", "opq_ivf_pq"])
+def test_pq_types_are_kept_once_trainable(index_type):
+    assert choose_index_type(MIN_PQ_TRAINING_POINTS - 1, index_type) == "flat"
+    assert choose_index_type(MIN_PQ_TRAINING_POINTS, index_type) == index_type
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "ivf_sq8"])
+def test_ivf_types_train_on_small_corpora(index_type):
+    index = build_index(random_vectors(20), index_type)
+    assert index.ntotal == 20
+
+
+def test_unknown_index_type_is_rejected():
+    with pytest.raises(ValueError):
+        build_index(random_vectors(10), "ivf_bogus")
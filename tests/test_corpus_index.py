@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from corpus_index import CorpusIndex  # noqa: E402
+
+
+class BagOfWords:
+    # Deterministic 16-dim embeddings, enough to exercise the index
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    @staticmethod
+    def _vector(text):
+        vector = np.zeros(16, dtype=np.float32)
+        for word in text.lower().split():
+            vector[sum(map(ord, word)) % 16] += 1
+        return vector.tolist()
+
+
+def chapter(n):
+    return f"Chapter {n}. Force equals mass times acceleration, example {n}."
+
+
+def test_expired_documents_are_dropped_on_open(tmp_path):
+    corpus = CorpusIndex(BagOfWords(), path=str(tmp_path))
+    corpus.add_document("old", text=chapter(1))
+    corpus.add_document("new", text=chapter(2))
+    corpus.documents["old"]["used"] = time.time() - 3600
+    corpus.save()
+
+    reopened = CorpusIndex(BagOfWords(), path=str(tmp_path), ttl=60)
+    assert reopened.document_ids() == ["new"]
+    assert reopened.index.ntotal == len(reopened.documents["new"]["chunks"])
+    assert [doc_id for doc_id, _, _ in reopened.search("force mass")] == ["new"]
+
+
+def test_least_recently_used_go_first_above_the_size_cap(tmp_path):
+    corpus = CorpusIndex(BagOfWords(), path=str(tmp_path))
+    for doc_id in ("a", "b", "c"):
+        corpus.add_document(doc_id, text=chapter(doc_id))
+    corpus.documents["a"]["used"] -= 10
+    corpus.document_vectors("a")
+    corpus.max_bytes = corpus.documents["a"]["bytes"] * 2
+    corpus.add_document("d", text=chapter("d"))
+    assert sorted(corpus.document_ids()) == ["a", "d"]
+
+
+def test_newest_document_is_kept_even_above_the_cap(tmp_path):
+    corpus = CorpusIndex(BagOfWords(), path=str(tmp_path), max_bytes=1)
+    corpus.add_document("a", text=chapter(1))
+    corpus.add_document("b", text=chapter(2))
+    assert corpus.document_ids() == ["b"]
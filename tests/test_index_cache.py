@@ -0,0 +1,82 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from index_cache import LoadedIndexCache  # noqa: E402
+
+
+class MemoryDisk:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def get_or_build(self, key, build_fn):
+        if key not in self.entries:
+            self.entries[key] = build_fn()
+        return self.entries[key]
+
+
+def test_concurrent_requests_build_once():
+    cache = LoadedIndexCache(MemoryDisk(), max_items=4)
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)
+        return "index", ["chunk"]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_build("doc", build)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert len(results) == 8 and all(result is results[0] for result in results)
+
+
+def test_different_keys_build_in_parallel():
+    cache = LoadedIndexCache(MemoryDisk(), max_items=4)
+    started = threading.Barrier(2, timeout=2)
+
+    def build():
+        # Both builds must be running at once to pass the barrier
+        started.wait()
+        return "index", []
+
+    threads = [threading.Thread(target=cache.get_or_build, args=(key, build)) for key in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not started.broken
+
+
+def test_failed_build_is_retried():
+    cache = LoadedIndexCache(MemoryDisk(), max_items=4)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    try:
+        cache.get_or_build("doc", fail)
+    except RuntimeError:
+        pass
+    assert cache.get_or_build("doc", lambda: ("index", [])) == ("index", [])
+    assert cache._building == {}
+
+
+def test_get_does_not_build():
+    cache = LoadedIndexCache(MemoryDisk(), max_items=4)
+    assert cache.get("doc") is None
+    cache.get_or_build("doc", lambda: ("index", []), load_fn=lambda index, chunks: index)
+    assert cache.get("doc", load_fn=lambda index, chunks: index) == "index"
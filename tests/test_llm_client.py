@@ -0,0 +1,57 @@
+import os
+import sys
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from llm_client import batch_with_retry  # noqa: E402
+
+
+def rate_limit():
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/completions"))
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+class FlakyLLM:
+    # Rate-limits the listed prompts the first `failures` times they are sent
+    model_name = "flaky"
+
+    def __init__(self, limited, failures=1):
+        self.limited = set(limited)
+        self.failures = failures
+        self.sent = []
+
+    def batch(self, prompts, return_exceptions=False):
+        self.sent.append(list(prompts))
+        results = []
+        for prompt in prompts:
+            if prompt in self.limited and sum(prompt in call for call in self.sent) <= self.failures:
+                results.append(rate_limit())
+            else:
+                results.append(f"answer to {prompt}")
+        return results
+
+
+def test_only_rate_limited_prompts_are_resent():
+    llm = FlakyLLM(limited={"b"})
+    assert batch_with_retry(llm, ["a", "b", "c"], backoff=0) == ["answer to a", "answer to b", "answer to c"]
+    assert llm.sent == [["a", "b", "c"], ["b"]]
+
+
+def test_gives_up_after_retries():
+    llm = FlakyLLM(limited={"a"}, failures=10)
+    with pytest.raises(RateLimitError):
+        batch_with_retry(llm, ["a", "b"], retries=2, backoff=0)
+    assert len(llm.sent) == 3
+
+
+def test_other_errors_are_raised():
+    class BrokenLLM(FlakyLLM):
+        def batch(self, prompts, return_exceptions=False):
+            return [ValueError("bad request") for _ in prompts]
+
+    with pytest.raises(ValueError):
+        batch_with_retry(BrokenLLM(limited=()), ["a"], backoff=0)
@@ -0,0 +1,111 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from mcq_records import (  # noqa: E402
+    MCQ_COMPLETION_MARGIN, MCQ_COMPLETION_TOKENS, MCQLineParser, mcq_max_tokens, parse_mcq_output
+)
+from token_utils import count_tokens  # noqa: E402
+
+
+def mcq_line(question="What is the SI unit of force?", answer="A", difficulty="Easy"):
+    return json.dumps({
+        "question": question, "options": ["newton", "joule", "watt", "pascal"],
+        "answer": answer, "difficulty": difficulty,
+    })
+
+
+class Model:
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+
+def test_parses_json_lines():
+    records, malformed = parse_mcq_output("\n".join([mcq_line(), mcq_line("What is the SI unit of power?", "C")]))
+    assert [record.answer for record in records] == ["A", "C"]
+    assert records[0].options == ("newton", "joule", "watt", "pascal")
+    assert malformed == []
+
+
+def test_fixes_common_drift():
+    line = json.dumps({
+        "question": "Q3. What is the SI unit of energy?",
+        "options": {"A": "A) newton", "B": "B) joule", "C": "C) watt", "D": "D) pascal"},
+        "answer": "joule", "difficulty": "hard",
+    })
+    (record,), _ = parse_mcq_output(f"```json\n{line}\n```")
+    assert record.question == "What is the SI unit of energy?"
+    assert record.options[1] == "joule"
+    assert (record.answer, record.difficulty) == ("B", "Hard")
+
+
+def test_trailing_comma_is_repaired():
+    line = mcq_line()[:-1] + ",}"
+    records, malformed = parse_mcq_output(line)
+    assert len(records) == 1 and malformed == []
+
+
+def test_malformed_line_is_kept_for_repair():
+    bad = '{"question": "What is the SI unit of force?", "options": ["newton", "joule"], "answer": "A"}'
+    records, malformed = parse_mcq_output("\n".join([mcq_line(), bad, mcq_line()]))
+    assert len(records) == 2
+    assert malformed == [bad]
+
+
+def test_short_stray_prose_is_dropped():
+    records, malformed = parse_mcq_output("Here you go:\n" + mcq_line())
+    assert len(records) == 1 and malformed == []
+
+
+def test_text_format_block():
+    block = "Q1. What is the SI unit of force?\nA. newton\nB. joule\nC. watt\nD. pascal\nAnswer: A\nDifficulty: Medium"
+    (record,), _ = parse_mcq_output(block)
+    assert (record.question, record.answer) == ("What is the SI unit of force?", "A")
+
+
+def test_streamed_pieces_split_mid_line():
+    text = mcq_line() + "\n" + mcq_line("What is the SI unit of power?", "C") + "\n"
+    parser = MCQLineParser()
+    emitted = []
+    for start in range(0, len(text), 7):
+        emitted.append(len(parser.feed(text[start:start + 7])))
+    emitted.append(len(parser.close()))
+    # Each question comes out once its line is complete, never twice
+    assert sum(emitted) == 2
+    assert emitted[-1] == 0
+
+
+def test_last_line_without_newline_is_parsed_on_close():
+    parser = MCQLineParser()
+    assert parser.feed(mcq_line()) == []
+    assert len(parser.close()) == 1
+
+
+def test_truncated_last_line_is_malformed_not_a_record():
+    truncated = mcq_line("What is the SI unit of power?")[:45]
+    parser = MCQLineParser()
+    records = parser.feed(mcq_line() + "\n" + truncated)
+    records += parser.close()
+    assert len(records) == 1
+    assert parser.malformed == [truncated]
+
+
+def test_max_tokens_grows_with_question_count():
+    chat = Model("gpt-3.5-turbo")
+    assert mcq_max_tokens(chat, "prompt", 1) == MCQ_COMPLETION_TOKENS + MCQ_COMPLETION_MARGIN
+    assert mcq_max_tokens(chat, "prompt", 25) == 25 * MCQ_COMPLETION_TOKENS + MCQ_COMPLETION_MARGIN
+
+
+def test_max_tokens_fits_the_context_window():
+    instruct = Model("gpt-3.5-turbo-instruct")
+    prompt = "word " * 2500
+    budget = mcq_max_tokens(instruct, prompt, 25)
+    assert budget == 4096 - count_tokens(prompt, "gpt-3.5-turbo-instruct")
+    assert budget < 25 * MCQ_COMPLETION_TOKENS
+
+
+def test_max_tokens_never_below_one_question():
+    instruct = Model("gpt-3.5-turbo-instruct")
+    assert mcq_max_tokens(instruct, "word " * 5000, 10) == MCQ_COMPLETION_TOKENS
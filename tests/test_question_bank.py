@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import question_bank  # noqa: E402
+from question_bank import QuestionBank  # noqa: E402
+
+PAPER = """1. A body of mass 2 kg moves with velocity 3 m/s. Its momentum is
+(1) 6 kg m/s (2) 5 kg m/s (3) 1 kg m/s (4) 3 kg m/s
+2. The unit of capacitance is
+(1) farad (2) henry (3) ohm (4) tesla
+3. The hybridisation of carbon in methane is
+(a) sp (b) sp2 (c) sp3 (d) dsp2
+"""
+REWORDED = PAPER.replace("Its momentum is", "Its momentum will be")
+
+
+def signature_rows(bank):
+    return bank._conn.execute("SELECT COUNT(*) FROM signature_questions").fetchone()[0]
+
+
+def test_reworded_questions_are_merged(tmp_path):
+    bank = QuestionBank(str(tmp_path))
+    bank.add_text(PAPER, "NEET 2022", paper_id="a")
+    bank.add_text(REWORDED, "NEET 2023", paper_id="b")
+    assert bank.stats()["questions"] == 3
+    assert signature_rows(bank) == 3
+
+
+def test_failed_ingest_leaves_no_signatures(tmp_path, monkeypatch):
+    bank = QuestionBank(str(tmp_path))
+    calls = []
+
+    def failing_count(text, *args):
+        calls.append(text)
+        if len(calls) == 2:
+            raise RuntimeError("boom")
+        return len(text.split())
+
+    monkeypatch.setattr(question_bank, "count_tokens", failing_count)
+    with pytest.raises(RuntimeError):
+        bank.add_text(PAPER, paper_id="a")
+    assert "a" not in bank
+    assert signature_rows(bank) == 0
+
+    monkeypatch.undo()
+    bank.add_text(PAPER, paper_id="a")
+    assert bank.stats()["questions"] == 3
+    assert signature_rows(bank) == 3
+
+
+def test_signatures_are_rebuilt_when_missing(tmp_path):
+    bank = QuestionBank(str(tmp_path))
+    bank.add_text(PAPER, paper_id="a")
+    with bank._conn:
+        bank._conn.execute("DELETE FROM signature_questions")
+
+    reopened = QuestionBank(str(tmp_path))
+    assert signature_rows(reopened) == 3
+    reopened.add_text(REWORDED, paper_id="b")
+    assert reopened.stats()["questions"] == 3
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from quota_scheduler import allocate_quotas, context_budget, plan_calls, shortfall  # noqa: E402
+
+
+@pytest.mark.parametrize("weights, total", [
+    ([1, 1, 1], 10),
+    ([5, 3, 2], 7),
+    ([1200, 300, 45, 9000], 25),
+    ([1] * 30, 10),
+    ([0, 0, 0], 4),
+])
+def test_allocate_quotas_sums_to_total(weights, total):
+    quotas = allocate_quotas(weights, total)
+    assert len(quotas) == len(weights)
+    assert sum(quotas) == total
+    assert all(quota >= 0 for quota in quotas)
+
+
+def test_allocate_quotas_is_proportional():
+    assert allocate_quotas([2, 1, 1], 8) == [4, 2, 2]
+
+
+def test_allocate_quotas_gives_remainders_to_largest_fraction():
+    # Shares 3.5, 2.1, 1.4: one seat left, the 0.5 remainder wins it
+    assert allocate_quotas([5, 3, 2], 7) == [4, 2, 1]
+
+
+def test_allocate_quotas_breaks_ties_by_weight_then_order():
+    # Equal remainders: the heavier chapter first, then the earlier one
+    assert allocate_quotas([1, 3], 2) == [0, 2]
+    assert allocate_quotas([1, 1, 1], 2) == [1, 1, 0]
+    assert allocate_quotas([1, 2, 2], 1) == [0, 1, 0]
+
+
+def test_allocate_quotas_empty_or_nothing_to_share():
+    assert allocate_quotas([], 5) == []
+    assert allocate_quotas([3, 4], 0) == [0, 0]
+
+
+def test_context_budget_follows_quota_within_limits():
+    assert context_budget(10_000, 1, 2500, per_question=300) == 300
+    assert context_budget(10_000, 20, 2500, per_question=300) == 2500
+    assert context_budget(120, 5, 2500, per_question=300) == 120
+
+
+def test_plan_calls_packs_small_chapters_together():
+    names = [f"ch{i}" for i in range(30)]
+    quotas = allocate_quotas([1] * 30, 10)
+    tokens = [context_budget(10_000, quota, 2500, per_question=300) for quota in quotas]
+    calls = plan_calls(names, quotas, tokens, 2500)
+    assert len(calls) == 2
+    assert sum(call["questions"] for call in calls) == 10
+    assert all(call["context_tokens"] <= 2500 for call in calls)
+
+
+def test_plan_calls_splits_large_quotas_and_respects_limits():
+    calls = plan_calls(["big", "small"], [32, 2], [2500, 200], 2500, max_questions=15)
+    big = [quota for call in calls for name, quota in call["chapters"] if name == "big"]
+    assert sorted(big) == [2, 15, 15]
+    for call in calls:
+        chapters = [name for name, _ in call["chapters"]]
+        assert len(chapters) == len(set(chapters))
+        assert call["questions"] <= 15
+        assert call["context_tokens"] <= 2500
+    assert sum(call["questions"] for call in calls) == 34
+
+
+def test_plan_calls_skips_zero_quotas():
+    assert plan_calls(["a", "b"], [0, 3], [300, 900], 2500) == [
+        {"chapters": [("b", 3)], "context_tokens": 900, "questions": 3}
+    ]
+
+
+def test_shortfall_lists_only_chapters_still_short():
+    assert shortfall({"a": 3, "b": 2, "c": 1}, {"a": 3, "b": 1}) == {"b": 1, "c": 1}
+    assert shortfall({"a": 2}, {"a": 5}) == {}
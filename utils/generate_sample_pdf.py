@@ -1,6 +1,9 @@
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import simpleSplit
 from reportlab.pdfgen import canvas
 import os
+import random
+import sys
 
 # Create a sample PDF file
 def create_sample_pdf():
@@ -18,6 +21,72 @@ def create_sample_pdf():
     c.save()
     print(f"Sample PDF created successfully at {pdf_path}")
 
+TOPICS = [
+    "Laws of Motion", "Work, Energy and Power", "Gravitation", "Oscillations", "Waves",
+    "Electrostatics", "Current Electricity", "Capacitance", "Magnetism", "Ray Optics",
+]
+TERMS = [
+    "force", "mass", "acceleration", "momentum", "impulse", "friction", "velocity", "energy",
+    "potential", "charge", "field", "capacitor", "resistance", "current", "frequency",
+    "amplitude", "wavelength", "inertia", "torque", "pressure", "lens", "mirror", "flux",
+]
+UNITS = ["N", "kg", "m/s", "J", "W", "C", "V", "F", "Ohm", "A", "Hz", "T"]
+
+def _sentence(rng):
+    words = rng.sample(TERMS, 6)
+    return (
+        f"The {words[0]} of a body depends on its {words[1]} and {words[2]}, "
+        f"while {words[3]} is measured in {rng.choice(UNITS)} when {words[4]} changes {words[5]}."
+    )
+
+def _mcq_lines(rng, number):
+    term, other = rng.sample(TERMS, 2)
+    value = rng.randint(2, 50)
+    lines = [f"Q{number}. A body has {term} {value} {rng.choice(UNITS)}. What is its {other}?"]
+    lines += [f"{option}. {value * rng.randint(1, 9)} {rng.choice(UNITS)}" for option in "ABCD"]
+    lines.append(f"Answer: {rng.choice('ABCD')}")
+    lines.append(f"Difficulty: {rng.choice(['Easy', 'Medium', 'Hard'])}")
+    return lines
+
+# Create a large, deterministic NEET-style PDF (chapters, prose and MCQ blocks) for benchmarks
+def create_synthetic_pdf(pdf_path, num_pages=300, seed=0):
+    os.makedirs(os.path.dirname(pdf_path) or ".", exist_ok=True)
+    rng = random.Random(seed)
+    c = canvas.Canvas(pdf_path, pagesize=letter)
+    question_number = 1
+
+    for page in range(num_pages):
+        y = 750
+        if page % 10 == 0:
+            c.setFont("Helvetica-Bold", 16)
+            c.drawString(72, y, f"Chapter {page // 10 + 1}: {TOPICS[(page // 10) % len(TOPICS)]}")
+            y -= 30
+        c.setFont("Helvetica", 10)
+
+        while y > 72:
+            if rng.random() < 0.3:
+                lines = _mcq_lines(rng, question_number)
+                question_number += 1
+            else:
+                lines = [_sentence(rng) for _ in range(rng.randint(2, 5))]
+            wrapped = [part for line in lines for part in simpleSplit(line, "Helvetica", 10, 468)]
+            for line in wrapped:
+                if y <= 72:
+                    break
+                c.drawString(72, y, line)
+                y -= 14
+            y -= 8
+        c.showPage()
+
+    c.save()
+    return pdf_path
+
 # Run the function
 if __name__ == "__main__":
-    create_sample_pdf()
+    if len(sys.argv) > 1:
+        # python utils/generate_sample_pdf.py <pages> [path]
+        pages = int(sys.argv[1])
+        path = sys.argv[2] if len(sys.argv) > 2 else f"data/synthetic_{pages}p.pdf"
+        print(f"Synthetic PDF created at {create_synthetic_pdf(path, pages)}")
+    else:
+        create_sample_pdf()